@@ -0,0 +1,138 @@
+"""
+Multi-process SQLite contention benchmark for RememBot.
+
+Runs writer processes (like the bot and background parser) and reader
+processes (like the web app) against one database file, once with the
+legacy rollback journal and once with the WAL storage profile, and reports
+throughput, reader latency and 'database is locked' errors for each.
+
+Usage: uv run scripts/benchmark_db_contention.py [--writers 2] [--readers 4] [--seconds 5]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from remembot.database import DatabaseManager
+from remembot.db_pool import StorageProfile
+
+USER_ID = 4242
+
+PROFILES = {
+    # Matches the pre-WAL behaviour: rollback journal, full fsync, short busy wait
+    'rollback': dict(journal_mode='delete', synchronous='full', busy_timeout_ms=100,
+                     mmap_size=0, cache_size_kb=2000, temp_store='default'),
+    'wal': dict(journal_mode='wal', synchronous='normal', busy_timeout_ms=100),
+}
+
+
+def _open(db_path, profile_kwargs, deadline):
+    """Open a manager, retrying while other processes hold the schema lock."""
+    while time.time() < deadline:
+        try:
+            return DatabaseManager(db_path, pool_size=1, storage_profile=StorageProfile(**profile_kwargs))
+        except sqlite3.OperationalError:
+            time.sleep(0.01)
+    return None
+
+
+async def _writer(db, deadline):
+    ops = errors = 0
+    while time.time() < deadline:
+        try:
+            await db.store_content(USER_ID, f"note {ops}", 'text', extracted_info=f"benchmark note {ops}")
+            ops += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    return ops, errors, []
+
+
+async def _reader(db, deadline):
+    ops = errors = 0
+    latencies = []
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            await db.get_user_content(USER_ID, limit=20)
+            latencies.append((time.perf_counter() - start) * 1000)
+            ops += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    return ops, errors, latencies
+
+
+async def _work(role, db_path, profile_kwargs, deadline):
+    db = _open(db_path, profile_kwargs, deadline)
+    if db is None:
+        return 0, 1, []
+    try:
+        target = _writer if role == 'writer' else _reader
+        return await target(db, deadline)
+    finally:
+        await db.close()
+
+
+def _run(role, db_path, profile_kwargs, deadline, results):
+    try:
+        ops, errors, latencies = asyncio.run(_work(role, db_path, profile_kwargs, deadline))
+    except Exception:
+        ops, errors, latencies = 0, 1, []
+    results.put((role, ops, errors, latencies))
+
+
+def run_profile(name, writers, readers, seconds):
+    """Run one contention round and return aggregated results."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = str(Path(tmp_dir) / f'{name}.db')
+        profile_kwargs = PROFILES[name]
+        # Create the schema (and persistent journal mode) before forking workers
+        DatabaseManager(db_path, storage_profile=StorageProfile(**profile_kwargs))
+
+        results = multiprocessing.Queue()
+        deadline = time.time() + seconds + 1
+        procs = [
+            multiprocessing.Process(target=_run, args=(role, db_path, profile_kwargs, deadline, results))
+            for role in ['writer'] * writers + ['reader'] * readers
+        ]
+        for proc in procs:
+            proc.start()
+        rows = [results.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+
+    summary = {'profile': name}
+    for role in ('writer', 'reader'):
+        role_rows = [row for row in rows if row[0] == role]
+        summary[f'{role}_ops'] = sum(row[1] for row in role_rows)
+        summary[f'{role}_errors'] = sum(row[2] for row in role_rows)
+    latencies = sorted(lat for row in rows for lat in row[3])
+    summary['read_p50_ms'] = round(statistics.median(latencies), 2) if latencies else None
+    summary['read_p99_ms'] = round(latencies[int(len(latencies) * 0.99) - 1], 2) if latencies else None
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{args.writers} writer / {args.readers} reader processes, {args.seconds}s per profile\n")
+    header = f"{'profile':<10}{'writes/s':>10}{'w.locked':>10}{'reads/s':>10}{'r.locked':>10}{'p50 ms':>9}{'p99 ms':>9}"
+    print(header)
+    print('-' * len(header))
+    for name in PROFILES:
+        s = run_profile(name, args.writers, args.readers, args.seconds)
+        print(f"{name:<10}{s['writer_ops'] / args.seconds:>10.0f}{s['writer_errors']:>10}"
+              f"{s['reader_ops'] / args.seconds:>10.0f}{s['reader_errors']:>10}"
+              f"{s['read_p50_ms'] or 0:>9}{s['read_p99_ms'] or 0:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+HTML extraction benchmark for RememBot.
+
+Runs every page text extractor (streaming, basic and readability, the last
+two with each installed parser backend) over a corpus of saved pages and
+reports throughput and extraction quality. Each page.html in the corpus has
+a page.txt holding the text a reader would call the content; quality is
+word-level precision/recall/F1 against it. The streaming extractor is fed
+the page in network-sized chunks, as it is while downloading.
+
+The bundled tests/fixtures/html pages were labelled alongside the
+extractors, so their quality numbers are only a smoke check (catching
+regressions and gross failures), not a measure of accuracy. For that,
+pass --corpus a directory of independently labelled pages, e.g. a public
+main-content extraction benchmark converted to page.html/page.txt pairs.
+
+Usage: uv run scripts/benchmark_html_extraction.py [--corpus DIR] [--seconds 2] [--chunk-bytes 16384]
+"""
+
+import argparse
+import re
+import time
+from collections import Counter
+from pathlib import Path
+
+from bs4.builder import builder_registry
+
+from remembot.page_text import HTML_PARSERS, DOCUMENT_EXTRACTORS, StreamingTextExtractor
+
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def stream_extract(html, chunk_bytes):
+    """Feed the page to the streaming extractor chunk by chunk, as a download would."""
+    body = html.encode('utf-8')
+    extractor = StreamingTextExtractor(max_chars=10 ** 9)
+    for start in range(0, len(body), chunk_bytes):
+        extractor.feed(body[start:start + chunk_bytes])
+    return extractor.close()
+
+
+def candidates(chunk_bytes):
+    yield 'stream', 'lxml', lambda html: stream_extract(html, chunk_bytes)
+    for name, extractor in DOCUMENT_EXTRACTORS.items():
+        for parser in HTML_PARSERS:
+            if builder_registry.lookup(parser) is not None:
+                yield name, parser, lambda html, extractor=extractor, parser=parser: extractor(html, parser)
+
+
+def overlap(extracted, expected):
+    """Word-level (precision, recall, F1) of extracted text against the expected text."""
+    got = Counter(WORD_PATTERN.findall(extracted.lower()))
+    want = Counter(WORD_PATTERN.findall(expected.lower()))
+    common = sum((got & want).values())
+    precision = common / max(sum(got.values()), 1)
+    recall = common / max(sum(want.values()), 1)
+    f1 = 2 * precision * recall / (precision + recall) if common else 0.0
+    return precision, recall, f1
+
+
+def load_corpus(directory):
+    pages = []
+    for html_path in sorted(Path(directory).glob('*.html')):
+        expected_path = html_path.with_suffix('.txt')
+        if expected_path.exists():
+            pages.append((html_path.stem, html_path.read_text(encoding='utf-8'), expected_path.read_text(encoding='utf-8')))
+    return pages
+
+
+def run(extract, pages, seconds):
+    scores = [overlap(extract(html)[1], expected) for _, html, expected in pages]
+    corpus_bytes = sum(len(html.encode('utf-8')) for _, html, _ in pages)
+    rounds = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        for _, html, _ in pages:
+            extract(html)
+        rounds += 1
+    elapsed = time.perf_counter() - started
+    return {
+        'pages_per_s': rounds * len(pages) / elapsed,
+        'mb_per_s': rounds * corpus_bytes / elapsed / 1024 / 1024,
+        'precision': sum(s[0] for s in scores) / len(scores),
+        'recall': sum(s[1] for s in scores) / len(scores),
+        'f1': sum(s[2] for s in scores) / len(scores),
+        'worst': min(zip((s[2] for s in scores), (name for name, _, _ in pages))),
+    }
+
+
+def main():
+    default_corpus = Path(__file__).resolve().parent.parent / 'tests' / 'fixtures' / 'html'
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--corpus', default=str(default_corpus), help="Directory of page.html/page.txt pairs")
+    parser.add_argument('--seconds', type=float, default=2.0, help="Timing budget per extractor")
+    # TLS records carry at most 16 KiB, so reads off the socket rarely arrive larger
+    parser.add_argument('--chunk-bytes', type=int, default=16 * 1024, help="Chunk size fed to the streaming extractor")
+    args = parser.parse_args()
+    
+    pages = load_corpus(args.corpus)
+    if not pages:
+        raise SystemExit(f"No page.html/page.txt pairs in {args.corpus}")
+    
+    print(f"{len(pages)} pages from {args.corpus}, {args.seconds}s per extractor, "
+          f"streamed in {args.chunk_bytes}-byte chunks")
+    if Path(args.corpus).resolve() == default_corpus:
+        print("Bundled fixtures: quality columns are a smoke check, not an accuracy measurement")
+    print()
+    header = f"{'extractor':<13}{'parser':<13}{'pages/s':>9}{'MB/s':>8}{'prec':>7}{'recall':>8}{'F1':>7}  worst page"
+    print(header)
+    print('-' * len(header))
+    for name, backend, extract in candidates(args.chunk_bytes):
+        s = run(extract, pages, args.seconds)
+        print(f"{name:<13}{backend:<13}{s['pages_per_s']:>9.0f}{s['mb_per_s']:>8.1f}"
+              f"{s['precision']:>7.2f}{s['recall']:>8.2f}{s['f1']:>7.2f}  {s['worst'][1]} ({s['worst'][0]:.2f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Vector search benchmark for RememBot.
+
+Builds a VectorIndex over synthetic clustered embeddings (topics with
+noise, like a real library) and compares IVF approximate search at several
+nprobe values against exact search: query latency, recall@k against the
+exact top-k, and index build time.
+
+Usage: uv run scripts/benchmark_vector_search.py [--rows 200000] [--dim 384] [--noise 1.2] [--queries 200] [--k 10]
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from remembot.vector_index import VectorIndex, normalize_rows
+
+
+def clustered_vectors(rows, centers, noise, rng):
+    """Unit vectors scattered around topic directions (noise is relative to the topic vector)."""
+    labels = rng.integers(0, len(centers), rows)
+    dim = centers.shape[1]
+    return normalize_rows(centers[labels] + rng.normal(scale=noise / np.sqrt(dim), size=(rows, dim)))
+
+
+def timed_search(index, queries, k, nprobe):
+    """Run each query; returns result ids and per-query latencies in ms."""
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append([item_id for item_id, _ in index.search(query, k, nprobe=nprobe)])
+        latencies.append((time.perf_counter() - started) * 1000)
+    return results, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000, help="Indexed vectors")
+    parser.add_argument('--dim', type=int, default=384, help="Vector dimensions")
+    parser.add_argument('--topics', type=int, default=2000, help="Clusters in the synthetic data")
+    parser.add_argument('--noise', type=float, default=1.2, help="Spread around each topic (1.0 = as long as the topic vector)")
+    parser.add_argument('--queries', type=int, default=200, help="Queries per configuration")
+    parser.add_argument('--k', type=int, default=10, help="Results per query")
+    args = parser.parse_args()
+    
+    rng = np.random.default_rng(0)
+    centers = normalize_rows(rng.normal(size=(args.topics, args.dim)))
+    vectors = clustered_vectors(args.rows, centers, args.noise, rng)
+    queries = clustered_vectors(args.queries, centers, args.noise, rng)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        index = VectorIndex(directory, 'benchmark', args.dim)
+        index.upsert(range(args.rows), vectors)
+        started = time.perf_counter()
+        index.save(ann=True)
+        build = time.perf_counter() - started
+        print(f"{args.rows} x {args.dim} vectors, {index.list_count} IVF lists, built in {build:.1f}s\n")
+        
+        exact, latencies = timed_search(index, queries, args.k, None)
+        header = f"{'search':<14}{'p50 ms':>9}{'p95 ms':>9}{f'recall@{args.k}':>12}"
+        print(header)
+        print('-' * len(header))
+        print(f"{'exact':<14}{np.percentile(latencies, 50):>9.2f}{np.percentile(latencies, 95):>9.2f}{1.0:>12.3f}")
+        for nprobe in (1, 4, 8, 16, 32, 64):
+            if nprobe >= index.list_count:
+                break
+            approximate, latencies = timed_search(index, queries, args.k, nprobe)
+            recall = np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(approximate, exact)])
+            print(f"{f'ivf nprobe={nprobe}':<14}{np.percentile(latencies, 50):>9.2f}"
+                  f"{np.percentile(latencies, 95):>9.2f}{recall:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Blob store maintenance for RememBot.
+
+Commands (safe to run while the bot, parser and web app are up):
+  status   show blob store usage and cached extraction counts
+  gc       remove blobs no content item has referenced for --grace seconds
+  repair   recompute blob reference counts from content_items, then show status
+
+Usage: uv run scripts/blob_maintenance.py [--db PATH] {status,gc,repair} [--grace SECONDS]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from pathlib import Path
+
+from remembot.blob_store import BlobStore
+from remembot.config import get_config
+from remembot.database import DatabaseManager
+
+
+async def run(args):
+    db_manager = DatabaseManager(args.db)
+    try:
+        config = get_config()
+    except Exception:
+        config = None
+    blob_store = BlobStore(args.blobs) if args.blobs else BlobStore.from_config(config, args.db)
+    try:
+        if args.command == 'repair':
+            blobs = await db_manager.rebuild_blob_refs()
+            print(f"Recounted references for {blobs} blobs")
+        elif args.command == 'gc':
+            removed = await blob_store.collect_garbage(db_manager, grace_seconds=args.grace)
+            print(f"Removed {removed['blobs']} blobs, {removed['orphans']} orphaned files, "
+                  f"{removed['temp_files']} temp files ({removed['bytes'] / 1024 / 1024:.1f}MB)")
+        print(json.dumps(dict(await db_manager.get_blob_usage(), root=str(blob_store.root)), indent=2))
+    finally:
+        await db_manager.close()
+
+
+def main():
+    default_db = os.environ.get('REMEMBOT_DATABASE_PATH', str(Path.home() / '.remembot' / 'remembot.db'))
+    parser = argparse.ArgumentParser(description="RememBot blob store maintenance")
+    parser.add_argument('--db', default=default_db, help="Path to the SQLite database")
+    parser.add_argument('--blobs', default=None, help="Blob store directory (default: from config)")
+    parser.add_argument('command', choices=['status', 'gc', 'repair'])
+    parser.add_argument('--grace', type=float, default=None, help="Override the garbage collection grace period")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+FTS5 search index maintenance for RememBot.
+
+Commands (safe to run while the bot, parser and web app are up):
+  status    show index schema version and backfill progress
+  rebuild   clear and re-index every item in committed batches
+  optimize  merge index segments (use --merge N for an incremental merge)
+
+Usage: uv run scripts/fts_maintenance.py [--db PATH] {status,rebuild,optimize}
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from pathlib import Path
+
+from remembot.database import DatabaseManager
+
+
+async def run(args):
+    db_manager = DatabaseManager(args.db)
+    try:
+        if args.command == 'rebuild':
+            indexed = await db_manager.rebuild_fts_index(batch_size=args.batch_size)
+            print(f"Rebuilt FTS5 index: {indexed} items")
+        elif args.command == 'optimize':
+            await db_manager.optimize_fts_index(merge_pages=args.merge)
+            print("FTS5 index optimized")
+        print(json.dumps(await db_manager.get_fts_status(), indent=2))
+    finally:
+        await db_manager.close()
+
+
+def main():
+    default_db = os.environ.get('REMEMBOT_DATABASE_PATH', str(Path.home() / '.remembot' / 'remembot.db'))
+    parser = argparse.ArgumentParser(description="RememBot FTS5 index maintenance")
+    parser.add_argument('--db', default=default_db, help="Path to the SQLite database")
+    parser.add_argument('command', choices=['status', 'rebuild', 'optimize'])
+    parser.add_argument('--batch-size', type=int, default=500, help="Rows per rebuild transaction")
+    parser.add_argument('--merge', type=int, default=None, help="Pages to merge incrementally instead of a full optimize")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
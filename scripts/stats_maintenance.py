@@ -0,0 +1,45 @@
+"""
+Per-user statistics maintenance for RememBot.
+
+Commands (safe to run while the bot, parser and web app are up):
+  show     print the statistics for one user (--user)
+  repair   recompute the counters, user_stats and daily histogram from scratch
+
+Usage: uv run scripts/stats_maintenance.py [--db PATH] {show,repair} [--user ID]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from pathlib import Path
+
+from remembot.database import DatabaseManager
+
+
+async def run(args):
+    db_manager = DatabaseManager(args.db)
+    try:
+        if args.command == 'repair':
+            rebuilt = await db_manager.rebuild_user_stats()
+            print(f"Rebuilt statistics: {rebuilt['users']} users, {rebuilt['daily_rows']} daily rows")
+        if args.user is not None:
+            print(json.dumps(await db_manager.get_user_stats(args.user), indent=2))
+    finally:
+        await db_manager.close()
+
+
+def main():
+    default_db = os.environ.get('REMEMBOT_DATABASE_PATH', str(Path.home() / '.remembot' / 'remembot.db'))
+    parser = argparse.ArgumentParser(description="RememBot statistics maintenance")
+    parser.add_argument('--db', default=default_db, help="Path to the SQLite database")
+    parser.add_argument('command', choices=['show', 'repair'])
+    parser.add_argument('--user', type=int, default=None, help="Telegram user id to print statistics for")
+    args = parser.parse_args()
+    if args.command == 'show' and args.user is None:
+        parser.error("show requires --user")
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+"""
+Shared AI provider client for RememBot.
+One pooled, keep-alive HTTP client per process (HTTP/2 when the h2 package
+is installed) carries every OpenRouter and OpenAI call made by the
+classifier, query handler and health checks, with a concurrency limit per
+provider. Replies to versioned prompt templates are served from the
+LLM response cache when one is configured.
+"""
+
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+from .llm_cache import LLMCache, response_key
+
+# Optional integrations
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    HAS_HTTPX = False
+
+try:
+    import openai
+    HAS_OPENAI = True
+except ImportError:
+    HAS_OPENAI = False
+
+HAS_HTTP2 = HAS_HTTPX and importlib.util.find_spec('h2') is not None
+
+logger = logging.getLogger(__name__)
+
+OPENROUTER_URL = 'https://openrouter.ai/api/v1'
+OPENAI_URL = 'https://api.openai.com/v1'
+REFERER = 'https://github.com/raymondclowe/RememBot'
+
+
+def parse_json_reply(text: str) -> Any:
+    """JSON value in a model reply, ignoring markdown code fences (raises ValueError)."""
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0]
+    elif "```" in text:
+        text = text.split("```")[1].split("```")[0]
+    return json.loads(text)
+
+
+def is_json_reply(text: str) -> bool:
+    """True when parse_json_reply() can read the reply."""
+    try:
+        parse_json_reply(text)
+        return True
+    except ValueError:
+        return False
+
+
+class AIProviderError(Exception):
+    """Raised when an AI provider call fails or returns an error status."""
+    
+    def __init__(self, provider: str, message: str, status: Optional[int] = None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status = status
+
+
+class AIClient:
+    """Pooled client for AI provider APIs, shared by all components of a process.
+    
+    The HTTP client is created on first use and must be closed with
+    close(). OpenAI calls go through the openai SDK on the same connection
+    pool; OpenRouter calls are plain chat completion requests. Calls that
+    name a prompt template are cached in the LLMCache, if any.
+    """
+    
+    def __init__(
+        self,
+        openrouter_api_key: Optional[str] = None,
+        openai_api_key: Optional[str] = None,
+        timeout: float = 30.0,
+        connect_timeout: float = 10.0,
+        max_connections: int = 20,
+        keepalive_seconds: float = 60.0,
+        concurrency: Optional[Dict[str, int]] = None,
+        openrouter_url: str = OPENROUTER_URL,
+        cache: Optional[LLMCache] = None
+    ):
+        """Initialize client (no connections are opened until the first call)."""
+        self.openrouter_api_key = openrouter_api_key if HAS_HTTPX else None
+        self.openai_api_key = openai_api_key if HAS_OPENAI and HAS_HTTPX else None
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.keepalive_seconds = keepalive_seconds
+        self.openrouter_url = openrouter_url
+        self.cache = cache
+        limits = {'openrouter': 4, 'openai': 4}
+        limits.update(concurrency or {})
+        self._limits = {provider: asyncio.Semaphore(limit) for provider, limit in limits.items()}
+        self._http: Optional['httpx.AsyncClient'] = None
+        self._openai = None
+        self.stats = {provider: {'requests': 0, 'errors': 0} for provider in limits}
+    
+    @classmethod
+    def from_config(cls, config=None, db_path: Optional[str] = None) -> 'AIClient':
+        """Build a client from RememBotConfig; API keys come from the environment
+        when config is unavailable (None or a defaults namespace). Replies are
+        cached next to db_path when it's given."""
+        def api_key(name):
+            if hasattr(config, name):
+                return getattr(config, name)
+            return os.getenv(name.upper())
+        
+        return cls(
+            openrouter_api_key=api_key('openrouter_api_key'),
+            openai_api_key=api_key('openai_api_key'),
+            timeout=getattr(config, 'ai_request_timeout', 30.0),
+            connect_timeout=getattr(config, 'ai_connect_timeout', 10.0),
+            max_connections=getattr(config, 'ai_max_connections', 20),
+            keepalive_seconds=getattr(config, 'ai_keepalive_seconds', 60.0),
+            concurrency={
+                'openrouter': getattr(config, 'ai_openrouter_concurrency', 4),
+                'openai': getattr(config, 'ai_openai_concurrency', 4)
+            },
+            cache=LLMCache.from_config(config, db_path) if db_path else None
+        )
+    
+    def has(self, provider: str) -> bool:
+        """True when provider is configured and its client libraries are installed."""
+        if provider == 'openrouter':
+            return bool(self.openrouter_api_key)
+        if provider == 'openai':
+            return bool(self.openai_api_key)
+        return False
+    
+    @property
+    def available(self) -> bool:
+        """True when any AI provider can be used."""
+        return self.has('openrouter') or self.has('openai')
+    
+    def _client(self) -> 'httpx.AsyncClient':
+        """The shared HTTP client, created on first use."""
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                http2=HAS_HTTP2,
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=self.keepalive_seconds
+                )
+            )
+            logger.debug(f"Created AI HTTP client (http2={HAS_HTTP2})")
+        return self._http
+    
+    @property
+    def openai(self):
+        """openai.AsyncOpenAI using the shared connection pool."""
+        if self._openai is None:
+            self._openai = openai.AsyncOpenAI(api_key=self.openai_api_key, http_client=self._client())
+        return self._openai
+    
+    async def chat(
+        self,
+        provider: str,
+        messages: List[Dict[str, str]],
+        model: str,
+        max_tokens: int,
+        temperature: float,
+        title: str = 'RememBot',
+        template: Optional[str] = None,
+        bypass_cache: bool = False,
+        validate: Optional[Callable[[str], bool]] = None
+    ) -> str:
+        """Run a chat completion and return the reply text.
+        
+        template names the prompt and its version (e.g. 'classify:v1'); with
+        a cache configured, replies are looked up and stored under it.
+        bypass_cache forces a fresh call (whose reply still refreshes the
+        cache), and replies failing validate are not stored.
+        """
+        if not self.has(provider):
+            raise AIProviderError(provider, "not configured")
+        if self.cache is None or template is None:
+            return await self._complete(provider, messages, model, max_tokens, temperature, title)
+        
+        key = response_key(provider, model, template, messages, max_tokens, temperature)
+        async with self.cache.lock(key):
+            if bypass_cache:
+                self.cache.stats['bypassed'] += 1
+            else:
+                cached = await self.cache.get(key)
+                if cached is not None:
+                    return cached
+            reply = await self._complete(provider, messages, model, max_tokens, temperature, title)
+            if validate is None or validate(reply):
+                await self.cache.put(key, template, model, reply)
+            return reply
+    
+    async def cached_reply(
+        self,
+        provider: str,
+        messages: List[Dict[str, str]],
+        model: str,
+        max_tokens: int,
+        temperature: float,
+        template: str
+    ) -> Optional[str]:
+        """Cached reply chat() would return for this request, or None (no call is made)."""
+        if self.cache is None:
+            return None
+        return await self.cache.get(response_key(provider, model, template, messages, max_tokens, temperature))
+    
+    async def store_reply(
+        self,
+        provider: str,
+        messages: List[Dict[str, str]],
+        model: str,
+        max_tokens: int,
+        temperature: float,
+        template: str,
+        reply: str
+    ):
+        """Cache a reply for a request answered some other way (e.g. as part of a batch)."""
+        if self.cache is not None:
+            key = response_key(provider, model, template, messages, max_tokens, temperature)
+            await self.cache.put(key, template, model, reply)
+    
+    async def _complete(
+        self,
+        provider: str,
+        messages: List[Dict[str, str]],
+        model: str,
+        max_tokens: int,
+        temperature: float,
+        title: str
+    ) -> str:
+        """Send one chat completion request to the provider."""
+        async with self._limits[provider]:
+            self.stats[provider]['requests'] += 1
+            try:
+                if provider == 'openai':
+                    response = await self.openai.chat.completions.create(
+                        model=model, messages=messages, max_tokens=max_tokens, temperature=temperature
+                    )
+                    return response.choices[0].message.content.strip()
+                
+                response = await self._client().post(
+                    f'{self.openrouter_url}/chat/completions',
+                    headers={
+                        'Authorization': f'Bearer {self.openrouter_api_key}',
+                        'HTTP-Referer': REFERER,
+                        'X-Title': title
+                    },
+                    json={'model': model, 'messages': messages, 'max_tokens': max_tokens, 'temperature': temperature}
+                )
+                if response.status_code != 200:
+                    raise AIProviderError(provider, f"API error: {response.status_code}", response.status_code)
+                return response.json()['choices'][0]['message']['content'].strip()
+            except Exception:
+                self.stats[provider]['errors'] += 1
+                raise
+    
+    async def embed(self, texts: List[str], model: str, dimensions: Optional[int] = None) -> List[List[float]]:
+        """Embedding vectors of texts from the OpenAI embeddings API, in order."""
+        if not self.has('openai'):
+            raise AIProviderError('openai', "not configured")
+        
+        options = {'dimensions': dimensions} if dimensions else {}
+        async with self._limits['openai']:
+            self.stats['openai']['requests'] += 1
+            try:
+                response = await self.openai.embeddings.create(model=model, input=texts, **options)
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            except Exception:
+                self.stats['openai']['errors'] += 1
+                raise
+    
+    async def probe(self, provider: str, timeout: float = 10.0) -> int:
+        """HTTP status of the provider's model list endpoint (a cheap authenticated request)."""
+        if not self.has(provider):
+            raise AIProviderError(provider, "not configured")
+        if provider == 'openrouter':
+            url, api_key = f'{self.openrouter_url}/models', self.openrouter_api_key
+        else:
+            url, api_key = f'{OPENAI_URL}/models', self.openai_api_key
+        async with self._limits[provider]:
+            response = await self._client().get(url, headers={'Authorization': f'Bearer {api_key}'}, timeout=timeout)
+            return response.status_code
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get per-provider request counters (and response cache counters)."""
+        stats = dict(self.stats, http2=HAS_HTTP2, connected=self._http is not None and not self._http.is_closed)
+        if self.cache is not None:
+            stats['llm_cache'] = dict(self.cache.stats)
+        return stats
+    
+    async def close(self):
+        """Close the connection pool and response cache."""
+        if self._http is not None and not self._http.is_closed:
+            await self._http.aclose()
+        self._http = None
+        self._openai = None
+        if self.cache is not None:
+            self.cache.close()
@@ -5,18 +5,30 @@ Continuously processes pending content items with AI enhancement.
 
 import asyncio
 import logging
+import os
+import socket
 import time
 import signal
 import sys
 import json
-from typing import Dict, Any, Optional
+import uuid
+from typing import Dict, Any, List, Optional, Set
 from pathlib import Path
 
+from telegram import Bot
+
 # Use proper relative imports instead of sys.path.append
 from .database import DatabaseManager
-from .content_processor import ContentProcessor
+from .db_pool import StorageProfile
+from .content_processor import ContentProcessor, ContentProcessingError, PRIORITY_BACKGROUND
+from .blob_store import BlobStore, BlobQuotaExceeded
+from .extraction import EXTRACTOR_VERSION
+from .fetch_cache import FetchCache
+from .ai_client import AIClient
 from .classifier import ContentClassifier
+from .embeddings import EmbeddingsManager
 from .config import get_config
+from .parser_wakeup import ParserWakeupListener
 
 logger = logging.getLogger(__name__)
 
@@ -27,9 +39,6 @@ class BackgroundParser:
     def __init__(self, db_path: Optional[str] = None):
         """Initialize the background parser."""
         self.running = False
-        self.db_manager = DatabaseManager(db_path or 'data/remembot.db')
-        self.content_processor = ContentProcessor()
-        self.classifier = ContentClassifier()
         
         try:
             self.config = get_config()
@@ -38,11 +47,41 @@ class BackgroundParser:
             from types import SimpleNamespace
             self.config = SimpleNamespace(
                 parser_poll_interval=5,
+                parser_max_poll_interval=60,
                 parser_batch_size=10,
                 max_processing_time=300,
-                parser_concurrency=3
+                parser_concurrency=3,
+                parser_classify_workers=2,
+                parser_classify_batch_size=8,
+                parser_classify_max_wait=0.5,
+                parser_embed_batch_size=32
             )
         
+        self.db_path = db_path or 'data/remembot.db'
+        self.db_manager = DatabaseManager(
+            self.db_path,
+            pool_size=getattr(self.config, 'db_pool_size', 4),
+            storage_profile=StorageProfile.from_config(self.config)
+        )
+        # Web page results are shared across users and parser restarts
+        self.content_processor = ContentProcessor(url_cache=FetchCache.from_config(self.config, self.db_path))
+        self.classifier = ContentClassifier(AIClient.from_config(self.config, self.db_path))
+        # Finished items are embedded so semantic search indexes pick them up
+        self.embeddings = EmbeddingsManager(self.db_path, ai_client=self.classifier.ai_client)
+        # Downloaded images/documents, so retries don't download again
+        self.blob_store = BlobStore.from_config(self.config, self.db_path)
+        self._telegram_bot: Optional[Bot] = None
+        
+        # Identifies this process's leases in the shared parse queue
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.wakeup = ParserWakeupListener(self.db_path, self.worker_id)
+        
+        # Pipeline stage queues and counters (created in the event loop by start())
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.stage_stats: Dict[str, Dict[str, int]] = {}
+        # Claimed items not yet persisted, whose leases the heartbeat renews
+        self._leased: Set[int] = set()
+        
         # Setup signal handlers for graceful shutdown
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
@@ -51,6 +90,7 @@ class BackgroundParser:
         """Handle shutdown signals."""
         logger.info(f"Received signal {signum}, shutting down gracefully...")
         self.running = False
+        self.wakeup.wake()
     
     async def start(self):
         """Start the background parser service."""
@@ -58,100 +98,288 @@ class BackgroundParser:
         self.running = True
         
         # Initialize services (content processor doesn't need explicit initialization)
+        if self.wakeup.start():
+            logger.info(f"Listening for parser wakeups on {self.wakeup.path}")
         logger.info("Background parser services initialized")
         
-        # Main processing loop
-        while self.running:
-            try:
-                await self._process_batch()
-                await asyncio.sleep(getattr(self.config, 'parser_poll_interval', 5))
-            except Exception as e:
-                logger.error(f"Error in parser main loop: {e}", exc_info=True)
-                await asyncio.sleep(10)  # Back off on errors
-        
-        # Cleanup
-        await self.content_processor.close()
+        try:
+            await self._run_pipeline()
+        finally:
+            # Cleanup
+            self.wakeup.close()
+            if self._telegram_bot is not None:
+                await self._telegram_bot.shutdown()
+            await self.content_processor.close()
+            await self.classifier.ai_client.close()
+            await self.db_manager.close()
         logger.info("Background parser stopped")
     
-    async def _process_batch(self):
-        """Process a batch of pending items."""
-        batch_size = getattr(self.config, 'parser_batch_size', 10)
-        pending_items = await self.db_manager.get_pending_items(limit=batch_size)
+    async def _run_pipeline(self):
+        """Run the claim -> fetch -> classify -> persist -> embed pipeline until shutdown.
         
-        if not pending_items:
-            return
-        
-        logger.info(f"Processing batch of {len(pending_items)} items")
+        Each stage has its own workers and a bounded input queue, so a slow
+        item only holds one worker and a full queue pushes back on the stage
+        before it. Classification takes items in micro-batches, one AI
+        request each; persisted items are embedded in batches too. On
+        shutdown claiming stops and in-flight items drain.
+        """
+        queue_size = getattr(self.config, 'parser_batch_size', 10)
+        batch_size = max(1, getattr(self.config, 'parser_classify_batch_size', 8))
+        max_wait = getattr(self.config, 'parser_classify_max_wait', 0.5)
+        embed_batch_size = max(1, getattr(self.config, 'parser_embed_batch_size', 32))
+        stages = [
+            (
+                'fetch',
+                lambda: self._stage_worker('fetch', self._fetch_stage),
+                getattr(self.config, 'parser_concurrency', 3)
+            ),
+            (
+                'classify',
+                lambda: self._batch_stage_worker('classify', self._classify_stage, batch_size, max_wait),
+                getattr(self.config, 'parser_classify_workers', 2)
+            ),
+            ('persist', lambda: self._stage_worker('persist', self._persist_stage), 1),
+            (
+                'embed',
+                lambda: self._batch_stage_worker('embed', self._embed_stage, embed_batch_size, max_wait),
+                1
+            ),
+        ]
+        self.queues = {name: asyncio.Queue(maxsize=max(queue_size, batch_size)) for name, _, _ in stages}
+        self.queues['embed'] = asyncio.Queue(maxsize=max(queue_size, embed_batch_size))
+        self.stage_stats = {name: {'workers': max(1, count), 'done': 0, 'errors': 0} for name, _, count in stages}
+        self.stage_stats['classify']['batches'] = 0
+        self.stage_stats['embed']['batches'] = 0
+        workers = {
+            name: [asyncio.create_task(worker()) for _ in range(max(1, count))]
+            for name, worker, count in stages
+        }
+        heartbeat = asyncio.create_task(self._lease_heartbeat())
         
-        # Process items concurrently but with limited concurrency
-        semaphore = asyncio.Semaphore(getattr(self.config, 'parser_concurrency', 3))  # Max concurrent processing
-        tasks = [self._process_item_with_semaphore(item, semaphore) for item in pending_items]
+        try:
+            await self._claim_loop()
+        finally:
+            # Stages drain in order, so every claimed item reaches persist
+            for name, _, _ in stages:
+                await self.queues[name].join()
+                for task in workers[name]:
+                    task.cancel()
+                await asyncio.gather(*workers[name], return_exceptions=True)
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+    
+    async def _claim_loop(self):
+        """Claim pending items into the fetch queue, sleeping while the queue is empty."""
+        fetch_queue = self.queues['fetch']
+        lease_seconds = getattr(self.config, 'max_processing_time', 300)
+        idle_rounds = 0
+        last_reclaim = 0.0
+        last_blob_gc = time.time()
         
-        await asyncio.gather(*tasks, return_exceptions=True)
+        while self.running:
+            try:
+                # Put items from crashed or stalled parsers back in the queue
+                if time.time() - last_reclaim > min(lease_seconds / 2, 60):
+                    await self.db_manager.reclaim_expired_leases()
+                    last_reclaim = time.time()
+                
+                if time.time() - last_blob_gc > getattr(self.config, 'blob_gc_interval', 3600):
+                    last_blob_gc = time.time()
+                    await self.blob_store.collect_garbage(self.db_manager)
+                
+                # Only claim what the fetch stage has room for so leases don't age in the queue
+                free = max(fetch_queue.maxsize - fetch_queue.qsize(), 1)
+                items = await self.db_manager.claim_items(self.worker_id, limit=free, lease_seconds=lease_seconds)
+                if items:
+                    idle_rounds = 0
+                    for item in items:
+                        self._leased.add(item['id'])
+                        await fetch_queue.put({'item': item, 'start_time': time.time()})
+                    continue
+                
+                # Sleep until woken by the ingest path or until the (backed off) fallback poll
+                woken = await self.wakeup.wait(self._idle_delay(idle_rounds))
+                idle_rounds = 0 if woken else idle_rounds + 1
+            except Exception as e:
+                logger.error(f"Error in parser claim loop: {e}", exc_info=True)
+                await asyncio.sleep(10)  # Back off on errors
     
-    async def _process_item_with_semaphore(self, item: Dict[str, Any], semaphore: asyncio.Semaphore):
-        """Process a single item with semaphore protection."""
-        async with semaphore:
-            await self._process_item(item)
+    async def _lease_heartbeat(self):
+        """Renew the leases of claimed items until they are persisted, so items
+        waiting in the classify or persist queues aren't reclaimed meanwhile."""
+        lease_seconds = getattr(self.config, 'max_processing_time', 300)
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            if not self._leased:
+                continue
+            try:
+                await self.db_manager.extend_leases(list(self._leased), self.worker_id, lease_seconds)
+            except Exception as e:
+                logger.warning(f"Could not renew parse leases: {e}")
+    
+    def _idle_delay(self, idle_rounds: int) -> float:
+        """Fallback poll delay: doubles per idle round up to parser_max_poll_interval."""
+        base = getattr(self.config, 'parser_poll_interval', 5)
+        ceiling = getattr(self.config, 'parser_max_poll_interval', 60)
+        return min(base * 2 ** min(idle_rounds, 16), ceiling)
+    
+    async def _stage_worker(self, stage: str, handler):
+        """Run one stage worker: take work, handle it, pass it to the next stage."""
+        queue = self.queues[stage]
+        while True:
+            work = await queue.get()
+            try:
+                next_stage = await handler(work)
+                self.stage_stats[stage]['done'] += 1
+            except Exception as e:
+                logger.error(f"Error processing item {work['item']['id']} in {stage} stage: {e}", exc_info=True)
+                self.stage_stats[stage]['errors'] += 1
+                work['error'] = str(e)
+                next_stage = 'persist' if stage != 'persist' else None
+            
+            try:
+                # Blocks while the next stage is full (backpressure)
+                if next_stage:
+                    await self.queues[next_stage].put(work)
+            finally:
+                queue.task_done()
     
-    async def _process_item(self, item: Dict[str, Any]):
-        """Process a single content item."""
+    async def _batch_stage_worker(self, stage: str, handler, batch_size: int, max_wait: float):
+        """Run one batching stage worker: after the first work arrives, gather up
+        to batch_size works for at most max_wait seconds and handle them together."""
+        queue = self.queues[stage]
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + max_wait
+            while len(batch) < batch_size:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                next_stages = await handler(batch)
+                self.stage_stats[stage]['done'] += len(batch)
+                self.stage_stats[stage]['batches'] += 1
+            except Exception as e:
+                item_ids = [work['item']['id'] for work in batch]
+                logger.error(f"Error processing items {item_ids} in {stage} stage: {e}", exc_info=True)
+                self.stage_stats[stage]['errors'] += len(batch)
+                for work in batch:
+                    work['error'] = str(e)
+                next_stages = ['persist'] * len(batch)
+            
+            try:
+                # Blocks while the next stage is full (backpressure)
+                for work, next_stage in zip(batch, next_stages):
+                    if next_stage:
+                        await self.queues[next_stage].put(work)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+    
+    async def _fetch_stage(self, work: Dict[str, Any]) -> Optional[str]:
+        """Fetch/extract an item's content based on its type."""
+        item = work['item']
         item_id = item['id']
         content_type = item['content_type']
         original_share = item['original_share']
         
-        start_time = time.time()
+        # The lease started at claim time; renew it now that work begins
+        lease_seconds = getattr(self.config, 'max_processing_time', 300)
+        if not await self.db_manager.extend_lease(item_id, self.worker_id, lease_seconds):
+            logger.warning(f"Lease on item {item_id} expired before processing; skipping")
+            self._leased.discard(item_id)
+            return None
+        
+        logger.info(f"Processing item {item_id} ({content_type}): {original_share[:100]}...")
         
+        # Process based on content type
+        if content_type == 'text':
+            result = await self._process_text(original_share)
+        elif content_type == 'url':
+            # Items that keep failing yield to fresh ones when fetches queue up
+            result = await self._process_url(original_share, PRIORITY_BACKGROUND + (item.get('parse_attempts') or 0))
+        elif content_type == 'image':
+            result = await self._process_image(item)
+        elif content_type == 'document':
+            result = await self._process_document(item)
+        else:
+            raise ValueError(f"Unknown content type: {content_type}")
+        
+        work['extracted_info'] = result.get('extracted_info', '')
+        if content_type in ('image', 'document'):
+            # Keeps the blob digest and extraction details with the item
+            work['metadata'] = json.dumps(result['metadata'])
+        return 'classify' if work['extracted_info'] and work['extracted_info'].strip() else 'persist'
+    
+    async def _classify_stage(self, batch: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """Classify a micro-batch of extracted content; classification failures don't fail items."""
         try:
-            # Mark as processing
-            await self.db_manager.update_parse_status(item_id, 'processing')
-            
-            logger.info(f"Processing item {item_id} ({content_type}): {original_share[:100]}...")
-            
-            # Process based on content type
-            if content_type == 'text':
-                result = await self._process_text(original_share)
-            elif content_type == 'url':
-                result = await self._process_url(original_share)
-            elif content_type == 'image':
-                result = await self._process_image(item)
-            elif content_type == 'document':
-                result = await self._process_document(item)
-            else:
-                raise ValueError(f"Unknown content type: {content_type}")
-            
-            # Extract and classify content
-            extracted_info = result.get('extracted_info', '')
-            taxonomy = None
-            
-            if extracted_info and extracted_info.strip():
-                try:
-                    classification_result = await self.classifier.classify_content(extracted_info)
-                    taxonomy = json.dumps(classification_result) if classification_result else None
-                except Exception as e:
-                    logger.warning(f"Classification failed for item {item_id}: {e}")
-            
-            # Calculate processing time
-            processing_time_ms = (time.time() - start_time) * 1000
-            
-            # Mark as complete
-            await self.db_manager.update_parse_status(
-                item_id, 
-                'complete',
-                extracted_info=extracted_info,
-                taxonomy=taxonomy,
-                processing_time_ms=processing_time_ms
-            )
-            
-            logger.info(f"Successfully processed item {item_id} in {processing_time_ms:.1f}ms")
-            
+            results = await self.classifier.classify_batch([work['extracted_info'] for work in batch])
+            for work, classification_result in zip(batch, results):
+                work['taxonomy'] = json.dumps(classification_result) if classification_result else None
         except Exception as e:
-            logger.error(f"Error processing item {item_id}: {e}", exc_info=True)
+            item_ids = [work['item']['id'] for work in batch]
+            logger.warning(f"Classification failed for items {item_ids}: {e}")
+        return ['persist'] * len(batch)
+    
+    async def _persist_stage(self, work: Dict[str, Any]) -> Optional[str]:
+        """Record the item's result (or error) under this worker's lease."""
+        item_id = work['item']['id']
+        try:
+            return await self._persist_result(work)
+        finally:
+            # Released (or lost) either way: stop renewing it
+            self._leased.discard(item_id)
+    
+    async def _persist_result(self, work: Dict[str, Any]) -> Optional[str]:
+        """Write the item's result (or error), releasing the lease; returns the next stage."""
+        item_id = work['item']['id']
+        
+        if work.get('error'):
             await self.db_manager.update_parse_status(
                 item_id, 
                 'error',
-                error_message=str(e)
+                error_message=work['error'],
+                lease_owner=self.worker_id
+            )
+            return None
+        
+        # Calculate processing time
+        processing_time_ms = (time.time() - work['start_time']) * 1000
+        
+        # Mark as complete
+        await self.db_manager.update_parse_status(
+            item_id, 
+            'complete',
+            extracted_info=work.get('extracted_info'),
+            taxonomy=work.get('taxonomy'),
+            processing_time_ms=processing_time_ms,
+            lease_owner=self.worker_id,
+            metadata=work.get('metadata')
+        )
+        
+        logger.info(f"Successfully processed item {item_id} in {processing_time_ms:.1f}ms")
+        return 'embed' if work.get('extracted_info') else None
+    
+    async def _embed_stage(self, batch: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """Embed a batch of persisted items for semantic search; failures leave them for a later backfill."""
+        try:
+            await self.embeddings.store_embeddings(
+                [(work['item']['id'], work['extracted_info']) for work in batch], force_update=True
             )
+        except Exception as e:
+            item_ids = [work['item']['id'] for work in batch]
+            logger.warning(f"Embedding failed for items {item_ids}: {e}")
+        return [None] * len(batch)
     
     async def _process_text(self, text: str) -> Dict[str, Any]:
         """Process plain text content."""
@@ -161,10 +389,10 @@ class BackgroundParser:
             'metadata': {'content_length': len(text)}
         }
     
-    async def _process_url(self, url: str) -> Dict[str, Any]:
+    async def _process_url(self, url: str, priority: int = PRIORITY_BACKGROUND) -> Dict[str, Any]:
         """Process URL content with enhanced fetching."""
         try:
-            result = await self.content_processor.process_text(url)
+            result = await self.content_processor.process_text(url, priority)
             return result
         except Exception as e:
             # Fallback: try basic URL info
@@ -175,22 +403,101 @@ class BackgroundParser:
             }
     
     async def _process_image(self, item: Dict[str, Any]) -> Dict[str, Any]:
-        """Process image content with OCR and AI description."""
-        # For background processing, we need to handle images that were already stored
-        # This is a placeholder - in a real implementation, we'd need to store
-        # the image file path or data for later processing
-        return {
-            'extracted_info': f"Image: {item['original_share']}",
-            'metadata': {'type': 'image', 'note': 'Background image processing not yet implemented'}
-        }
+        """Process image content with OCR from its stored blob."""
+        metadata = json.loads(item.get('metadata') or '{}')
+        sha256 = await self._fetch_blob(item['id'], metadata, suffix='.jpg')
+        return await self._extract_blob(
+            sha256, 'ocr', metadata,
+            lambda path: self.content_processor.process_image_file(path, metadata.get('file_size'))
+        )
     
     async def _process_document(self, item: Dict[str, Any]) -> Dict[str, Any]:
-        """Process document content with text extraction."""
-        # Similar to images, this is a placeholder for background document processing
-        return {
-            'extracted_info': f"Document: {item['original_share']}",
-            'metadata': {'type': 'document', 'note': 'Background document processing not yet implemented'}
-        }
+        """Process document content with text extraction from its stored blob."""
+        metadata = json.loads(item.get('metadata') or '{}')
+        filename = metadata.get('file_name') or item['original_share']
+        file_ext = Path(filename).suffix.lower()
+        # Fail unsupported types before downloading them
+        self.content_processor.check_document_extension(file_ext)
+        sha256 = await self._fetch_blob(item['id'], metadata, suffix=file_ext)
+        return await self._extract_blob(
+            sha256, f'document{file_ext}', metadata,
+            lambda path: self.content_processor.process_document_file(path, filename, metadata.get('file_size'))
+        )
+    
+    async def _extract_blob(self, sha256: str, extractor: str, metadata: Dict[str, Any], extract) -> Dict[str, Any]:
+        """Run extract(path) on a blob once per content hash, reusing cached results."""
+        extractor = f'{extractor}:v{EXTRACTOR_VERSION}'
+        cached = await self.db_manager.get_blob_extraction(sha256, extractor)
+        if cached is not None:
+            logger.debug(f"Reusing cached {extractor} extraction for blob {sha256[:12]}")
+            result = {
+                'extracted_info': cached['extracted_info'],
+                'metadata': dict(cached['metadata'], extraction_cached=True)
+            }
+        else:
+            result = await extract(str(self.blob_store.path_for(sha256)))
+            # Per-item details (like the file name) stay out of the shared cache entry
+            shared = {k: v for k, v in result['metadata'].items() if k != 'filename'}
+            await self.db_manager.store_blob_extraction(
+                sha256, extractor, result['extracted_info'], json.dumps(shared)
+            )
+        result['metadata'] = dict(metadata, **result['metadata'])
+        return result
+    
+    async def _fetch_blob(self, item_id: int, metadata: Dict[str, Any], suffix: str = '') -> str:
+        """Get the item's file into the blob store and attach it to the item.
+        
+        Reuses a stored copy (by digest or Telegram file_unique_id) before
+        downloading from Telegram. Sets metadata['blob_sha256'].
+        """
+        sha256 = metadata.get('blob_sha256')
+        unique_id = metadata.get('file_unique_id')
+        if not (sha256 and self.blob_store.has(sha256)) and unique_id:
+            # The same file forwarded again has the same file_unique_id
+            sha256 = await self.db_manager.find_blob_by_file_unique_id(unique_id)
+        
+        if not (sha256 and self.blob_store.has(sha256)):
+            sha256 = await self._download_blob(metadata, suffix)
+        
+        size_bytes = self.blob_store.path_for(sha256).stat().st_size
+        await self.db_manager.attach_blob(item_id, sha256, size_bytes, unique_id)
+        metadata['blob_sha256'] = sha256
+        return sha256
+    
+    async def _download_blob(self, metadata: Dict[str, Any], suffix: str) -> str:
+        """Download the item's Telegram file into the blob store; returns its digest."""
+        file_id = metadata.get('file_id')
+        if not file_id:
+            raise ContentProcessingError("Item has no stored file or Telegram file reference")
+        
+        file_size = metadata.get('file_size') or 0
+        max_bytes = getattr(self.config, 'max_file_size_mb', 50) * 1024 * 1024
+        if file_size > max_bytes:
+            raise ContentProcessingError(f"File too large: {file_size / 1024 / 1024:.1f}MB")
+        try:
+            await self.blob_store.reserve(self.db_manager, file_size)
+        except BlobQuotaExceeded as e:
+            raise ContentProcessingError(str(e))
+        
+        tmp_path = self.blob_store.temp_path(suffix)
+        try:
+            bot = await self._get_telegram_bot()
+            telegram_file = await bot.get_file(file_id)
+            await telegram_file.download_to_drive(tmp_path)
+            return await asyncio.to_thread(self.blob_store.add_file, tmp_path, True)
+        finally:
+            self.blob_store.discard_temp(tmp_path)
+    
+    async def _get_telegram_bot(self) -> Bot:
+        """Get or create the Bot API client used to download files."""
+        if self._telegram_bot is None:
+            token = getattr(self.config, 'telegram_bot_token', None) or os.environ.get('TELEGRAM_BOT_TOKEN')
+            if not token:
+                raise ContentProcessingError("TELEGRAM_BOT_TOKEN is required to download files")
+            bot = Bot(token)
+            await bot.initialize()
+            self._telegram_bot = bot
+        return self._telegram_bot
     
     async def get_status(self) -> Dict[str, Any]:
         """Get parser status and statistics."""
@@ -198,7 +505,14 @@ class BackgroundParser:
         
         return {
             'running': self.running,
+            'worker_id': self.worker_id,
             'parse_stats': parse_stats,
+            'url_cache': await self.content_processor.url_cache.get_stats() if self.content_processor.url_cache else None,
+            'fetch_scheduler': self.content_processor.scheduler.get_stats(),
+            'pipeline': {
+                name: dict(stats, queued=self.queues[name].qsize())
+                for name, stats in self.stage_stats.items()
+            },
             'last_check': time.time()
         }
 
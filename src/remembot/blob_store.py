@@ -0,0 +1,217 @@
+"""
+Content-addressed blob store for RememBot.
+Keeps downloaded images and documents on disk under their SHA-256 so the
+background parser can extract them without re-downloading. The blobs table
+in the database tracks references, so unreferenced files can be collected.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Digests checked against the blobs table per query when sweeping orphans
+ORPHAN_SWEEP_BATCH = 500
+
+
+def _is_sha256(value: str) -> bool:
+    """True for a lowercase hex SHA-256 digest."""
+    return len(value) == 64 and all(c in '0123456789abcdef' for c in value)
+
+
+class BlobQuotaExceeded(Exception):
+    """Raised when storing a file would take the blob store over its quota."""
+    pass
+
+
+class BlobStore:
+    """Stores files by SHA-256 in two-level sharded directories (ab/cd/abcd...).
+    
+    Files (and rows) become collectable once no content item references
+    them for gc_grace_seconds; the grace period also protects files that
+    have been written but not yet attached to an item.
+    """
+    
+    def __init__(self, root: str, max_bytes: int = 0, gc_grace_seconds: float = 3600):
+        """Initialize blob store (directories are created on first write)."""
+        self.root = Path(root)
+        self.tmp_dir = self.root / 'tmp'
+        self.max_bytes = max_bytes
+        self.gc_grace_seconds = gc_grace_seconds
+    
+    @classmethod
+    def from_config(cls, config, db_path: str) -> 'BlobStore':
+        """Build a store from config, defaulting to a blobs/ dir next to the database."""
+        root = getattr(config, 'blob_store_path', None) or str(Path(db_path).resolve().parent / 'blobs')
+        return cls(
+            root,
+            max_bytes=getattr(config, 'blob_store_max_mb', 0) * 1024 * 1024,
+            gc_grace_seconds=getattr(config, 'blob_gc_grace_seconds', 3600)
+        )
+    
+    def path_for(self, sha256: str) -> Path:
+        """Path where the blob with this digest lives (whether or not it exists)."""
+        if not _is_sha256(sha256):
+            raise ValueError(f"Not a SHA-256 digest: {sha256!r}")
+        return self.root / sha256[:2] / sha256[2:4] / sha256
+    
+    def has(self, sha256: str) -> bool:
+        """Check whether a blob is stored."""
+        return self.path_for(sha256).is_file()
+    
+    def temp_path(self, suffix: str = '') -> str:
+        """Create an empty temp file inside the store for a download to land in.
+        
+        Being on the same filesystem lets add_file() move it into place
+        with a rename instead of a copy.
+        """
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self.tmp_dir)
+        os.close(fd)
+        return path
+    
+    def add_file(self, file_path: str, move: bool = False) -> str:
+        """Store a file and return its digest; identical content is stored once."""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        
+        target = self.path_for(sha256)
+        if target.is_file():
+            if move:
+                os.unlink(file_path)
+            # Fresh mtime keeps the orphan sweep off a file about to be attached
+            os.utime(target)
+            return sha256
+        
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if move:
+            os.replace(file_path, target)
+        else:
+            staged = self.temp_path()
+            try:
+                shutil.copyfile(file_path, staged)
+                os.replace(staged, target)
+            except BaseException:
+                os.unlink(staged)
+                raise
+        logger.debug(f"Stored blob {sha256} ({target.stat().st_size} bytes)")
+        return sha256
+    
+    def add_bytes(self, data: bytes) -> str:
+        """Store bytes and return their digest."""
+        sha256 = hashlib.sha256(data).hexdigest()
+        target = self.path_for(sha256)
+        if not target.is_file():
+            staged = self.temp_path()
+            try:
+                with open(staged, 'wb') as f:
+                    f.write(data)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                # Atomic rename: readers never see a partial blob
+                os.replace(staged, target)
+            except BaseException:
+                if os.path.exists(staged):
+                    os.unlink(staged)
+                raise
+        return sha256
+    
+    def discard_temp(self, path: Optional[str]):
+        """Remove a temp file left by a failed download."""
+        if path and os.path.exists(path):
+            try:
+                os.unlink(path)
+            except OSError as e:
+                logger.warning(f"Failed to clean up temporary blob {path}: {e}")
+    
+    async def reserve(self, db_manager, incoming_bytes: int):
+        """Make room for incoming_bytes under the quota, collecting garbage if needed."""
+        if not self.max_bytes:
+            return
+        usage = await db_manager.get_blob_usage()
+        if usage['bytes'] + incoming_bytes <= self.max_bytes:
+            return
+        if usage['unreferenced']:
+            await self.collect_garbage(db_manager)
+            usage = await db_manager.get_blob_usage()
+        if usage['bytes'] + incoming_bytes > self.max_bytes:
+            raise BlobQuotaExceeded(
+                f"Blob store full: {usage['bytes'] / 1024 / 1024:.1f}MB used of "
+                f"{self.max_bytes / 1024 / 1024:.0f}MB"
+            )
+    
+    async def collect_garbage(self, db_manager, grace_seconds: Optional[float] = None) -> Dict[str, int]:
+        """Remove blobs unreferenced for longer than the grace period.
+        
+        Also removes stale temp files and files with no blobs row (left by
+        a crash between writing a file and attaching it to an item).
+        """
+        grace = self.gc_grace_seconds if grace_seconds is None else grace_seconds
+        cutoff = time.time() - grace
+        removed = {'blobs': 0, 'bytes': 0, 'orphans': 0, 'temp_files': 0}
+        
+        while True:
+            digests = await db_manager.delete_unreferenced_blobs(cutoff)
+            if not digests:
+                break
+            freed = await asyncio.to_thread(self._unlink_blobs, digests)
+            removed['blobs'] += len(digests)
+            removed['bytes'] += freed
+        
+        orphans = await asyncio.to_thread(self._stale_files, cutoff)
+        for start in range(0, len(orphans), ORPHAN_SWEEP_BATCH):
+            batch = orphans[start:start + ORPHAN_SWEEP_BATCH]
+            known = await db_manager.known_blobs(batch)
+            unknown = [digest for digest in batch if digest not in known]
+            removed['bytes'] += await asyncio.to_thread(self._unlink_blobs, unknown)
+            removed['orphans'] += len(unknown)
+        
+        removed['temp_files'] = await asyncio.to_thread(self._sweep_temp, cutoff)
+        if any(removed.values()):
+            logger.info(f"Blob garbage collection: {removed}")
+        return removed
+    
+    def _unlink_blobs(self, digests: List[str]) -> int:
+        """Delete blob files; returns bytes freed."""
+        freed = 0
+        for sha256 in digests:
+            path = self.path_for(sha256)
+            try:
+                freed += path.stat().st_size
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        return freed
+    
+    def _stale_files(self, cutoff: float) -> List[str]:
+        """Digests of blob files last modified before cutoff."""
+        if not self.root.is_dir():
+            return []
+        digests = []
+        for shard in self.root.glob('[0-9a-f][0-9a-f]/[0-9a-f][0-9a-f]'):
+            for entry in os.scandir(shard):
+                if _is_sha256(entry.name) and entry.stat().st_mtime < cutoff:
+                    digests.append(entry.name)
+        return digests
+    
+    def _sweep_temp(self, cutoff: float) -> int:
+        """Delete temp files abandoned before cutoff."""
+        if not self.tmp_dir.is_dir():
+            return 0
+        removed = 0
+        for entry in os.scandir(self.tmp_dir):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                self.discard_temp(entry.path)
+                removed += 1
+        return removed
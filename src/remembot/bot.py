@@ -20,6 +20,7 @@ from telegram.error import TelegramError, BadRequest, Conflict, Forbidden
 
 from .database import DatabaseManager
 from .content_processor import ContentProcessor, ContentProcessingError
+from .ai_client import AIClient
 from .classifier import ContentClassifier
 from .query_handler import QueryHandler
 from .config import get_config
@@ -38,11 +39,13 @@ class RememBot:
         self.db_manager = db_manager
         self.config = get_config()
         self.content_processor = ContentProcessor()
-        self.classifier = ContentClassifier()
-        self.query_handler = QueryHandler(db_manager)
-        self.health_checker = HealthChecker(db_manager)
-        # EmbeddingsManager is not used in the first phase (similarity features disabled)
-        self.embeddings_manager = None
+        # One pooled AI client shared by classification, search and health checks
+        self.ai_client = AIClient.from_config(self.config, self.config.database_path)
+        self.classifier = ContentClassifier(self.ai_client)
+        # Semantic half of hybrid search (items are embedded by the background parser)
+        self.embeddings_manager = EmbeddingsManager(self.config.database_path, ai_client=self.ai_client)
+        self.query_handler = QueryHandler(db_manager, self.ai_client, self.embeddings_manager)
+        self.health_checker = HealthChecker(db_manager, self.ai_client)
         
         # Create application
         self.application = Application.builder().token(token).build()
@@ -147,7 +150,7 @@ class RememBot:
             
             await update.message.reply_text(response_text, parse_mode='Markdown')
             logger.info(f"Generated web access token for user {user_id}")
-            
+        
         except Exception as e:
             logger.error(f"Error generating web token for user {user_id}: {e}")
             await update.message.reply_text(
@@ -158,7 +161,7 @@ class RememBot:
         """Handle text messages (URLs and plain text) - store for background processing."""
         user_id = update.effective_user.id
         text = update.message.text.strip()
-
+        
         # Ignore messages that are exactly a 4-digit PIN (for web authentication)
         if text.isdigit() and len(text) == 4:
             # Reply with Telegram user ID for web authentication
@@ -176,7 +179,7 @@ class RememBot:
                 logger.warning(f"Failed to link PIN {text} to Telegram user {user_id}: {e}")
             logger.info(f"Ignored 4-digit PIN from user {user_id} (for web auth)")
             return
-
+        
         try:
             # Detect content type
             content_type = 'url' if any(self.content_processor._is_url(word) for word in text.split()) else 'text'
@@ -196,7 +199,7 @@ class RememBot:
                 await update.message.reply_text("📝 Text saved for processing", quote=False)
             
             logger.info(f"Stored {content_type} content as item {item_id} for user {user_id} (pending processing)")
-
+        
         except Exception as e:
             logger.error(f"Error storing content for user {user_id}: {e}")
             await update.message.reply_text("❌ Failed to save content. Please try again later.", quote=False)
@@ -216,13 +219,14 @@ class RememBot:
                 )
                 return
             
-            # Store image reference for background processing
+            # Store the file reference; the background parser downloads and OCRs it
             item_id = await self.db_manager.store_content(
                 user_telegram_id=user_id,
                 original_share=f"Photo: {photo.file_id}",
                 content_type="image",
                 metadata=json.dumps({
                     'file_id': photo.file_id,
+                    'file_unique_id': photo.file_unique_id,
                     'file_size': photo.file_size,
                     'width': photo.width,
                     'height': photo.height
@@ -232,7 +236,7 @@ class RememBot:
             
             await update.message.reply_text("📷 Image saved for processing", quote=False)
             logger.info(f"Stored image as item {item_id} for user {user_id} (pending processing)")
-            
+        
         except Exception as e:
             logger.error(f"Error storing image for user {user_id}: {e}")
             await update.message.reply_text("❌ Failed to save image. Please try again later.", quote=False)
@@ -252,13 +256,14 @@ class RememBot:
                 )
                 return
             
-            # Store document reference for background processing
+            # Store the file reference; the background parser downloads and extracts it
             item_id = await self.db_manager.store_content(
                 user_telegram_id=user_id,
                 original_share=f"Document: {document.file_name}",
                 content_type="document",
                 metadata=json.dumps({
                     'file_id': document.file_id,
+                    'file_unique_id': document.file_unique_id,
                     'file_name': document.file_name,
                     'file_size': document.file_size,
                     'mime_type': document.mime_type
@@ -268,7 +273,7 @@ class RememBot:
             
             await update.message.reply_text(f"📄 Document '{document.file_name}' saved for processing", quote=False)
             logger.info(f"Stored document as item {item_id} for user {user_id} (pending processing)")
-            
+        
         except Exception as e:
             logger.error(f"Error storing document for user {user_id}: {e}")
             await update.message.reply_text("❌ Failed to save document. Please try again later.", quote=False)
@@ -286,6 +291,8 @@ class RememBot:
         try:
             await self.content_processor.close()
             await self.health_checker.stop()
+            await self.ai_client.close()
+            await self.db_manager.close()
             logger.info("Services shut down cleanly")
         except Exception as e:
             logger.error(f"Error during shutdown: {e}")
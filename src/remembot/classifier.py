@@ -4,29 +4,28 @@ Uses AI to classify content according to Dewey Decimal and Library of Congress s
 """
 
 import logging
-import os
 from typing import Dict, List, Any, Optional, Tuple
 import json
 import re
 import asyncio
 
 # Optional AI integrations
-try:
-    import openai
-    HAS_OPENAI = True
-except ImportError:
-    HAS_OPENAI = False
-
-try:
-    import aiohttp
-    HAS_AIOHTTP = True
-except ImportError:
-    HAS_AIOHTTP = False
-
+from .ai_client import AIClient, is_json_reply, parse_json_reply
 from .config import get_config
 
 logger = logging.getLogger(__name__)
 
+# Prompt template versions for the LLM response cache; bump when a prompt changes
+CLASSIFY_TEMPLATE = 'classify:v1'
+
+# Single-item request settings; batches cache each item's result under this request's key
+CLASSIFY_MODELS = {'openrouter': 'openai/gpt-3.5-turbo', 'openai': 'gpt-3.5-turbo'}
+CLASSIFY_MAX_TOKENS = 300
+CLASSIFY_TEMPERATURE = 0.3
+
+# Content sent per item in batch requests (single requests send up to 3000)
+BATCH_ITEM_CHARS = 1500
+
 
 class DeweyDecimalClassifier:
     """Dewey Decimal Classification system implementation."""
@@ -273,105 +272,98 @@ class DeweyDecimalClassifier:
 class ContentClassifier:
     """Enhanced content classifier using AI and library standards."""
     
-    def __init__(self):
-        """Initialize content classifier with DDC support."""
-        self.openai_client = None
-        self.openrouter_api_key = None
+    def __init__(self, ai_client: Optional[AIClient] = None):
+        """Initialize content classifier with DDC support.
+        
+        Pass the process's shared AIClient; without one the classifier
+        creates (and closes) its own.
+        """
         self.dewey_classifier = DeweyDecimalClassifier()
+        self._owns_ai_client = ai_client is None
         
-        try:
-            self.config = get_config()
-            # Set up OpenRouter if available
-            if self.config.openrouter_api_key:
-                self.openrouter_api_key = self.config.openrouter_api_key
-            
-            # Set up OpenAI as fallback if available
-            if HAS_OPENAI and self.config.openai_api_key:
-                self.openai_client = openai.AsyncOpenAI(api_key=self.config.openai_api_key)
-        except Exception:
-            # Fallback for testing
-            if os.getenv('OPENROUTER_API_KEY'):
-                self.openrouter_api_key = os.getenv('OPENROUTER_API_KEY')
-            if HAS_OPENAI and os.getenv('OPENAI_API_KEY'):
-                self.openai_client = openai.AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        if ai_client is None:
+            try:
+                self.config = get_config()
+                ai_client = AIClient.from_config(self.config, self.config.database_path)
+            except Exception:
+                # Fallback for testing: keys from the environment
+                ai_client = AIClient.from_config()
+        self.ai_client = ai_client
     
-    async def classify_content(self, content: str) -> Dict[str, Any]:
-        """Classify content according to library standards."""
+    async def classify_content(self, content: str, bypass_cache: bool = False) -> Dict[str, Any]:
+        """Classify content according to library standards.
+        
+        bypass_cache asks the AI provider again instead of reusing a cached reply.
+        """
         if not content or not content.strip():
-            return {
-                'dewey_decimal': None,
-                'subjects': [],
-                'confidence': 0.0,
-                'classification_method': 'none'
-            }
+            return self._unclassified()
         
         # Try OpenRouter first if available
-        if self.openrouter_api_key and HAS_AIOHTTP:
+        if self.ai_client.has('openrouter'):
             try:
-                return await self._openrouter_classify(content)
+                return await self._openrouter_classify(content, bypass_cache)
             except Exception as e:
                 logger.warning(f"OpenRouter classification failed, falling back: {e}")
         
         # Fallback to OpenAI if available
-        if self.openai_client:
-            return await self._ai_classify(content)
+        if self.ai_client.has('openai'):
+            return await self._ai_classify(content, bypass_cache)
         else:
             # Final fallback to simple keyword-based classification
             return self._simple_classify(content)
     
-    async def _ai_classify(self, content: str) -> Dict[str, Any]:
+    @staticmethod
+    def _classify_messages(content: str) -> List[Dict[str, str]]:
+        """Chat messages of a single-item classification request."""
+        # Truncate content if too long
+        if len(content) > 3000:
+            content = content[:3000] + "..."
+        
+        prompt = f"""
+        Classify the following content according to library science standards.
+        Provide a Dewey Decimal Classification (DDC) number and subject keywords.
+        
+        Content: {content}
+        
+        Please respond with a JSON object containing:
+        - dewey_decimal: The most appropriate DDC number (3 digits)
+        - subjects: Array of relevant subject keywords (max 5)
+        - confidence: Confidence score from 0.0 to 1.0
+        - reasoning: Brief explanation of the classification
+        
+        Example response:
+        {{
+            "dewey_decimal": "004",
+            "subjects": ["computer science", "programming", "technology"],
+            "confidence": 0.85,
+            "reasoning": "Content discusses programming concepts and computer technology"
+        }}
+        """
+        return [
+            {"role": "system", "content": "You are a library science expert specializing in content classification."},
+            {"role": "user", "content": prompt}
+        ]
+    
+    async def _ai_classify(self, content: str, bypass_cache: bool = False) -> Dict[str, Any]:
         """Use AI to classify content."""
         try:
-            # Truncate content if too long
-            if len(content) > 3000:
-                content = content[:3000] + "..."
-            
-            prompt = f"""
-            Classify the following content according to library science standards.
-            Provide a Dewey Decimal Classification (DDC) number and subject keywords.
-            
-            Content: {content}
-            
-            Please respond with a JSON object containing:
-            - dewey_decimal: The most appropriate DDC number (3 digits)
-            - subjects: Array of relevant subject keywords (max 5)
-            - confidence: Confidence score from 0.0 to 1.0
-            - reasoning: Brief explanation of the classification
-            
-            Example response:
-            {{
-                "dewey_decimal": "004",
-                "subjects": ["computer science", "programming", "technology"],
-                "confidence": 0.85,
-                "reasoning": "Content discusses programming concepts and computer technology"
-            }}
-            """
-            
-            response = await self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a library science expert specializing in content classification."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=300,
-                temperature=0.3
+            response_text = await self.ai_client.chat(
+                'openai',
+                self._classify_messages(content),
+                model=CLASSIFY_MODELS['openai'],
+                max_tokens=CLASSIFY_MAX_TOKENS,
+                temperature=CLASSIFY_TEMPERATURE,
+                template=CLASSIFY_TEMPLATE,
+                bypass_cache=bypass_cache,
+                validate=is_json_reply
             )
             
-            # Parse the response
-            response_text = response.choices[0].message.content.strip()
-            
             # Try to extract JSON from the response
             try:
-                # Remove any markdown formatting
-                if "```json" in response_text:
-                    response_text = response_text.split("```json")[1].split("```")[0]
-                elif "```" in response_text:
-                    response_text = response_text.split("```")[1].split("```")[0]
-                
-                classification = json.loads(response_text)
+                classification = parse_json_reply(response_text)
                 classification['classification_method'] = 'ai'
                 return classification
-                
+            
             except json.JSONDecodeError:
                 logger.warning(f"Failed to parse AI classification response: {response_text}")
                 return self._simple_classify(content)
@@ -380,79 +372,167 @@ class ContentClassifier:
             logger.error(f"Error in AI classification: {e}")
             return self._simple_classify(content)
     
-    async def _openrouter_classify(self, content: str) -> Dict[str, Any]:
+    async def _openrouter_classify(self, content: str, bypass_cache: bool = False) -> Dict[str, Any]:
         """Use OpenRouter API to classify content."""
-        if len(content) > 3000:
-            content = content[:3000] + "..."
+        response_text = await self.ai_client.chat(
+            'openrouter',
+            self._classify_messages(content),
+            model=CLASSIFY_MODELS['openrouter'],
+            max_tokens=CLASSIFY_MAX_TOKENS,
+            temperature=CLASSIFY_TEMPERATURE,
+            title='RememBot Content Classification',
+            template=CLASSIFY_TEMPLATE,
+            bypass_cache=bypass_cache,
+            validate=is_json_reply
+        )
+        
+        # Parse the response
+        try:
+            classification = parse_json_reply(response_text)
+            classification['classification_method'] = 'openrouter_ai'
+            return classification
+        
+        except json.JSONDecodeError:
+            logger.warning(f"Failed to parse OpenRouter classification response: {response_text}")
+            # Fallback to simple classification
+            return self._simple_classify(content)
+    
+    async def classify_batch(self, contents: List[str], bypass_cache: bool = False) -> List[Dict[str, Any]]:
+        """Classify several items, in order, with at most one AI request per provider.
+        
+        Each item is first looked up in the response cache under the key
+        classify_content() uses; only the misses are sent, numbered, in one
+        request, and each result is cached under its own item's key. Items a
+        provider doesn't classify go to the next provider, then to keyword
+        classification.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(contents)
+        pending = []
+        for index, content in enumerate(contents):
+            if content and content.strip():
+                pending.append(index)
+            else:
+                results[index] = self._unclassified()
+        
+        if len(pending) == 1:
+            results[pending[0]] = await self.classify_content(contents[pending[0]], bypass_cache)
+            return results
+        
+        # Try OpenRouter first if available, then OpenAI
+        for provider in ('openrouter', 'openai'):
+            if not pending or not self.ai_client.has(provider):
+                continue
+            if not bypass_cache:
+                cached = await asyncio.gather(*(self._cached_classification(provider, contents[i]) for i in pending))
+                for index, classification in zip(pending, cached):
+                    results[index] = classification
+                pending = [index for index in pending if results[index] is None]
+                if not pending:
+                    break
+            try:
+                classified = await self._batch_classify(provider, [contents[index] for index in pending])
+            except Exception as e:
+                logger.warning(f"Batch classification via {provider} failed: {e}")
+                continue
+            for index, classification in zip(pending, classified):
+                results[index] = classification
+            pending = [index for index in pending if results[index] is None]
+        
+        for index in pending:
+            results[index] = self._simple_classify(contents[index])
+        return results
+    
+    async def _cached_classification(self, provider: str, content: str) -> Optional[Dict[str, Any]]:
+        """The provider's cached single-item classification of content, if any."""
+        reply = await self.ai_client.cached_reply(
+            provider, self._classify_messages(content), CLASSIFY_MODELS[provider],
+            CLASSIFY_MAX_TOKENS, CLASSIFY_TEMPERATURE, CLASSIFY_TEMPLATE
+        )
+        try:
+            classification = parse_json_reply(reply) if reply else None
+        except ValueError:
+            return None
+        if not isinstance(classification, dict):
+            return None
+        classification['classification_method'] = 'openrouter_ai' if provider == 'openrouter' else 'ai'
+        return classification
+    
+    async def _batch_classify(self, provider: str, contents: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """Classify numbered items in one request; None for items the reply misses.
+        
+        Raises ValueError when the reply isn't a JSON array, so the caller
+        can try another provider.
+        """
+        items = []
+        for number, content in enumerate(contents, 1):
+            if len(content) > BATCH_ITEM_CHARS:
+                content = content[:BATCH_ITEM_CHARS] + "..."
+            items.append(f"Item {number}:\n{content}")
+        separator = "\n---\n"
         
         prompt = f"""
-        Classify the following content according to library science standards.
-        Provide a Dewey Decimal Classification (DDC) number and subject keywords.
+        Classify each of the following {len(contents)} numbered items according to library science standards.
+        Provide a Dewey Decimal Classification (DDC) number and subject keywords for every item.
         
-        Content: {content}
+        {separator.join(items)}
         
-        Please respond with a JSON object containing:
+        Please respond with a JSON array containing one object per item, in order, each with:
+        - item: The item number
         - dewey_decimal: The most appropriate DDC number (3 digits)
         - subjects: Array of relevant subject keywords (max 5)
         - confidence: Confidence score from 0.0 to 1.0
-        - reasoning: Brief explanation of the classification
         
         Example response:
-        {{
-            "dewey_decimal": "004",
-            "subjects": ["computer science", "programming", "technology"],
-            "confidence": 0.85,
-            "reasoning": "Content discusses programming concepts and computer technology"
-        }}
+        [
+            {{"item": 1, "dewey_decimal": "004", "subjects": ["computer science", "programming"], "confidence": 0.85}},
+            {{"item": 2, "dewey_decimal": "641", "subjects": ["cooking", "recipes"], "confidence": 0.9}}
+        ]
         """
         
-        headers = {
-            'Authorization': f'Bearer {self.openrouter_api_key}',
-            'Content-Type': 'application/json',
-            'HTTP-Referer': 'https://github.com/raymondclowe/RememBot',
-            'X-Title': 'RememBot Content Classification'
-        }
-        
-        payload = {
-            'model': 'openai/gpt-3.5-turbo',
-            'messages': [
+        # Not cached as a whole: results are cached per item below
+        response_text = await self.ai_client.chat(
+            provider,
+            [
                 {"role": "system", "content": "You are a library science expert specializing in content classification."},
                 {"role": "user", "content": prompt}
             ],
-            'max_tokens': 300,
-            'temperature': 0.3
-        }
+            model=CLASSIFY_MODELS[provider],
+            max_tokens=60 + 80 * len(contents),
+            temperature=CLASSIFY_TEMPERATURE,
+            title='RememBot Content Classification'
+        )
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                'https://openrouter.ai/api/v1/chat/completions',
-                headers=headers,
-                json=payload,
-                timeout=aiohttp.ClientTimeout(total=30)
-            ) as response:
-                
-                if response.status != 200:
-                    raise Exception(f"OpenRouter API error: {response.status}")
-                
-                data = await response.json()
-                response_text = data['choices'][0]['message']['content'].strip()
-                
-                # Parse the response
-                try:
-                    # Remove any markdown formatting
-                    if "```json" in response_text:
-                        response_text = response_text.split("```json")[1].split("```")[0]
-                    elif "```" in response_text:
-                        response_text = response_text.split("```")[1].split("```")[0]
-                    
-                    classification = json.loads(response_text)
-                    classification['classification_method'] = 'openrouter_ai'
-                    return classification
-                    
-                except json.JSONDecodeError:
-                    logger.warning(f"Failed to parse OpenRouter classification response: {response_text}")
-                    # Fallback to simple classification
-                    return self._simple_classify(content)
+        reply = parse_json_reply(response_text)
+        if not isinstance(reply, list):
+            raise ValueError(f"batch classification reply is not an array: {response_text[:200]}")
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(contents)
+        method = 'openrouter_ai' if provider == 'openrouter' else 'ai'
+        for position, entry in enumerate(reply):
+            if not isinstance(entry, dict) or not entry.get('dewey_decimal'):
+                continue
+            try:
+                index = int(entry.pop('item', position + 1)) - 1
+            except (TypeError, ValueError):
+                continue
+            if 0 <= index < len(results) and results[index] is None:
+                await self.ai_client.store_reply(
+                    provider, self._classify_messages(contents[index]), CLASSIFY_MODELS[provider],
+                    CLASSIFY_MAX_TOKENS, CLASSIFY_TEMPERATURE, CLASSIFY_TEMPLATE, json.dumps(entry)
+                )
+                entry['classification_method'] = method
+                results[index] = entry
+        return results
+    
+    @staticmethod
+    def _unclassified() -> Dict[str, Any]:
+        """Classification of empty content."""
+        return {
+            'dewey_decimal': None,
+            'subjects': [],
+            'confidence': 0.0,
+            'classification_method': 'none'
+        }
     
     def _simple_classify(self, content: str) -> Dict[str, Any]:
         """Enhanced keyword-based classification using comprehensive DDC system."""
@@ -521,4 +601,9 @@ class ContentClassifier:
                 "subdivisions": list(info["subdivisions"].keys())
             }
             for code, info in self.dewey_classifier.DDC_SYSTEM.items()
-        }
\ No newline at end of file
+        }
+    
+    async def close(self):
+        """Close the AI client if this classifier created it."""
+        if self._owns_ai_client:
+            await self.ai_client.close()
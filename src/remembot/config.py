@@ -11,6 +11,8 @@ from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings
 from pydantic import ValidationError
 
+from .db_pool import StorageProfile
+
 logger = logging.getLogger(__name__)
 
 
@@ -29,6 +31,17 @@ class RememBotConfig(BaseSettings):
         default_factory=lambda: str(Path.home() / '.remembot' / 'remembot.db'),
         description="Path to SQLite database file"
     )
+    db_pool_size: int = Field(default=4, description="Maximum pooled reader connections per process")
+    
+    # SQLite storage profile (shared by bot, background parser and web app)
+    db_journal_mode: str = Field(default="wal", description="SQLite journal mode (wal, delete, truncate, persist, memory)")
+    db_synchronous: str = Field(default="normal", description="SQLite synchronous level (off, normal, full, extra)")
+    db_busy_timeout_ms: int = Field(default=5000, description="How long to wait on a locked database in milliseconds")
+    db_mmap_size: int = Field(default=256 * 1024 * 1024, description="Memory-mapped I/O size in bytes (0 disables)")
+    db_cache_size_kb: int = Field(default=20000, description="Page cache size per connection in KiB")
+    db_temp_store: str = Field(default="memory", description="Where SQLite keeps temporary tables (default, file, memory)")
+    db_wal_autocheckpoint: int = Field(default=1000, description="WAL pages before SQLite auto-checkpoints")
+    db_checkpoint_interval: float = Field(default=300.0, description="Seconds between passive WAL checkpoints (0 disables)")
     
     # Logging settings
     log_level: str = Field(default="INFO", description="Logging level")
@@ -38,7 +51,9 @@ class RememBotConfig(BaseSettings):
     )
     
     # Performance settings
-    max_workers: int = Field(default=4, description="Maximum worker threads for content processing")
+    max_workers: int = Field(default=4, description="Extraction worker processes for OCR/document/HTML parsing (0 runs them on a thread)")
+    extraction_timeout: float = Field(default=120.0, description="Seconds before an extraction job is killed")
+    extraction_max_jobs_per_worker: int = Field(default=50, description="Jobs per extraction worker before the pool is recycled")
     request_timeout: int = Field(default=30, description="HTTP request timeout in seconds")
     max_retries: int = Field(default=3, description="Maximum retries for failed operations")
     
@@ -48,11 +63,80 @@ class RememBotConfig(BaseSettings):
         default=['jpg', 'jpeg', 'png', 'gif', 'bmp', 'tiff'],
         description="Supported image formats"
     )
+    blob_store_path: Optional[str] = Field(
+        None,
+        description="Directory for downloaded images/documents (default: blobs/ next to the database)"
+    )
+    blob_store_max_mb: int = Field(default=2048, description="Blob store size quota in MB (0 for no limit)")
+    blob_gc_grace_seconds: float = Field(default=3600.0, description="How long unreferenced blobs are kept before collection")
+    blob_gc_interval: float = Field(default=3600.0, description="Seconds between blob garbage collection runs in the parser")
     supported_document_formats: list = Field(
         default=['pdf', 'docx', 'xlsx', 'txt'],
         description="Supported document formats"
     )
     
+    # URL fetch cache (shared by all users; lives next to the database by default)
+    url_cache_enabled: bool = Field(default=True, description="Cache fetched web page results")
+    url_cache_path: Optional[str] = Field(None, description="SQLite file for the URL cache")
+    url_cache_ttl: float = Field(default=6 * 3600, description="Seconds a cached page is served without revalidation")
+    url_cache_max_entries: int = Field(default=10000, description="Maximum cached URLs (least recently used are evicted)")
+    url_cache_max_mb: int = Field(default=256, description="Maximum URL cache size in MB")
+    
+    # LLM response cache (classification, query expansion and summaries; next to the database by default)
+    llm_cache_enabled: bool = Field(default=True, description="Cache AI provider replies to identical requests")
+    llm_cache_path: Optional[str] = Field(None, description="SQLite file for the LLM response cache")
+    llm_cache_ttl: float = Field(default=7 * 86400, description="Seconds a cached AI reply is reused")
+    llm_cache_max_entries: int = Field(default=50000, description="Maximum cached AI replies (least recently used are evicted)")
+    llm_cache_max_mb: int = Field(default=64, description="Maximum LLM response cache size in MB")
+    
+    # AI provider client (one connection pool per process)
+    ai_request_timeout: float = Field(default=30.0, description="Seconds before an AI API request times out")
+    ai_connect_timeout: float = Field(default=10.0, description="Seconds to establish a connection to an AI API")
+    ai_max_connections: int = Field(default=20, description="Maximum pooled connections to AI APIs")
+    ai_keepalive_seconds: float = Field(default=60.0, description="How long idle AI API connections are kept open")
+    ai_openrouter_concurrency: int = Field(default=4, description="Maximum concurrent OpenRouter requests")
+    ai_openai_concurrency: int = Field(default=4, description="Maximum concurrent OpenAI requests")
+    
+    # Web page downloads stop at this size, or sooner once enough text is extracted
+    url_max_download_mb: float = Field(default=2.0, description="Maximum bytes of a web page read, in MB")
+    url_max_text_chars: int = Field(default=10000, description="Characters of page text kept per URL")
+    url_extractor: str = Field(
+        default='stream',
+        description="Page text extraction: stream (parse while downloading), readability (main content only) or basic"
+    )
+    html_parser: str = Field(default='lxml', description="HTML tree builder for readability/basic: lxml, html.parser or html5lib")
+    
+    # Semantic search embeddings (vector indexes live next to the database by default)
+    embedding_provider: str = Field(default='hashing', description="Embedding backend: hashing (local, offline) or openai")
+    embedding_model: str = Field(default='text-embedding-3-small', description="OpenAI embedding model")
+    embedding_dim: int = Field(default=384, description="Embedding dimensions")
+    vector_index_path: Optional[str] = Field(None, description="Directory for memory-mapped vector index snapshots")
+    vector_ann_min_items: int = Field(default=50000, description="Items before a user's search goes from exact to approximate (IVF)")
+    vector_ann_nprobe: int = Field(default=32, description="IVF lists scanned per approximate search (higher recall, slower)")
+    embedding_concurrency: int = Field(default=4, description="Embedding requests in flight at once")
+    embedding_requests_per_second: float = Field(default=20.0, description="Embedding requests started per second")
+    
+    # Hybrid search: keyword (bm25) and semantic rankings fused with reciprocal rank fusion
+    search_candidates: int = Field(default=50, description="Results taken from each ranking before fusion")
+    search_rrf_k: int = Field(default=60, description="RRF constant k (higher flattens the weight of top ranks)")
+    search_min_similarity: float = Field(default=0.2, description="Minimum cosine similarity for semantic candidates")
+    search_rerank_top_n: int = Field(default=0, description="Fused results reranked by the AI provider (0 disables)")
+    
+    # Background parser pipeline; classification runs in micro-batches (one AI request per batch)
+    parser_max_poll_interval: float = Field(default=60, description="Longest fallback poll delay in seconds when the queue stays empty")
+    parser_classify_workers: int = Field(default=2, description="Classification batches in flight at once")
+    parser_classify_batch_size: int = Field(default=8, description="Items classified per AI request")
+    parser_classify_max_wait: float = Field(default=0.5, description="Seconds a partial classification batch waits for more items")
+    parser_embed_batch_size: int = Field(default=32, description="Finished items embedded together")
+    
+    # Web page fetch scheduling (per process)
+    fetch_concurrency: int = Field(default=10, description="Maximum page fetches in flight")
+    fetch_host_rate: float = Field(default=1.0, description="Sustained requests per second to any one host")
+    fetch_host_burst: int = Field(default=3, description="Requests a host may receive back to back")
+    fetch_breaker_threshold: int = Field(default=5, description="Consecutive failures before a host is skipped")
+    fetch_breaker_cooldown: float = Field(default=60.0, description="Seconds a failing host is skipped before a trial request")
+    fetch_max_retry_after: float = Field(default=120.0, description="Longest Retry-After honoured before giving up on a URL")
+    
     # Health check settings
     health_check_enabled: bool = Field(default=True, description="Enable health check endpoint")
     health_check_port: int = Field(default=8080, description="Health check endpoint port")
@@ -92,6 +176,76 @@ class RememBotConfig(BaseSettings):
             raise ValueError("File size must be between 1 and 100 MB")
         return v
     
+    @field_validator('db_journal_mode', 'db_synchronous', 'db_temp_store')
+    @classmethod
+    def validate_storage_profile(cls, v, info):
+        """Validate SQLite storage profile choices."""
+        choices = {
+            'db_journal_mode': StorageProfile.JOURNAL_MODES,
+            'db_synchronous': StorageProfile.SYNCHRONOUS_MODES,
+            'db_temp_store': StorageProfile.TEMP_STORES,
+        }[info.field_name]
+        if v.lower() not in choices:
+            raise ValueError(f"{info.field_name} must be one of: {list(choices)}")
+        return v.lower()
+    
+    @field_validator('max_workers')
+    @classmethod
+    def validate_max_workers(cls, v):
+        """Validate extraction worker count."""
+        if v < 0:
+            raise ValueError("max_workers must be 0 or more")
+        return v
+    
+    @field_validator('url_extractor')
+    @classmethod
+    def validate_url_extractor(cls, v):
+        """Validate page text extractor."""
+        valid_extractors = ['stream', 'readability', 'basic']
+        if v not in valid_extractors:
+            raise ValueError(f"url_extractor must be one of: {valid_extractors}")
+        return v
+    
+    @field_validator('html_parser')
+    @classmethod
+    def validate_html_parser(cls, v):
+        """Validate HTML parser backend."""
+        valid_parsers = ['lxml', 'html.parser', 'html5lib']
+        if v not in valid_parsers:
+            raise ValueError(f"html_parser must be one of: {valid_parsers}")
+        return v
+    
+    @field_validator('embedding_provider')
+    @classmethod
+    def validate_embedding_provider(cls, v):
+        """Validate embedding backend."""
+        valid_providers = ['hashing', 'openai']
+        if v not in valid_providers:
+            raise ValueError(f"embedding_provider must be one of: {valid_providers}")
+        return v
+    
+    @field_validator(
+        'fetch_concurrency', 'fetch_host_rate', 'fetch_host_burst',
+        'ai_openrouter_concurrency', 'ai_openai_concurrency', 'ai_max_connections',
+        'parser_max_poll_interval', 'parser_classify_workers', 'parser_classify_batch_size', 'parser_embed_batch_size',
+        'embedding_dim', 'embedding_concurrency',
+        'embedding_requests_per_second', 'vector_ann_min_items', 'vector_ann_nprobe', 'search_candidates', 'search_rrf_k'
+    )
+    @classmethod
+    def validate_positive_limits(cls, v, info):
+        """Validate concurrency and rate limits."""
+        if v <= 0:
+            raise ValueError(f"{info.field_name} must be greater than 0")
+        return v
+    
+    @field_validator('db_pool_size')
+    @classmethod
+    def validate_db_pool_size(cls, v):
+        """Validate connection pool size."""
+        if v < 1:
+            raise ValueError("Database pool size must be at least 1")
+        return v
+    
     model_config = {
         "env_file": ".env",
         "env_prefix": "REMEMBOT_",
@@ -163,6 +317,7 @@ class ConfigManager:
         
         logger.info("Configuration Summary:")
         logger.info(f"  Database: {self._config.database_path}")
+        logger.info(f"  Journal Mode: {self._config.db_journal_mode} (synchronous={self._config.db_synchronous})")
         logger.info(f"  Log Level: {self._config.log_level}")
         logger.info(f"  Max Workers: {self._config.max_workers}")
         logger.info(f"  Request Timeout: {self._config.request_timeout}s")
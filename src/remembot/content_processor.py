@@ -4,41 +4,266 @@ Handles URL fetching, image processing, and document parsing with enhanced error
 """
 
 import asyncio
+import heapq
+import itertools
 import logging
 import tempfile
 import os
-from typing import Dict, Any, Optional
+import sqlite3
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, List, Optional, Tuple
 from urllib.parse import urlparse
 import aiohttp
 from pathlib import Path
 from datetime import datetime, timezone
 import time
 
-import requests
-from bs4 import BeautifulSoup
-from PIL import Image
-import pytesseract
-from docx import Document
-import pypdf
-from pypdf import PdfReader
-import openpyxl
-
 from .config import get_config
+from .fetch_cache import FetchCache
+from .fingerprint import canonicalize_url
+from .page_text import (
+    SNIFF_BYTES, STREAM_CHUNK_SIZE, TEXT_CONTENT_TYPES, StreamingTextExtractor, resolve_parser, sniff_charset
+)
+from .extraction import (
+    ContentProcessingError, ExtractionEngine, extract_document_text, html_to_text, ocr_image
+)
 
 logger = logging.getLogger(__name__)
 
+SUPPORTED_DOCUMENT_EXTENSIONS = ['.pdf', '.docx', '.doc', '.xlsx', '.xls', '.txt']
+
+# Fetch priorities: lower runs first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
 
-class ContentProcessingError(Exception):
-    """Custom exception for content processing errors."""
+class HostUnavailable(ContentProcessingError):
+    """Raised without a request while a host's circuit breaker is open."""
     pass
 
 
+class RetryableFetchError(ContentProcessingError):
+    """A fetch the host asked us to retry later (429/503)."""
+    
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class FetchScheduler:
+    """Admits outgoing page fetches by priority, per-host rate and host health.
+    
+    Each host has a token bucket (host_rate requests/second, bursts of
+    host_burst), honours Retry-After, and has a circuit breaker that opens
+    after breaker_threshold consecutive failures and lets one trial request
+    through after breaker_cooldown. Waiting requests don't hold a global
+    slot, and a request for a host that isn't ready never blocks requests
+    for other hosts, so one busy site can't starve the rest.
+    """
+    
+    def __init__(
+        self,
+        max_concurrency: int = 10,
+        host_rate: float = 1.0,
+        host_burst: int = 3,
+        breaker_threshold: int = 5,
+        breaker_cooldown: float = 60.0,
+        max_retry_after: float = 120.0
+    ):
+        """Initialize scheduler."""
+        self.max_concurrency = max_concurrency
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.max_retry_after = max_retry_after
+        self._hosts: Dict[str, Dict[str, Any]] = {}
+        self._waiters: List[Tuple[int, int, str, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.stats = {'granted': 0, 'throttled': 0, 'rejected': 0, 'breaker_opened': 0}
+    
+    @classmethod
+    def from_config(cls, config) -> 'FetchScheduler':
+        """Build a scheduler from RememBotConfig (or a SimpleNamespace with the same fields)."""
+        return cls(
+            max_concurrency=getattr(config, 'fetch_concurrency', 10),
+            host_rate=getattr(config, 'fetch_host_rate', 1.0),
+            host_burst=getattr(config, 'fetch_host_burst', 3),
+            breaker_threshold=getattr(config, 'fetch_breaker_threshold', 5),
+            breaker_cooldown=getattr(config, 'fetch_breaker_cooldown', 60.0),
+            max_retry_after=getattr(config, 'fetch_max_retry_after', 120.0)
+        )
+    
+    @staticmethod
+    def host_of(url: str) -> str:
+        """Scheduling key for a URL."""
+        return (urlparse(url).hostname or '').lower()
+    
+    def _host(self, host: str) -> Dict[str, Any]:
+        """Get (or create) a host's bucket and breaker state."""
+        state = self._hosts.get(host)
+        if state is None:
+            state = {
+                'tokens': float(self.host_burst), 'refilled_at': time.monotonic(),
+                'blocked_until': 0.0, 'throttled': 0, 'failures': 0, 'open_until': 0.0,
+                'half_open': False, 'active': 0
+            }
+            self._hosts[host] = state
+        return state
+    
+    def _ready_at(self, state: Dict[str, Any], now: float) -> float:
+        """When the host may next be sent a request (<= now means immediately)."""
+        state['tokens'] = min(self.host_burst, state['tokens'] + (now - state['refilled_at']) * self.host_rate)
+        state['refilled_at'] = now
+        ready = max(state['blocked_until'], now)
+        if state['tokens'] < 1:
+            ready = max(ready, now + (1 - state['tokens']) / self.host_rate)
+        return ready
+    
+    def breaker_open(self, host: str) -> bool:
+        """True while requests to host fail fast."""
+        state = self._hosts.get(host)
+        return bool(state) and state['open_until'] > time.monotonic()
+    
+    @asynccontextmanager
+    async def slot(self, url: str, priority: int = PRIORITY_INTERACTIVE):
+        """Wait for permission to fetch url, holding a global slot while inside."""
+        host = self.host_of(url)
+        if self.breaker_open(host):
+            self.stats['rejected'] += 1
+            raise HostUnavailable(f"{host} is failing; not retrying until its circuit breaker closes")
+        
+        granted = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), host, granted))
+        self._dispatch()
+        try:
+            await granted
+        except asyncio.CancelledError:
+            # Cancelled just after being granted: give the slot back
+            if granted.done() and not granted.cancelled():
+                self._release(host)
+            raise
+        
+        try:
+            yield
+        finally:
+            self._release(host)
+    
+    def _release(self, host: str):
+        """Return a slot and admit whoever can go next."""
+        self._active -= 1
+        self._host(host)['active'] -= 1
+        self._dispatch()
+    
+    def _dispatch(self):
+        """Grant slots to waiters in priority order whose host is ready."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        now = time.monotonic()
+        waiting = []
+        next_ready = None
+        while self._waiters:
+            entry = heapq.heappop(self._waiters)
+            _, _, host, granted = entry
+            if granted.done():
+                continue
+            state = self._host(host)
+            if state['open_until'] > now:
+                self.stats['rejected'] += 1
+                granted.set_exception(HostUnavailable(f"{host} is failing; circuit breaker open"))
+                continue
+            if state['open_until'] and not state['half_open']:
+                # Cooldown over: one trial request decides whether the breaker closes
+                state['half_open'] = True
+            
+            ready = self._ready_at(state, now)
+            trial_busy = state['half_open'] and state['active'] > 0
+            if self._active < self.max_concurrency and ready <= now and not trial_busy:
+                state['tokens'] -= 1
+                state['active'] += 1
+                self._active += 1
+                self.stats['granted'] += 1
+                granted.set_result(None)
+            else:
+                waiting.append(entry)
+                if ready > now:
+                    next_ready = ready if next_ready is None else min(next_ready, ready)
+        
+        for entry in waiting:
+            heapq.heappush(self._waiters, entry)
+        # Re-check when the earliest rate-limited host becomes ready
+        if waiting and next_ready is not None:
+            self._timer = asyncio.get_running_loop().call_later(next_ready - now, self._dispatch)
+    
+    def record(self, url: str, status: Optional[int] = None, retry_after: Optional[str] = None, error: bool = False) -> Optional[float]:
+        """Feed a fetch outcome back; returns the enforced delay for 429/503 responses."""
+        state = self._host(self.host_of(url))
+        now = time.monotonic()
+        delay = None
+        
+        if status in (429, 503):
+            # Without Retry-After back off exponentially on consecutive throttling
+            state['throttled'] += 1
+            delay = parse_retry_after(retry_after)
+            if delay is None:
+                delay = min(2.0 ** state['throttled'], self.max_retry_after)
+            state['blocked_until'] = max(state['blocked_until'], now + min(delay, self.max_retry_after))
+            self.stats['throttled'] += 1
+        
+        if error or (status is not None and status >= 500):
+            state['failures'] += 1
+            if state['half_open'] or state['failures'] >= self.breaker_threshold:
+                state['open_until'] = now + self.breaker_cooldown
+                state['half_open'] = False
+                self.stats['breaker_opened'] += 1
+                logger.warning(f"Circuit breaker opened for {self.host_of(url)} after {state['failures']} failures")
+        elif status is not None and status != 429:
+            state.update(failures=0, open_until=0.0, half_open=False)
+        if status is not None and status < 400:
+            state['throttled'] = 0
+        
+        self._dispatch()
+        return delay
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get counters and current load."""
+        now = time.monotonic()
+        return dict(
+            self.stats,
+            active=self._active,
+            waiting=sum(1 for entry in self._waiters if not entry[3].done()),
+            open_breakers=sorted(host for host, state in self._hosts.items() if state['open_until'] > now)
+        )
+
+
 class ContentProcessor:
     """Processes different types of content for storage with enhanced error handling."""
     
-    def __init__(self):
-        """Initialize content processor."""
+    def __init__(self, url_cache: Optional[FetchCache] = None):
+        """Initialize content processor (URL results are cached when url_cache is given)."""
         self.session = None
+        self.url_cache = url_cache
         try:
             self.config = get_config()
         except Exception as e:
@@ -48,9 +273,26 @@ class ContentProcessor:
             self.config = SimpleNamespace(
                 max_file_size_mb=50,
                 request_timeout=30,
-                max_retries=3
+                max_retries=3,
+                max_workers=4,
+                extraction_timeout=120,
+                extraction_max_jobs_per_worker=50,
+                url_max_download_mb=2,
+                url_max_text_chars=10000,
+                url_extractor='stream',
+                html_parser='lxml'
             )
         self._session_lock = asyncio.Lock()
+        # OCR and document/HTML parsing run in worker processes
+        self.extraction = ExtractionEngine.from_config(self.config)
+        # Every page fetch goes through the scheduler's per-host limits
+        self.scheduler = FetchScheduler.from_config(self.config)
+        # Page bodies are read up to this many bytes, and only until enough text is found
+        self.max_download_bytes = int(getattr(self.config, 'url_max_download_mb', 2) * 1024 * 1024)
+        self.max_text_chars = getattr(self.config, 'url_max_text_chars', 10000)
+        # 'stream' parses pages as they download; 'readability'/'basic' parse the whole (capped) page
+        self.url_extractor = getattr(self.config, 'url_extractor', 'stream')
+        self.html_parser = resolve_parser(getattr(self.config, 'html_parser', 'lxml'))
     
     async def _get_session(self):
         """Get or create aiohttp session with connection pooling."""
@@ -58,7 +300,7 @@ class ContentProcessor:
             if self.session is None or self.session.closed:
                 # Create session with connection pooling and timeouts
                 connector = aiohttp.TCPConnector(
-                    limit=10,  # Total connection pool size
+                    limit=self.scheduler.max_concurrency,  # Total connection pool size
                     limit_per_host=5,  # Max connections per host
                     ttl_dns_cache=300,  # DNS cache TTL
                     use_dns_cache=True,
@@ -84,8 +326,11 @@ class ContentProcessor:
             
             return self.session
     
-    async def process_text(self, text: str) -> Dict[str, Any]:
-        """Process text content, detecting URLs and extracting content with error handling."""
+    async def process_text(self, text: str, priority: int = PRIORITY_INTERACTIVE) -> Dict[str, Any]:
+        """Process text content, detecting URLs and extracting content with error handling.
+        
+        priority orders URL fetches when the scheduler is busy (lower first).
+        """
         try:
             # Validate input
             if not text or not text.strip():
@@ -99,7 +344,7 @@ class ContentProcessor:
             
             if urls:
                 # Process as URL with retry mechanism
-                return await self._process_url_with_retry(urls[0], text)
+                return await self._process_url_with_retry(urls[0], text, priority)
             else:
                 # Process as plain text
                 return {
@@ -140,13 +385,28 @@ class ContentProcessor:
         except Exception:
             return False
     
-    async def _process_url_with_retry(self, url: str, original_text: str) -> Dict[str, Any]:
-        """Process URL with retry mechanism and Tavily fallback."""
+    async def _process_url_with_retry(self, url: str, original_text: str, priority: int = PRIORITY_INTERACTIVE) -> Dict[str, Any]:
+        """Process URL with retry mechanism and Tavily fallback.
+        
+        Throttled fetches (429/503) are retried once the scheduler lets the
+        host be contacted again, without holding a fetch slot meanwhile;
+        network errors are retried with exponential backoff.
+        """
         last_error = None
         
         for attempt in range(self.config.max_retries):
             try:
-                return await self._process_url(url, original_text)
+                return await self._process_url(url, original_text, priority)
+            except HostUnavailable as e:
+                # Breaker open: another request now would only add load
+                logger.warning(f"Not fetching URL {url}: {e}")
+                return self._url_error_result(url, e, attempt + 1)
+            except RetryableFetchError as e:
+                last_error = e
+                if e.retry_after > self.scheduler.max_retry_after:
+                    logger.warning(f"URL {url} asked to retry after {e.retry_after:.0f}s, giving up for now")
+                    return self._url_error_result(url, e, attempt + 1)
+                logger.warning(f"URL processing attempt {attempt + 1} throttled, retrying after {e.retry_after:.1f}s")
             except Exception as e:
                 last_error = e
                 if attempt < self.config.max_retries - 1:
@@ -157,6 +417,10 @@ class ContentProcessor:
                 else:
                     logger.error(f"All {self.config.max_retries} attempts failed for URL {url}: {e}")
         
+        # Still throttled: more requests with other user agents would only add load
+        if isinstance(last_error, RetryableFetchError):
+            return self._url_error_result(url, last_error, self.config.max_retries)
+        
         # All retries failed - try enhanced extraction strategies as fallback
         logger.info(f"Attempting enhanced extraction fallback for URL: {url}")
         try:
@@ -165,15 +429,20 @@ class ContentProcessor:
             logger.error(f"Enhanced extraction fallback also failed for URL {url}: {enhanced_error}")
         
         # Final fallback
+        result = self._url_error_result(url, last_error, self.config.max_retries)
+        result['metadata']['enhanced_extraction_attempted'] = True
+        return result
+    
+    def _url_error_result(self, url: str, error: Exception, attempts: int) -> Dict[str, Any]:
+        """Result for a URL that could not be fetched."""
         return {
             'content_type': 'url',
             'extracted_info': f"Failed to process URL after all attempts and fallbacks: {url}",
             'metadata': {
                 'url': url,
-                'error': str(last_error),
-                'error_type': type(last_error).__name__,
-                'attempts': self.config.max_retries,
-                'enhanced_extraction_attempted': True,
+                'error': str(error),
+                'error_type': type(error).__name__,
+                'attempts': attempts,
                 'processed_at': datetime.now(timezone.utc).isoformat()
             }
         }
@@ -210,53 +479,21 @@ class ContentProcessor:
                         'Upgrade-Insecure-Requests': '1',
                     }
                     
-                    async with session.get(url, headers=headers, timeout=20) as response:
+                    async with self.scheduler.slot(url, PRIORITY_BACKGROUND), \
+                            session.get(url, headers=headers, timeout=20) as response:
+                        self.scheduler.record(url, response.status, response.headers.get('Retry-After'))
                         if response.status == 200:
-                            html = await response.text()
-                            
-                            # Use BeautifulSoup for better content extraction
-                            soup = BeautifulSoup(html, 'html.parser')
-                            
-                            # Extract title
-                            title = soup.find('title')
-                            title_text = title.get_text().strip() if title else "No title"
-                            
-                            # Try to find main content areas
-                            content_selectors = [
-                                'article', 'main', '[role="main"]', '.content', '.post-content',
-                                '.entry-content', '.article-content', '.story-body', '.post-body'
-                            ]
+                            html, _ = await self._read_capped(response)
                             
-                            main_content = None
-                            for selector in content_selectors:
-                                content_element = soup.select_one(selector)
-                                if content_element:
-                                    main_content = content_element
-                                    break
-                            
-                            # If no main content found, use body but remove unwanted elements
-                            if not main_content:
-                                main_content = soup.find('body') or soup
-                            
-                            # Remove unwanted elements
-                            for unwanted in main_content.find_all(['script', 'style', 'nav', 'footer', 'header', 'aside', '.sidebar', '.navigation', '.ad', '.advertisement']):
-                                unwanted.decompose()
-                            
-                            # Extract text
-                            text = main_content.get_text()
-                            
-                            # Clean up text
-                            lines = (line.strip() for line in text.splitlines())
-                            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-                            clean_text = ' '.join(chunk for chunk in chunks if chunk)
+                            # Parse off the event loop, keeping only the main content
+                            title_text, clean_text = await self.extraction.run(html_to_text, html, True, self.html_parser)
                             
                             if not clean_text.strip():
                                 continue  # Try next user agent
                             
                             # Limit text length
-                            max_length = 10000
-                            if len(clean_text) > max_length:
-                                clean_text = clean_text[:max_length] + "... [truncated by enhanced extraction]"
+                            if len(clean_text) > self.max_text_chars:
+                                clean_text = clean_text[:self.max_text_chars] + "... [truncated by enhanced extraction]"
                             
                             processing_time = (time.time() - start_time) * 1000
                             
@@ -276,7 +513,11 @@ class ContentProcessor:
                                 }
                             }
                 
+                except HostUnavailable:
+                    raise
                 except Exception as e:
+                    if isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError)):
+                        self.scheduler.record(url, error=True)
                     logger.debug(f"Enhanced extraction attempt with {user_agent[:50]}... failed: {e}")
                     continue
             
@@ -288,8 +529,50 @@ class ContentProcessor:
             logger.error(f"Enhanced fallback extraction failed for URL {url}: {e}")
             raise Exception(f"Enhanced extraction failed: {e}")
     
-    async def _process_url(self, url: str, original_text: str) -> Dict[str, Any]:
-        """Extract content from URL with enhanced error handling."""
+    async def _process_url(self, url: str, original_text: str, priority: int = PRIORITY_INTERACTIVE) -> Dict[str, Any]:
+        """Extract content from URL, through the fetch cache when one is configured."""
+        if self.url_cache is None or not self._is_url(url):
+            return await self._fetch_url(url, priority=priority)
+        
+        cache_key = canonicalize_url(url)
+        async with self.url_cache.lock(cache_key):
+            try:
+                cached = await self.url_cache.get(cache_key)
+            except sqlite3.Error as e:
+                logger.warning(f"URL cache lookup failed for {url}: {e}")
+                return await self._fetch_url(url, priority=priority)
+            if cached and cached['fresh']:
+                logger.debug(f"URL cache hit: {cache_key}")
+                return self._cached_url_result(cached, url, 'hit')
+            return await self._fetch_url(url, cache_key, cached, priority)
+    
+    def _cached_url_result(self, cached: Dict[str, Any], url: str, cache_status: str) -> Dict[str, Any]:
+        """Build a URL result from a cache entry."""
+        return {
+            'content_type': 'url',
+            'extracted_info': cached['result']['extracted_info'],
+            'metadata': dict(
+                cached['result']['metadata'],
+                url=url,
+                cache=cache_status,
+                cached_at=datetime.fromtimestamp(cached['fetched_at'], timezone.utc).isoformat()
+            )
+        }
+    
+    async def _fetch_url(
+        self,
+        url: str,
+        cache_key: Optional[str] = None,
+        cached: Optional[Dict[str, Any]] = None,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> Dict[str, Any]:
+        """Extract content from URL with enhanced error handling.
+        
+        With a stale cache entry the request is conditional, and a 304 (or a
+        network error) returns the cached result. Raises RetryableFetchError
+        on 429/503, HostUnavailable while the host's breaker is open, and
+        network errors when there is no cached copy to fall back on.
+        """
         start_time = time.time()
         
         try:
@@ -299,49 +582,66 @@ class ContentProcessor:
             
             session = await self._get_session()
             
+            # Revalidate a stale cache entry instead of downloading it again
+            headers = {}
+            if cached:
+                if cached['etag']:
+                    headers['If-None-Match'] = cached['etag']
+                if cached['last_modified']:
+                    headers['If-Modified-Since'] = cached['last_modified']
+            
             logger.debug(f"Fetching URL: {url}")
-            async with session.get(url) as response:
+            async with self.scheduler.slot(url, priority), session.get(url, headers=headers) as response:
                 processing_time = (time.time() - start_time) * 1000
+                retry_after = self.scheduler.record(url, response.status, response.headers.get('Retry-After'))
+                
+                if response.status == 304 and cached:
+                    await self.url_cache.revalidated(
+                        cache_key,
+                        etag=response.headers.get('ETag'),
+                        last_modified=response.headers.get('Last-Modified'),
+                        cache_control=response.headers.get('Cache-Control')
+                    )
+                    return self._cached_url_result(cached, url, 'revalidated')
+                
+                if (response.status >= 500 or response.status == 429) and cached:
+                    logger.warning(f"HTTP {response.status} revalidating URL {url}, serving cached copy")
+                    self.url_cache.stats['stale_served'] += 1
+                    return self._cached_url_result(cached, url, 'stale')
+                
+                if retry_after is not None:
+                    raise RetryableFetchError(f"HTTP {response.status} from {url}", retry_after)
                 
                 if response.status == 200:
-                    # Check content type
+                    # Check content type before downloading anything
                     content_type = response.headers.get('content-type', '').lower()
-                    if 'text/html' not in content_type and 'text/plain' not in content_type:
-                        logger.warning(f"Unexpected content type for URL {url}: {content_type}")
-                    
-                    html = await response.text()
-                    
-                    if not html.strip():
-                        raise ContentProcessingError("Empty response content")
-                    
-                    soup = BeautifulSoup(html, 'html.parser')
-                    
-                    # Extract title
-                    title = soup.find('title')
-                    title_text = title.get_text().strip() if title else "No title"
-                    
-                    # Extract main content (simple approach)
-                    # Remove script and style elements
-                    for script in soup(["script", "style", "nav", "footer", "header"]):
-                        script.decompose()
+                    mime_type = content_type.split(';')[0].strip()
+                    if mime_type and mime_type not in TEXT_CONTENT_TYPES:
+                        raise ContentProcessingError(f"Unsupported content type: {mime_type}")
                     
-                    # Get text
-                    text = soup.get_text()
-                    
-                    # Clean up text
-                    lines = (line.strip() for line in text.splitlines())
-                    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-                    clean_text = ' '.join(chunk for chunk in chunks if chunk)
+                    if self.url_extractor == 'stream':
+                        extractor, download = await self._stream_text(response, mime_type or 'text/html')
+                        if not download['bytes_read']:
+                            raise ContentProcessingError("Empty response content")
+                        title_text, clean_text = extractor.close()
+                        truncated = extractor.truncated
+                    else:
+                        html, download = await self._read_capped(response)
+                        if not html.strip():
+                            raise ContentProcessingError("Empty response content")
+                        title_text, clean_text = await self.extraction.run(
+                            html_to_text, html, self.url_extractor == 'readability', self.html_parser
+                        )
+                        truncated = len(clean_text) > self.max_text_chars
+                        clean_text = clean_text[:self.max_text_chars]
                     
                     if not clean_text.strip():
                         raise ContentProcessingError("No extractable text content found")
                     
-                    # Limit text length
-                    max_length = 10000  # Increased from 5000
-                    if len(clean_text) > max_length:
-                        clean_text = clean_text[:max_length] + "... [truncated]"
+                    if truncated or download['download_truncated']:
+                        clean_text += "... [truncated]"
                     
-                    return {
+                    result = {
                         'content_type': 'url',
                         'extracted_info': f"Title: {title_text}\n\nContent: {clean_text}",
                         'metadata': {
@@ -350,11 +650,15 @@ class ContentProcessor:
                             'status_code': response.status,
                             'content_type': content_type,
                             'content_length': len(clean_text),
-                            'original_size': len(html),
+                            'extractor': self.url_extractor,
+                            **download,
                             'processing_time_ms': round(processing_time, 2),
                             'processed_at': datetime.now(timezone.utc).isoformat()
                         }
                     }
+                    if cache_key:
+                        await self._cache_url_result(cache_key, result, response.headers)
+                    return result
                 else:
                     error_msg = f"HTTP {response.status}"
                     if response.status == 403:
@@ -379,20 +683,22 @@ class ContentProcessor:
                         }
                     }
         
-        except aiohttp.ClientError as e:
-            processing_time = (time.time() - start_time) * 1000
-            logger.error(f"Network error processing URL {url}: {e}")
-            return {
-                'content_type': 'url',
-                'extracted_info': f"Network error processing URL: {url} - {str(e)}",
-                'metadata': {
-                    'url': url,
-                    'error': str(e),
-                    'error_type': 'NetworkError',
-                    'processing_time_ms': round(processing_time, 2),
-                    'processed_at': datetime.now(timezone.utc).isoformat()
-                }
-            }
+        except HostUnavailable:
+            if cached:
+                self.url_cache.stats['stale_served'] += 1
+                return self._cached_url_result(cached, url, 'stale')
+            raise
+        except RetryableFetchError:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.scheduler.record(url, error=True)
+            if cached:
+                # Better a stale copy than an error while the site is unreachable
+                logger.warning(f"Network error revalidating URL {url}, serving cached copy: {e}")
+                self.url_cache.stats['stale_served'] += 1
+                return self._cached_url_result(cached, url, 'stale')
+            # Transient: the caller retries with backoff
+            raise
         except Exception as e:
             processing_time = (time.time() - start_time) * 1000
             logger.error(f"Error processing URL {url}: {e}")
@@ -408,6 +714,50 @@ class ContentProcessor:
                 }
             }
     
+    async def _stream_text(self, response, mime_type: str) -> Tuple[StreamingTextExtractor, Dict[str, Any]]:
+        """Parse a response body as it downloads, stopping once enough text is collected.
+        
+        Returns the extractor and download details. Leaving the body
+        unread closes the connection instead of draining it.
+        """
+        extractor = StreamingTextExtractor(mime_type, response.charset, self.max_text_chars)
+        truncated = False
+        async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+            remaining = self.max_download_bytes - extractor.bytes_fed
+            if extractor.feed(chunk[:remaining]):
+                break
+            if len(chunk) >= remaining:
+                logger.debug(f"Stopped reading {response.url} at {self.max_download_bytes} bytes")
+                truncated = True
+                break
+        return extractor, {'bytes_read': extractor.bytes_fed, 'charset': extractor.charset, 'download_truncated': truncated}
+    
+    async def _read_capped(self, response) -> Tuple[str, Dict[str, Any]]:
+        """Read and decode at most max_download_bytes of a response body."""
+        body = bytearray()
+        truncated = False
+        async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+            body += chunk[:self.max_download_bytes - len(body)]
+            if len(body) >= self.max_download_bytes:
+                truncated = True
+                break
+        charset = sniff_charset(bytes(body[:SNIFF_BYTES]), response.charset)
+        download = {'bytes_read': len(body), 'charset': charset, 'download_truncated': truncated}
+        return body.decode(charset, errors='replace'), download
+    
+    async def _cache_url_result(self, cache_key: str, result: Dict[str, Any], headers) -> None:
+        """Store a fetched URL result with its validators; cache errors are only logged."""
+        try:
+            await self.url_cache.put(
+                cache_key,
+                {'extracted_info': result['extracted_info'], 'metadata': result['metadata']},
+                etag=headers.get('ETag'),
+                last_modified=headers.get('Last-Modified'),
+                cache_control=headers.get('Cache-Control')
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to cache URL result for {cache_key}: {e}")
+    
     async def process_image(self, file) -> Dict[str, Any]:
         """Process image file with OCR and enhanced error handling."""
         start_time = time.time()
@@ -428,52 +778,7 @@ class ContentProcessor:
                 logger.debug(f"Downloading image to {tmp_file_path}")
                 await file.download_to_drive(tmp_file_path)
                 
-                # Validate file exists and has content
-                if not os.path.exists(tmp_file_path) or os.path.getsize(tmp_file_path) == 0:
-                    raise ContentProcessingError("Downloaded file is empty or missing")
-                
-                # Open image with PIL
-                try:
-                    image = Image.open(tmp_file_path)
-                    image.verify()  # Verify it's a valid image
-                    image = Image.open(tmp_file_path)  # Reopen after verify
-                except Exception as e:
-                    raise ContentProcessingError(f"Invalid image format: {e}")
-                
-                # Check image dimensions
-                width, height = image.size
-                if width < 10 or height < 10:
-                    raise ContentProcessingError(f"Image too small: {width}x{height}")
-                
-                # Perform OCR with error handling
-                try:
-                    logger.debug("Performing OCR on image")
-                    ocr_text = pytesseract.image_to_string(image, timeout=30)
-                except Exception as e:
-                    logger.warning(f"OCR failed: {e}")
-                    ocr_text = "[OCR processing failed]"
-                
-                # Get image metadata
-                format_info = image.format or "Unknown"
-                mode = image.mode
-                
-                processing_time = (time.time() - start_time) * 1000
-                
-                return {
-                    'content_type': 'image',
-                    'extracted_info': f"OCR Text: {ocr_text.strip()}" if ocr_text.strip() else "[No text detected in image]",
-                    'metadata': {
-                        'width': width,
-                        'height': height,
-                        'format': format_info,
-                        'mode': mode,
-                        'file_size': file.file_size,
-                        'has_text': bool(ocr_text.strip()),
-                        'ocr_length': len(ocr_text.strip()),
-                        'processing_time_ms': round(processing_time, 2),
-                        'processed_at': datetime.now(timezone.utc).isoformat()
-                    }
-                }
+                return await self.process_image_file(tmp_file_path, file.file_size, start_time=start_time)
         
         except ContentProcessingError:
             raise  # Re-raise our custom errors
@@ -514,13 +819,8 @@ class ContentProcessor:
             
             file_ext = Path(filename).suffix.lower()
             
-            # Validate file extension
-            supported_extensions = ['.pdf', '.docx', '.doc', '.xlsx', '.xls', '.txt']
-            if file_ext not in supported_extensions:
-                raise ContentProcessingError(
-                    f"Unsupported file type: {file_ext}. "
-                    f"Supported: {', '.join(supported_extensions)}"
-                )
+            # Validate file extension before downloading
+            self.check_document_extension(file_ext)
             
             # Download file to temporary location
             with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp_file:
@@ -529,40 +829,7 @@ class ContentProcessor:
                 logger.debug(f"Downloading document {filename} to {tmp_file_path}")
                 await file.download_to_drive(tmp_file_path)
                 
-                # Validate file exists and has content
-                if not os.path.exists(tmp_file_path) or os.path.getsize(tmp_file_path) == 0:
-                    raise ContentProcessingError("Downloaded file is empty or missing")
-                
-                # Extract content based on file type
-                if file_ext == '.pdf':
-                    content = self._extract_pdf_text(tmp_file_path)
-                elif file_ext in ['.docx', '.doc']:
-                    content = self._extract_word_text(tmp_file_path)
-                elif file_ext in ['.xlsx', '.xls']:
-                    content = self._extract_excel_text(tmp_file_path)
-                elif file_ext == '.txt':
-                    content = self._extract_txt_text(tmp_file_path)
-                else:
-                    raise ContentProcessingError(f"Unsupported file type: {file_ext}")
-                
-                # Validate extracted content
-                if not content or not content.strip():
-                    content = "[No extractable content found]"
-                
-                processing_time = (time.time() - start_time) * 1000
-                
-                return {
-                    'content_type': 'document',
-                    'extracted_info': content,
-                    'metadata': {
-                        'filename': filename,
-                        'file_extension': file_ext,
-                        'file_size': file.file_size,
-                        'content_length': len(content),
-                        'processing_time_ms': round(processing_time, 2),
-                        'processed_at': datetime.now(timezone.utc).isoformat()
-                    }
-                }
+                return await self.process_document_file(tmp_file_path, filename, file.file_size, start_time=start_time)
         
         except ContentProcessingError:
             raise  # Re-raise our custom errors
@@ -589,156 +856,84 @@ class ContentProcessor:
                 except Exception as e:
                     logger.warning(f"Failed to clean up temporary file {tmp_file_path}: {e}")
     
-    def _extract_txt_text(self, file_path: str) -> str:
-        """Extract text from plain text file."""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-                if not content.strip():
-                    raise ContentProcessingError("Text file is empty")
-                return content.strip()
-        except UnicodeDecodeError:
-            # Try with different encodings
-            encodings = ['latin-1', 'cp1252', 'iso-8859-1']
-            for encoding in encodings:
-                try:
-                    with open(file_path, 'r', encoding=encoding) as file:
-                        return file.read().strip()
-                except UnicodeDecodeError:
-                    continue
-            raise ContentProcessingError("Unable to decode text file with any supported encoding")
-        except Exception as e:
-            raise ContentProcessingError(f"Error reading text file: {e}")
-    
-    def _extract_pdf_text(self, file_path: str) -> str:
-        """Extract text from PDF file with enhanced error handling."""
-        try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PdfReader(file)
-                
-                if len(pdf_reader.pages) == 0:
-                    raise ContentProcessingError("PDF has no pages")
-                
-                text = ""
-                pages_processed = 0
-                
-                for page_num, page in enumerate(pdf_reader.pages):
-                    try:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text += f"[Page {page_num + 1}]\n{page_text}\n\n"
-                            pages_processed += 1
-                    except Exception as e:
-                        logger.warning(f"Failed to extract text from page {page_num + 1}: {e}")
-                        text += f"[Page {page_num + 1}: Error extracting text]\n\n"
-                
-                if not text.strip():
-                    raise ContentProcessingError("No extractable text found in PDF")
-                
-                logger.debug(f"Extracted text from {pages_processed}/{len(pdf_reader.pages)} pages")
-                return text.strip()
-                
-        except ContentProcessingError:
-            raise
-        except Exception as e:
-            raise ContentProcessingError(f"Error extracting PDF text: {e}")
+    async def process_image_file(self, file_path: str, file_size: Optional[int] = None, start_time: Optional[float] = None) -> Dict[str, Any]:
+        """OCR an image already on disk (a download or a stored blob)."""
+        start_time = start_time or time.time()
+        
+        # Validate file exists and has content
+        if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+            raise ContentProcessingError("Image file is empty or missing")
+        
+        # Validate and OCR the image in a worker process
+        logger.debug("Performing OCR on image")
+        image_info = await self.extraction.run(ocr_image, file_path)
+        ocr_text = image_info['ocr_text']
+        processing_time = (time.time() - start_time) * 1000
+        
+        return {
+            'content_type': 'image',
+            'extracted_info': f"OCR Text: {ocr_text.strip()}" if ocr_text.strip() else "[No text detected in image]",
+            'metadata': {
+                'width': image_info['width'],
+                'height': image_info['height'],
+                'format': image_info['format'],
+                'mode': image_info['mode'],
+                'file_size': file_size if file_size is not None else os.path.getsize(file_path),
+                'has_text': bool(ocr_text.strip()),
+                'ocr_length': len(ocr_text.strip()),
+                'processing_time_ms': round(processing_time, 2),
+                'processed_at': datetime.now(timezone.utc).isoformat()
+            }
+        }
     
-    def _extract_word_text(self, file_path: str) -> str:
-        """Extract text from Word document with enhanced error handling."""
-        try:
-            doc = Document(file_path)
-            text = ""
-            paragraphs_processed = 0
-            
-            # Extract paragraph text
-            for paragraph in doc.paragraphs:
-                para_text = paragraph.text.strip()
-                if para_text:
-                    text += para_text + "\n"
-                    paragraphs_processed += 1
-            
-            # Extract table text
-            tables_processed = 0
-            for table in doc.tables:
-                try:
-                    text += "\n[Table]\n"
-                    for row in table.rows:
-                        row_text = []
-                        for cell in row.cells:
-                            cell_text = cell.text.strip()
-                            row_text.append(cell_text)
-                        text += " | ".join(row_text) + "\n"
-                    text += "\n"
-                    tables_processed += 1
-                except Exception as e:
-                    logger.warning(f"Failed to extract table text: {e}")
-            
-            if not text.strip():
-                raise ContentProcessingError("No extractable text found in Word document")
-            
-            logger.debug(f"Extracted {paragraphs_processed} paragraphs and {tables_processed} tables")
-            return text.strip()
-            
-        except ContentProcessingError:
-            raise
-        except Exception as e:
-            raise ContentProcessingError(f"Error extracting Word text: {e}")
+    def check_document_extension(self, file_ext: str):
+        """Raise for document types we can't extract."""
+        if file_ext not in SUPPORTED_DOCUMENT_EXTENSIONS:
+            raise ContentProcessingError(
+                f"Unsupported file type: {file_ext}. "
+                f"Supported: {', '.join(SUPPORTED_DOCUMENT_EXTENSIONS)}"
+            )
     
-    def _extract_excel_text(self, file_path: str) -> str:
-        """Extract text from Excel file with enhanced error handling."""
-        try:
-            workbook = openpyxl.load_workbook(file_path, data_only=True)
-            
-            if not workbook.sheetnames:
-                raise ContentProcessingError("Excel file has no sheets")
-            
-            text = ""
-            sheets_processed = 0
-            
-            for sheet_name in workbook.sheetnames:
-                try:
-                    sheet = workbook[sheet_name]
-                    text += f"[Sheet: {sheet_name}]\n"
-                    
-                    rows_with_data = 0
-                    for row in sheet.iter_rows(values_only=True):
-                        # Skip completely empty rows
-                        if not any(cell is not None and str(cell).strip() for cell in row):
-                            continue
-                        
-                        row_text = "\t".join([
-                            str(cell).strip() if cell is not None else ""
-                            for cell in row
-                        ])
-                        
-                        if row_text.strip():
-                            text += row_text + "\n"
-                            rows_with_data += 1
-                    
-                    text += "\n"
-                    sheets_processed += 1
-                    logger.debug(f"Extracted {rows_with_data} rows from sheet '{sheet_name}'")
-                    
-                except Exception as e:
-                    logger.warning(f"Failed to extract text from sheet '{sheet_name}': {e}")
-                    text += f"[Error extracting sheet '{sheet_name}']\n\n"
-            
-            if not text.strip() or sheets_processed == 0:
-                raise ContentProcessingError("No extractable data found in Excel file")
-            
-            logger.debug(f"Processed {sheets_processed}/{len(workbook.sheetnames)} sheets")
-            return text.strip()
-            
-        except ContentProcessingError:
-            raise
-        except Exception as e:
-            raise ContentProcessingError(f"Error extracting Excel text: {e}")
+    async def process_document_file(self, file_path: str, filename: str, file_size: Optional[int] = None, start_time: Optional[float] = None) -> Dict[str, Any]:
+        """Extract text from a document already on disk; filename supplies the type."""
+        start_time = start_time or time.time()
+        file_ext = Path(filename).suffix.lower()
+        self.check_document_extension(file_ext)
+        
+        # Validate file exists and has content
+        if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+            raise ContentProcessingError("Document file is empty or missing")
+        
+        # Extract content based on file type in a worker process
+        content = await self.extraction.run(extract_document_text, file_path, file_ext)
+        
+        # Validate extracted content
+        if not content or not content.strip():
+            content = "[No extractable content found]"
+        
+        processing_time = (time.time() - start_time) * 1000
+        
+        return {
+            'content_type': 'document',
+            'extracted_info': content,
+            'metadata': {
+                'filename': filename,
+                'file_extension': file_ext,
+                'file_size': file_size if file_size is not None else os.path.getsize(file_path),
+                'content_length': len(content),
+                'processing_time_ms': round(processing_time, 2),
+                'processed_at': datetime.now(timezone.utc).isoformat()
+            }
+        }
     
     async def close(self):
         """Close the HTTP session and cleanup resources."""
         if self.session and not self.session.closed:
             await self.session.close()
             logger.debug("Closed aiohttp session")
+        self.extraction.close()
+        if self.url_cache is not None:
+            self.url_cache.close()
     
     async def __aenter__(self):
         """Async context manager entry."""
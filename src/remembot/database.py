@@ -3,26 +3,203 @@ Database manager for RememBot with FTS5 support and enhanced indexing.
 Handles SQLite operations and schema management.
 """
 
+import asyncio
+import base64
 import sqlite3
 import aiosqlite
 import logging
 import json
+import re
 import time
 from datetime import datetime, timezone
 from typing import Optional, List, Dict, Any, Tuple
 from pathlib import Path
 
+from .db_pool import ConnectionPool, StorageProfile
+from .parser_wakeup import ParserNotifier
+from .fingerprint import (
+    FINGERPRINT_VERSION, NEAR_DUPLICATE_DISTANCE, SIMHASH_BANDS,
+    content_fingerprint, hamming_distance, simhash, simhash_band_sql, simhash_bands
+)
+
 logger = logging.getLogger(__name__)
 
+class InvalidCursorError(ValueError):
+    """Raised when a page cursor is malformed or doesn't match the query ordering."""
+    pass
+
+
+# Bump when the FTS5 columns or triggers change; startup then rebuilds the index
+FTS_SCHEMA_VERSION = 1
+
+# Columns indexed by content_fts, as SQL expressions over a content_items row.
+# The source view and the triggers must produce identical values, otherwise
+# FTS5 'delete' commands won't match what was indexed.
+FTS_COLUMNS = {
+    'title': "CASE WHEN json_valid({p}metadata) "
+             "THEN COALESCE(json_extract({p}metadata, '$.title'), '') ELSE '' END",
+    'body': "COALESCE({p}extracted_info, '')",
+    'original_share': "COALESCE({p}original_share, '')",
+    'subjects': "CASE WHEN json_valid({p}taxonomy) "
+                "THEN COALESCE((SELECT group_concat(value, ' ') FROM json_each({p}taxonomy, '$.subjects')), '') "
+                "ELSE '' END",
+}
+
+# bm25() weights in FTS_COLUMNS order: title, body, original_share, subjects
+FTS_BM25_WEIGHTS = (8.0, 1.0, 2.0, 4.0)
+
+# Bump when the user_content_counts table or triggers change; startup recounts
+COUNTS_SCHEMA_VERSION = 1
+
+# Search totals stop counting here; a total above the cap means "more than"
+SEARCH_TOTAL_CAP = 1000
+
+# Bump when the user_stats/user_daily_activity rollups or triggers change
+STATS_SCHEMA_VERSION = 1
+
+# parse_status values tracked as per-user columns in user_stats
+PARSE_STATUSES = ('pending', 'processing', 'complete', 'error')
+
+# Items that fail (or lose their lease) this many times stay in 'error'
+MAX_PARSE_ATTEMPTS = 3
+
+# Bump when the blob refcount triggers change; startup recounts references
+BLOBS_SCHEMA_VERSION = 1
+
+# Semantic search vectors (float32 BLOBs, written by EmbeddingsManager), and the
+# deleted items whose vectors each process's vector indexes still have to drop
+EMBEDDINGS_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS content_embeddings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        content_item_id INTEGER NOT NULL,
+        embedding BLOB NOT NULL,
+        model_name TEXT NOT NULL,
+        text_hash TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (content_item_id) REFERENCES content_items (id),
+        UNIQUE(content_item_id, model_name)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS embedding_deletions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        content_item_id INTEGER NOT NULL,
+        user_telegram_id INTEGER NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_embedding_deletions_user ON embedding_deletions(user_telegram_id, id)',
+)
+
+# Current time as Unix epoch seconds, usable in triggers on older SQLite
+_SQL_NOW = "((julianday('now') - 2440587.5) * 86400.0)"
+
+# UPDATE ... RETURNING needs SQLite 3.35+
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Recompute the rollups from the base tables (startup seeding and repair)
+_COUNTS_REBUILD_SQL = (
+    'DELETE FROM user_content_counts',
+    '''
+    INSERT INTO user_content_counts (user_telegram_id, content_type, source_platform, item_count)
+    SELECT user_telegram_id, COALESCE(content_type, ''), COALESCE(source_platform, ''), COUNT(*)
+    FROM content_items
+    GROUP BY 1, 2, 3
+    ''',
+)
+_STATS_REBUILD_SQL = (
+    'DELETE FROM user_stats',
+    f'''
+    INSERT INTO user_stats (user_telegram_id, total_items, {', '.join(f'{s}_items' for s in PARSE_STATUSES)},
+                            processing_time_total_ms, processing_time_count)
+    SELECT user_telegram_id, COUNT(*), {', '.join(f"SUM(parse_status IS '{s}')" for s in PARSE_STATUSES)},
+           COALESCE(SUM(processing_time_ms), 0), COUNT(processing_time_ms)
+    FROM content_items
+    GROUP BY user_telegram_id
+    ''',
+    'DELETE FROM user_daily_activity',
+    '''
+    INSERT INTO user_daily_activity (user_telegram_id, day, items_added, searches)
+    SELECT user_telegram_id, day, SUM(items_added), SUM(searches) FROM (
+        SELECT user_telegram_id, DATE(created_at) AS day, 1 AS items_added, 0 AS searches
+        FROM content_items
+        UNION ALL
+        SELECT user_telegram_id, DATE(created_at), 0, 1
+        FROM user_activity WHERE action_type = 'search'
+    )
+    GROUP BY 1, 2
+    ''',
+)
+
+_BLOB_REFS_REBUILD_SQL = (
+    '''
+    UPDATE blobs SET ref_count = (
+        SELECT COUNT(*) FROM content_items WHERE content_items.blob_sha256 = blobs.sha256
+    )
+    ''',
+)
+
+
+def _item_signatures(
+    original_share: str,
+    content_type: Optional[str],
+    metadata: Optional[str],
+    extracted_info: Optional[str]
+) -> Tuple[Optional[str], Optional[int]]:
+    """Exact fingerprint and SimHash for an item's stored columns."""
+    try:
+        meta_dict = json.loads(metadata) if metadata else {}
+    except json.JSONDecodeError:
+        meta_dict = {}
+    if not isinstance(meta_dict, dict):
+        meta_dict = {}
+    # URLs and files only have comparable text once extracted
+    text = extracted_info or (original_share if content_type == 'text' else None)
+    return content_fingerprint(original_share, content_type, meta_dict), simhash(text)
+
+
+def _fts_values(prefix: str) -> str:
+    """Render the FTS column expressions for a row prefix ('new.', 'old.' or '')."""
+    return ', '.join(f"{expr.format(p=prefix)} AS {name}" if not prefix else expr.format(p=prefix)
+                     for name, expr in FTS_COLUMNS.items())
+
+
+def _build_fts_query(query: str) -> Optional[str]:
+    """Turn free text into a safe FTS5 query (quoted terms, prefix match on the last)."""
+    terms = re.findall(r'\w+', query.lower())
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _build_fts_any_query(phrases: List[str]) -> Optional[str]:
+    """FTS5 query matching any of several free-text phrases (each as _build_fts_query)."""
+    queries = list(dict.fromkeys(q for q in (_build_fts_query(phrase) for phrase in phrases) if q))
+    if not queries:
+        return None
+    return ' OR '.join(f'({query})' for query in queries)
+
 
 class DatabaseManager:
     """Manages SQLite database operations for RememBot with FTS5 support."""
     
-    def __init__(self, db_path: str):
+    def __init__(
+        self, 
+        db_path: str, 
+        pool_size: int = 4, 
+        storage_profile: Optional[StorageProfile] = None
+    ):
         """Initialize database manager."""
         self.db_path = db_path
-        self._connection_pool = None
+        self.storage_profile = storage_profile or StorageProfile()
+        self._fts5_available = False
         self._ensure_database_exists()
+        # Long-lived connections shared by every caller of this manager
+        self._pool = ConnectionPool(db_path, max_readers=pool_size, profile=self.storage_profile)
+        # Wakes background parsers when new pending items are committed
+        self._parser_notifier = ParserNotifier(db_path)
     
     def _ensure_database_exists(self):
         """Create database and tables if they don't exist."""
@@ -31,6 +208,9 @@ class DatabaseManager:
         
         # Create tables using synchronous connection for initialization
         with sqlite3.connect(self.db_path) as conn:
+            # Journal mode is persistent, so every process sees the same profile
+            journal_mode = self.storage_profile.apply(conn)
+            
             # Enable FTS5 extension if available
             try:
                 conn.execute("SELECT fts5('test')")
@@ -57,6 +237,10 @@ class DatabaseManager:
                     parse_status TEXT DEFAULT 'pending',
                     parse_error TEXT,
                     parse_attempts INTEGER DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires_at REAL,
+                    blob_sha256 TEXT,
+                    simhash INTEGER,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
@@ -69,7 +253,11 @@ class DatabaseManager:
                 'version': 'INTEGER DEFAULT 1',
                 'parse_status': 'TEXT DEFAULT \'pending\'',
                 'parse_error': 'TEXT',
-                'parse_attempts': 'INTEGER DEFAULT 0'
+                'parse_attempts': 'INTEGER DEFAULT 0',
+                'lease_owner': 'TEXT',
+                'lease_expires_at': 'REAL',
+                'blob_sha256': 'TEXT',
+                'simhash': 'INTEGER'
             }
             cursor = conn.execute("PRAGMA table_info(content_items)")
             existing_columns = {row[1] for row in cursor.fetchall()}
@@ -107,60 +295,53 @@ class DatabaseManager:
                 )
             ''')
             
-            # Create FTS5 table if available (controlled by feature flag)
-            # TODO: Fix FTS5 triggers with new schema in future update
-            ENABLE_FTS5 = False  # Feature flag to enable/disable FTS5
-            if ENABLE_FTS5 and fts5_available:
-                conn.execute('''
-                    CREATE VIRTUAL TABLE IF NOT EXISTS content_fts USING fts5(
-                        content_item_id UNINDEXED,
-                        title,
-                        extracted_info,
-                        tags,
-                        content=content_items,
-                        content_rowid=id
-                    )
-                ''')
-                
-                # Create triggers to keep FTS table in sync
-                conn.execute('''
-                    CREATE TRIGGER IF NOT EXISTS content_fts_insert AFTER INSERT ON content_items BEGIN
-                        INSERT INTO content_fts(content_item_id, extracted_info)
-                        VALUES (new.id, COALESCE(new.extracted_info, ''));
-                    END
-                ''')
-                
-                conn.execute('''
-                    CREATE TRIGGER IF NOT EXISTS content_fts_delete AFTER DELETE ON content_items BEGIN
-                        DELETE FROM content_fts WHERE content_item_id = old.id;
-                    END
-                ''')
-                
-                conn.execute('''
-                    CREATE TRIGGER IF NOT EXISTS content_fts_update AFTER UPDATE ON content_items BEGIN
-                        UPDATE content_fts 
-                        SET extracted_info = COALESCE(new.extracted_info, '')
-                        WHERE content_item_id = new.id;
-                    END
-                ''')
+            # Vectors for semantic search
+            for statement in EMBEDDINGS_SCHEMA:
+                conn.execute(statement)
             
             # Create indexes
             indexes = [
                 ('idx_user_telegram_id', 'content_items(user_telegram_id)'),
                 ('idx_content_type', 'content_items(content_type)'),
                 ('idx_created_at', 'content_items(created_at)'),
+                ('idx_user_created_id', 'content_items(user_telegram_id, created_at, id)'),
                 ('idx_updated_at', 'content_items(updated_at)'),
                 ('idx_source_platform', 'content_items(source_platform)'),
-                ('idx_content_hash', 'content_items(content_hash)'),
+                ('idx_user_content_hash', 'content_items(user_telegram_id, content_hash)'),
+                # Parse queue: claimable rows and leases that may need reclaiming
+                ('idx_parse_pending', "content_items(id) WHERE parse_status = 'pending'"),
+                ('idx_parse_leases', "content_items(lease_expires_at) WHERE parse_status = 'processing'"),
+                ('idx_content_blob', 'content_items(blob_sha256) WHERE blob_sha256 IS NOT NULL'),
                 ('idx_user_activity_user', 'user_activity(user_telegram_id)'),
                 ('idx_user_activity_created', 'user_activity(created_at)'),
                 ('idx_relationships_from', 'content_relationships(from_item_id)'),
                 ('idx_relationships_to', 'content_relationships(to_item_id)'),
             ]
             
+            # Near-duplicate lookup: one index per SimHash band
+            indexes += [
+                (f'idx_simhash_band{band}',
+                 f'content_items(user_telegram_id, {simhash_band_sql(band)}) WHERE simhash IS NOT NULL')
+                for band in range(SIMHASH_BANDS)
+            ]
+            
+            # Superseded by idx_user_content_hash
+            conn.execute('DROP INDEX IF EXISTS idx_content_hash')
             for index_name, index_def in indexes:
                 conn.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON {index_def}')
             
+            # Web authentication tokens
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS web_tokens (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_telegram_id INTEGER NOT NULL,
+                    token TEXT UNIQUE NOT NULL,
+                    expiry INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    used_at TIMESTAMP NULL
+                )
+            ''')
+            
             # Store FTS5 availability
             conn.execute('''
                 CREATE TABLE IF NOT EXISTS system_config (
@@ -175,21 +356,592 @@ class DatabaseManager:
                 VALUES ('fts5_available', ?)
             ''', (str(fts5_available),))
             
+            # Per-user item counters and statistics kept in sync by triggers
+            self._ensure_counts_schema(conn)
+            self._ensure_stats_schema(conn)
+            
+            # Stored image/document files, their references and cached extractions
+            self._ensure_blobs_schema(conn)
+            
+            # Create FTS5 index, view and sync triggers if available
+            if fts5_available:
+                self._ensure_fts_schema(conn)
+            
             conn.commit()
-            logger.info(f"Database initialized at {self.db_path} (FTS5: {fts5_available})")
+            
+            # Index rows that existed before the FTS table (resumable, in batches)
+            if fts5_available:
+                self._backfill_fts(conn)
+            
+            # Recompute fingerprints written by an older scheme (resumable, in batches)
+            self._backfill_fingerprints(conn)
+            
+            self._fts5_available = fts5_available
+            logger.info(f"Database initialized at {self.db_path} "
+                       f"(FTS5: {fts5_available}, journal: {journal_mode})")
     
-    async def _get_connection(self):
-        """Get database connection."""
-        return aiosqlite.connect(self.db_path)
+    def _ensure_fts_schema(self, conn: sqlite3.Connection):
+        """Create the external-content FTS5 table over content_fts_source."""
+        row = conn.execute(
+            "SELECT value FROM system_config WHERE key = 'fts_schema_version'"
+        ).fetchone()
+        if row and row[0] == str(FTS_SCHEMA_VERSION):
+            return
+        
+        logger.info(f"Creating FTS5 search index (schema version {FTS_SCHEMA_VERSION})")
+        
+        # Drop any earlier FTS schema, including the old content_item_id triggers
+        for trigger in ('content_fts_insert', 'content_fts_delete', 'content_fts_update',
+                        'content_fts_ai', 'content_fts_ad', 'content_fts_au'):
+            conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        conn.execute('DROP TABLE IF EXISTS content_fts')
+        conn.execute('DROP VIEW IF EXISTS content_fts_source')
+        
+        columns = ', '.join(FTS_COLUMNS)
+        conn.execute(f'''
+            CREATE VIEW content_fts_source AS
+            SELECT id, {_fts_values('')}
+            FROM content_items
+        ''')
+        conn.execute(f'''
+            CREATE VIRTUAL TABLE content_fts USING fts5(
+                {columns},
+                content='content_fts_source',
+                content_rowid='id',
+                tokenize='porter unicode61 remove_diacritics 2'
+            )
+        ''')
+        
+        # Rows between the backfill cursor and target are not indexed yet, so
+        # triggers must not issue 'delete' commands (or re-index) for them
+        indexed = (
+            "{p}id NOT BETWEEN "
+            "COALESCE((SELECT CAST(value AS INTEGER) FROM system_config WHERE key = 'fts_backfill_cursor'), 0) + 1 "
+            "AND COALESCE((SELECT CAST(value AS INTEGER) FROM system_config WHERE key = 'fts_backfill_target'), 0)"
+        )
+        conn.execute(f'''
+            CREATE TRIGGER content_fts_ai AFTER INSERT ON content_items BEGIN
+                INSERT INTO content_fts(rowid, {columns})
+                VALUES (new.id, {_fts_values('new.')});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER content_fts_ad AFTER DELETE ON content_items
+            WHEN {indexed.format(p='old.')} BEGIN
+                INSERT INTO content_fts(content_fts, rowid, {columns})
+                VALUES ('delete', old.id, {_fts_values('old.')});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER content_fts_au AFTER UPDATE OF original_share, metadata, extracted_info, taxonomy
+            ON content_items WHEN {indexed.format(p='old.')} BEGIN
+                INSERT INTO content_fts(content_fts, rowid, {columns})
+                VALUES ('delete', old.id, {_fts_values('old.')});
+                INSERT INTO content_fts(rowid, {columns})
+                VALUES (new.id, {_fts_values('new.')});
+            END
+        ''')
+        
+        # Queue every existing row for backfill
+        max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM content_items').fetchone()[0]
+        conn.executemany(
+            'INSERT OR REPLACE INTO system_config (key, value) VALUES (?, ?)',
+            [('fts_backfill_cursor', '0'), ('fts_backfill_target', str(max_id)),
+             ('fts_schema_version', str(FTS_SCHEMA_VERSION))]
+        )
+    
+    def _ensure_counts_schema(self, conn: sqlite3.Connection):
+        """Create user_content_counts and the triggers that maintain it."""
+        row = conn.execute(
+            "SELECT value FROM system_config WHERE key = 'counts_schema_version'"
+        ).fetchone()
+        if row and row[0] == str(COUNTS_SCHEMA_VERSION):
+            return
+        
+        logger.info(f"Creating per-user content counters (schema version {COUNTS_SCHEMA_VERSION})")
+        for trigger in ('content_counts_ai', 'content_counts_ad', 'content_counts_au'):
+            conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        conn.execute('DROP TABLE IF EXISTS user_content_counts')
+        
+        # NULL type/platform are stored as '' so they take part in the primary key
+        conn.execute('''
+            CREATE TABLE user_content_counts (
+                user_telegram_id INTEGER NOT NULL,
+                content_type TEXT NOT NULL,
+                source_platform TEXT NOT NULL,
+                item_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_telegram_id, content_type, source_platform)
+            ) WITHOUT ROWID
+        ''')
+        
+        increment = '''
+            INSERT INTO user_content_counts (user_telegram_id, content_type, source_platform, item_count)
+            VALUES (new.user_telegram_id, COALESCE(new.content_type, ''), COALESCE(new.source_platform, ''), 1)
+            ON CONFLICT (user_telegram_id, content_type, source_platform)
+            DO UPDATE SET item_count = item_count + 1;
+        '''
+        decrement = '''
+            UPDATE user_content_counts SET item_count = item_count - 1
+            WHERE user_telegram_id = old.user_telegram_id
+            AND content_type = COALESCE(old.content_type, '')
+            AND source_platform = COALESCE(old.source_platform, '');
+        '''
+        conn.execute(f'CREATE TRIGGER content_counts_ai AFTER INSERT ON content_items BEGIN {increment} END')
+        conn.execute(f'CREATE TRIGGER content_counts_ad AFTER DELETE ON content_items BEGIN {decrement} END')
+        conn.execute(f'''
+            CREATE TRIGGER content_counts_au AFTER UPDATE OF user_telegram_id, content_type, source_platform
+            ON content_items WHEN old.user_telegram_id IS NOT new.user_telegram_id
+                OR old.content_type IS NOT new.content_type
+                OR old.source_platform IS NOT new.source_platform
+            BEGIN {decrement} {increment} END
+        ''')
+        
+        # Seed from existing rows in the same transaction as the triggers
+        self._recount_content(conn)
+        conn.execute(
+            "INSERT OR REPLACE INTO system_config (key, value) VALUES ('counts_schema_version', ?)",
+            (str(COUNTS_SCHEMA_VERSION),)
+        )
+    
+    def _recount_content(self, conn: sqlite3.Connection):
+        """Recompute user_content_counts from content_items."""
+        for statement in _COUNTS_REBUILD_SQL:
+            conn.execute(statement)
+    
+    def _ensure_blobs_schema(self, conn: sqlite3.Connection):
+        """Create the blob tables and the triggers that keep ref_count in sync."""
+        # Rows describe files on disk, so these tables are never dropped
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                size_bytes INTEGER NOT NULL,
+                file_unique_id TEXT,
+                ref_count INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS blob_extractions (
+                sha256 TEXT NOT NULL,
+                extractor TEXT NOT NULL,
+                extracted_info TEXT,
+                metadata TEXT,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (sha256, extractor)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_blobs_file_unique_id ON blobs(file_unique_id) '
+            'WHERE file_unique_id IS NOT NULL'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced ON blobs(last_used_at) WHERE ref_count <= 0')
+        
+        row = conn.execute(
+            "SELECT value FROM system_config WHERE key = 'blobs_schema_version'"
+        ).fetchone()
+        if row and row[0] == str(BLOBS_SCHEMA_VERSION):
+            return
+        
+        logger.info(f"Creating blob reference triggers (schema version {BLOBS_SCHEMA_VERSION})")
+        for trigger in ('blob_refs_ai', 'blob_refs_ad', 'blob_refs_au'):
+            conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        
+        increment = f'''
+            UPDATE blobs SET ref_count = ref_count + 1, last_used_at = {_SQL_NOW}
+            WHERE sha256 = new.blob_sha256;
+        '''
+        # last_used_at starts the garbage collection grace period once unreferenced
+        decrement = f'''
+            UPDATE blobs SET ref_count = ref_count - 1, last_used_at = {_SQL_NOW}
+            WHERE sha256 = old.blob_sha256;
+        '''
+        conn.execute(f'''
+            CREATE TRIGGER blob_refs_ai AFTER INSERT ON content_items
+            WHEN new.blob_sha256 IS NOT NULL BEGIN {increment} END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER blob_refs_ad AFTER DELETE ON content_items
+            WHEN old.blob_sha256 IS NOT NULL BEGIN {decrement} END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER blob_refs_au AFTER UPDATE OF blob_sha256 ON content_items
+            WHEN old.blob_sha256 IS NOT new.blob_sha256
+            BEGIN {decrement} {increment} END
+        ''')
+        
+        for statement in _BLOB_REFS_REBUILD_SQL:
+            conn.execute(statement)
+        conn.execute(
+            "INSERT OR REPLACE INTO system_config (key, value) VALUES ('blobs_schema_version', ?)",
+            (str(BLOBS_SCHEMA_VERSION),)
+        )
+    
+    def _ensure_stats_schema(self, conn: sqlite3.Connection):
+        """Create the user_stats/user_daily_activity rollups and their triggers."""
+        row = conn.execute(
+            "SELECT value FROM system_config WHERE key = 'stats_schema_version'"
+        ).fetchone()
+        if row and row[0] == str(STATS_SCHEMA_VERSION):
+            return
+        
+        logger.info(f"Creating per-user statistics rollups (schema version {STATS_SCHEMA_VERSION})")
+        for trigger in ('user_stats_ai', 'user_stats_ad', 'user_stats_au', 'user_stats_search'):
+            conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        conn.execute('DROP TABLE IF EXISTS user_stats')
+        conn.execute('DROP TABLE IF EXISTS user_daily_activity')
+        
+        status_columns = [f'{status}_items' for status in PARSE_STATUSES]
+        conn.execute(f'''
+            CREATE TABLE user_stats (
+                user_telegram_id INTEGER PRIMARY KEY,
+                total_items INTEGER NOT NULL DEFAULT 0,
+                {' '.join(f'{col} INTEGER NOT NULL DEFAULT 0,' for col in status_columns)}
+                processing_time_total_ms REAL NOT NULL DEFAULT 0,
+                processing_time_count INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE user_daily_activity (
+                user_telegram_id INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                items_added INTEGER NOT NULL DEFAULT 0,
+                searches INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_telegram_id, day)
+            ) WITHOUT ROWID
+        ''')
+        
+        def delta(p: str, sign: int) -> str:
+            # Add (sign=1) or remove (sign=-1) one content_items row from the rollups
+            status_values = ', '.join(f"{sign} * ({p}parse_status IS '{s}')" for s in PARSE_STATUSES)
+            status_updates = ', '.join(f'{col} = {col} + excluded.{col}' for col in status_columns)
+            return f'''
+                INSERT INTO user_stats (user_telegram_id, total_items, {', '.join(status_columns)},
+                                        processing_time_total_ms, processing_time_count)
+                VALUES ({p}user_telegram_id, {sign}, {status_values},
+                        {sign} * COALESCE({p}processing_time_ms, 0), {sign} * ({p}processing_time_ms IS NOT NULL))
+                ON CONFLICT (user_telegram_id) DO UPDATE SET
+                    total_items = total_items + excluded.total_items, {status_updates},
+                    processing_time_total_ms = processing_time_total_ms + excluded.processing_time_total_ms,
+                    processing_time_count = processing_time_count + excluded.processing_time_count;
+                INSERT INTO user_daily_activity (user_telegram_id, day, items_added)
+                VALUES ({p}user_telegram_id, DATE({p}created_at), {sign})
+                ON CONFLICT (user_telegram_id, day) DO UPDATE SET items_added = items_added + excluded.items_added;
+            '''
+        
+        conn.execute(f"CREATE TRIGGER user_stats_ai AFTER INSERT ON content_items BEGIN {delta('new.', 1)} END")
+        conn.execute(f"CREATE TRIGGER user_stats_ad AFTER DELETE ON content_items BEGIN {delta('old.', -1)} END")
+        conn.execute(f'''
+            CREATE TRIGGER user_stats_au AFTER UPDATE OF user_telegram_id, parse_status, processing_time_ms, created_at
+            ON content_items WHEN old.user_telegram_id IS NOT new.user_telegram_id
+                OR old.parse_status IS NOT new.parse_status
+                OR old.processing_time_ms IS NOT new.processing_time_ms
+                OR old.created_at IS NOT new.created_at
+            BEGIN {delta('old.', -1)} {delta('new.', 1)} END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER user_stats_search AFTER INSERT ON user_activity
+            WHEN new.action_type = 'search' BEGIN
+                INSERT INTO user_daily_activity (user_telegram_id, day, searches)
+                VALUES (new.user_telegram_id, DATE(new.created_at), 1)
+                ON CONFLICT (user_telegram_id, day) DO UPDATE SET searches = searches + 1;
+            END
+        ''')
+        
+        for statement in _STATS_REBUILD_SQL:
+            conn.execute(statement)
+        conn.execute(
+            "INSERT OR REPLACE INTO system_config (key, value) VALUES ('stats_schema_version', ?)",
+            (str(STATS_SCHEMA_VERSION),)
+        )
+    
+    def _backfill_fts(self, conn: sqlite3.Connection, batch_size: int = 500) -> int:
+        """Index rows up to the backfill target, committing after each batch."""
+        def get_int(key):
+            row = conn.execute("SELECT value FROM system_config WHERE key = ?", (key,)).fetchone()
+            return int(row[0]) if row else 0
+        
+        cursor_id = get_int('fts_backfill_cursor')
+        target_id = get_int('fts_backfill_target')
+        indexed = 0
+        columns = ', '.join(FTS_COLUMNS)
+        
+        while cursor_id < target_id:
+            batch = conn.execute('''
+                SELECT id FROM content_items 
+                WHERE id > ? AND id <= ? 
+                ORDER BY id LIMIT ?
+            ''', (cursor_id, target_id, batch_size)).fetchall()
+            next_cursor = batch[-1][0] if batch else target_id
+            
+            conn.execute(f'''
+                INSERT INTO content_fts(rowid, {columns})
+                SELECT id, {columns} FROM content_fts_source 
+                WHERE id > ? AND id <= ?
+            ''', (cursor_id, next_cursor))
+            conn.execute(
+                "INSERT OR REPLACE INTO system_config (key, value) VALUES ('fts_backfill_cursor', ?)",
+                (str(next_cursor),)
+            )
+            conn.commit()
+            
+            indexed += len(batch)
+            cursor_id = next_cursor
+            logger.info(f"FTS5 backfill: indexed up to item {cursor_id}/{target_id}")
+        
+        return indexed
+    
+    def _backfill_fingerprints(self, conn: sqlite3.Connection, batch_size: int = 500) -> int:
+        """Recompute content_hash/simhash for rows from before FINGERPRINT_VERSION."""
+        values = dict(conn.execute(
+            "SELECT key, value FROM system_config WHERE key LIKE 'fingerprint_%'"
+        ).fetchall())
+        if values.get('fingerprint_version') != str(FINGERPRINT_VERSION):
+            max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM content_items').fetchone()[0]
+            conn.executemany(
+                'INSERT OR REPLACE INTO system_config (key, value) VALUES (?, ?)',
+                [('fingerprint_backfill_cursor', '0'), ('fingerprint_backfill_target', str(max_id)),
+                 ('fingerprint_version', str(FINGERPRINT_VERSION))]
+            )
+            conn.commit()
+            values = {'fingerprint_backfill_cursor': '0', 'fingerprint_backfill_target': str(max_id)}
+        
+        cursor_id = int(values.get('fingerprint_backfill_cursor', 0))
+        target_id = int(values.get('fingerprint_backfill_target', 0))
+        updated = 0
+        
+        while cursor_id < target_id:
+            batch = conn.execute('''
+                SELECT id, original_share, content_type, metadata, extracted_info FROM content_items
+                WHERE id > ? AND id <= ?
+                ORDER BY id LIMIT ?
+            ''', (cursor_id, target_id, batch_size)).fetchall()
+            next_cursor = batch[-1][0] if batch else target_id
+            
+            conn.executemany(
+                'UPDATE content_items SET content_hash = ?, simhash = ? WHERE id = ?',
+                [_item_signatures(*row[1:]) + (row[0],) for row in batch]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO system_config (key, value) VALUES ('fingerprint_backfill_cursor', ?)",
+                (str(next_cursor),)
+            )
+            conn.commit()
+            
+            updated += len(batch)
+            cursor_id = next_cursor
+            logger.info(f"Fingerprint backfill: updated up to item {cursor_id}/{target_id}")
+        
+        return updated
+    
+    async def close(self):
+        """Close pooled database connections."""
+        self._parser_notifier.close()
+        await self._pool.close()
+    
+    async def ping(self) -> bool:
+        """Check that the database answers a trivial query."""
+        async with self._pool.read() as db:
+            cursor = await db.execute("SELECT 1")
+            return (await cursor.fetchone())[0] == 1
+    
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """Get connection pool wait-time and utilization metrics."""
+        stats = self._pool.get_stats()
+        stats['storage_profile'] = self.storage_profile.as_dict()
+        return stats
+    
+    async def checkpoint(self, mode: str = 'PASSIVE') -> Dict[str, int]:
+        """Checkpoint the WAL into the main database file."""
+        return await self._pool.checkpoint(mode)
     
     async def is_fts5_available(self) -> bool:
         """Check if FTS5 is available."""
-        async with aiosqlite.connect(self.db_path) as db:
+        return self._fts5_available
+    
+    def _connect_sync(self) -> sqlite3.Connection:
+        """Open a synchronous connection with the storage profile applied."""
+        conn = sqlite3.connect(self.db_path, timeout=self.storage_profile.busy_timeout_ms / 1000)
+        for pragma in self.storage_profile.connection_pragmas():
+            conn.execute(pragma)
+        return conn
+    
+    async def rebuild_fts_index(self, batch_size: int = 500) -> int:
+        """Rebuild the FTS5 index online, re-indexing rows in committed batches."""
+        if not self._fts5_available:
+            raise RuntimeError("FTS5 is not available in this SQLite build")
+        
+        def rebuild():
+            conn = self._connect_sync()
+            try:
+                # Clearing the index and resetting the cursor happen atomically;
+                # triggers skip the pending range until the backfill reaches it
+                max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM content_items').fetchone()[0]
+                conn.execute("INSERT INTO content_fts(content_fts) VALUES ('delete-all')")
+                conn.executemany(
+                    'INSERT OR REPLACE INTO system_config (key, value) VALUES (?, ?)',
+                    [('fts_backfill_cursor', '0'), ('fts_backfill_target', str(max_id))]
+                )
+                conn.commit()
+                return self._backfill_fts(conn, batch_size)
+            finally:
+                conn.close()
+        
+        indexed = await asyncio.to_thread(rebuild)
+        logger.info(f"Rebuilt FTS5 index ({indexed} items)")
+        return indexed
+    
+    async def optimize_fts_index(self, merge_pages: Optional[int] = None):
+        """Merge FTS5 index segments, fully or incrementally with merge_pages."""
+        if not self._fts5_available:
+            raise RuntimeError("FTS5 is not available in this SQLite build")
+        
+        async with self._pool.write() as db:
+            if merge_pages:
+                # Incremental merge keeps each write transaction short
+                await db.execute(
+                    "INSERT INTO content_fts(content_fts, rank) VALUES ('merge', ?)", (merge_pages,)
+                )
+            else:
+                await db.execute("INSERT INTO content_fts(content_fts) VALUES ('optimize')")
+        logger.info(f"Optimized FTS5 index ({'merge ' + str(merge_pages) if merge_pages else 'full'})")
+    
+    async def get_fts_status(self) -> Dict[str, Any]:
+        """Get FTS5 index status and backfill progress."""
+        async with self._pool.read() as db:
+            cursor = await db.execute('''
+                SELECT key, value FROM system_config 
+                WHERE key IN ('fts_schema_version', 'fts_backfill_cursor', 'fts_backfill_target')
+            ''')
+            values = dict(await cursor.fetchall())
+        
+        cursor_id = int(values.get('fts_backfill_cursor', 0))
+        target_id = int(values.get('fts_backfill_target', 0))
+        return {
+            'available': self._fts5_available,
+            'schema_version': values.get('fts_schema_version'),
+            'backfill_complete': cursor_id >= target_id,
+            'backfill_cursor': cursor_id,
+            'backfill_target': target_id
+        }
+    
+    async def rebuild_user_stats(self) -> Dict[str, int]:
+        """Recompute the per-user counters and statistics rollups from scratch."""
+        async with self._pool.write() as db:
+            for statement in _COUNTS_REBUILD_SQL + _STATS_REBUILD_SQL:
+                await db.execute(statement)
+            cursor = await db.execute('''
+                SELECT (SELECT COUNT(*) FROM user_stats), (SELECT COUNT(*) FROM user_daily_activity)
+            ''')
+            users, days = await cursor.fetchone()
+        logger.info(f"Rebuilt user statistics ({users} users, {days} daily rows)")
+        return {'users': users, 'daily_rows': days}
+    
+    async def attach_blob(
+        self,
+        item_id: int,
+        sha256: str,
+        size_bytes: int,
+        file_unique_id: Optional[str] = None
+    ):
+        """Record a stored blob and point an item at it (the trigger counts the reference)."""
+        now = time.time()
+        async with self._pool.write() as db:
+            await db.execute('''
+                INSERT INTO blobs (sha256, size_bytes, file_unique_id, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (sha256) DO UPDATE SET
+                    file_unique_id = COALESCE(blobs.file_unique_id, excluded.file_unique_id),
+                    last_used_at = excluded.last_used_at
+            ''', (sha256, size_bytes, file_unique_id, now, now))
+            await db.execute(
+                'UPDATE content_items SET blob_sha256 = ? WHERE id = ? AND blob_sha256 IS NOT ?',
+                (sha256, item_id, sha256)
+            )
+    
+    async def find_blob_by_file_unique_id(self, file_unique_id: str) -> Optional[str]:
+        """Find an already-stored blob for a Telegram file_unique_id."""
+        async with self._pool.read() as db:
             cursor = await db.execute(
-                "SELECT value FROM system_config WHERE key = 'fts5_available'"
+                'SELECT sha256 FROM blobs WHERE file_unique_id = ? LIMIT 1', (file_unique_id,)
             )
-            result = await cursor.fetchone()
-            return result and result[0] == 'True'
+            row = await cursor.fetchone()
+        return row[0] if row else None
+    
+    async def get_blob_extraction(self, sha256: str, extractor: str) -> Optional[Dict[str, Any]]:
+        """Get a cached extraction result for a blob, or None."""
+        async with self._pool.read() as db:
+            cursor = await db.execute(
+                'SELECT extracted_info, metadata FROM blob_extractions WHERE sha256 = ? AND extractor = ?',
+                (sha256, extractor)
+            )
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+        return {'extracted_info': row[0], 'metadata': json.loads(row[1]) if row[1] else {}}
+    
+    async def store_blob_extraction(self, sha256: str, extractor: str, extracted_info: str, metadata: Optional[str] = None):
+        """Cache an extraction result for a blob."""
+        async with self._pool.write() as db:
+            await db.execute('''
+                INSERT OR REPLACE INTO blob_extractions (sha256, extractor, extracted_info, metadata, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (sha256, extractor, extracted_info, metadata, time.time()))
+    
+    async def get_blob_usage(self) -> Dict[str, int]:
+        """Get blob store totals from the blobs table."""
+        async with self._pool.read() as db:
+            cursor = await db.execute('''
+                SELECT COUNT(*), COALESCE(SUM(size_bytes), 0),
+                       COALESCE(SUM(ref_count <= 0), 0),
+                       COALESCE(SUM(CASE WHEN ref_count <= 0 THEN size_bytes ELSE 0 END), 0),
+                       (SELECT COUNT(*) FROM blob_extractions)
+                FROM blobs
+            ''')
+            blobs, size_bytes, unreferenced, unreferenced_bytes, extractions = await cursor.fetchone()
+        return {
+            'blobs': blobs,
+            'bytes': size_bytes,
+            'unreferenced': unreferenced,
+            'unreferenced_bytes': unreferenced_bytes,
+            'cached_extractions': extractions
+        }
+    
+    async def delete_unreferenced_blobs(self, older_than: float, limit: int = 500) -> List[str]:
+        """Delete rows (and cached extractions) of blobs unreferenced since older_than.
+        
+        Returns the digests whose files the caller should now remove.
+        """
+        async with self._pool.write() as db:
+            cursor = await db.execute('''
+                SELECT sha256 FROM blobs
+                WHERE ref_count <= 0 AND last_used_at < ?
+                ORDER BY last_used_at LIMIT ?
+            ''', (older_than, limit))
+            digests = [row[0] for row in await cursor.fetchall()]
+            if digests:
+                placeholders = ', '.join('?' * len(digests))
+                await db.execute(f'DELETE FROM blob_extractions WHERE sha256 IN ({placeholders})', digests)
+                await db.execute(f'DELETE FROM blobs WHERE sha256 IN ({placeholders})', digests)
+        return digests
+    
+    async def known_blobs(self, digests: List[str]) -> set:
+        """Return which of the given digests have a blobs row."""
+        if not digests:
+            return set()
+        async with self._pool.read() as db:
+            placeholders = ', '.join('?' * len(digests))
+            cursor = await db.execute(f'SELECT sha256 FROM blobs WHERE sha256 IN ({placeholders})', digests)
+            return {row[0] for row in await cursor.fetchall()}
+    
+    async def rebuild_blob_refs(self) -> int:
+        """Recompute blob ref_counts from content_items; returns the blob count."""
+        async with self._pool.write() as db:
+            for statement in _BLOB_REFS_REBUILD_SQL:
+                await db.execute(statement)
+            cursor = await db.execute('SELECT COUNT(*) FROM blobs')
+            (count,) = await cursor.fetchone()
+        return count
     
     async def store_content(
         self, 
@@ -202,41 +954,79 @@ class DatabaseManager:
         processing_time_ms: Optional[float] = None,
         parse_status: str = 'pending'
     ) -> int:
-        """Store a content item in the database with enhanced metadata."""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Parse metadata to extract additional fields
-            source_platform = None
-            content_hash = None
-            
-            if metadata:
-                try:
-                    meta_dict = json.loads(metadata)
-                    # Detect source platform from URL or metadata
-                    if 'url' in meta_dict:
-                        source_platform = self._detect_source_platform(meta_dict['url'])
-                    # Generate content hash for duplicate detection
-                    content_text = extracted_info or original_share
-                    content_hash = str(hash(content_text.strip().lower())) if content_text else None
-                except json.JSONDecodeError:
-                    logger.warning(f"Invalid metadata JSON for user {user_telegram_id}")
+        """Store a content item in the database with enhanced metadata.
+        
+        A pending item whose fingerprint matches one of the user's already
+        parsed items is linked to it as a duplicate and stored complete with
+        its extracted content, so it isn't fetched and classified again.
+        """
+        # Parse metadata to extract additional fields
+        source_platform = None
+        if metadata:
+            try:
+                meta_dict = json.loads(metadata)
+                # Detect source platform from URL or metadata
+                if 'url' in meta_dict:
+                    source_platform = self._detect_source_platform(meta_dict['url'])
+            except json.JSONDecodeError:
+                logger.warning(f"Invalid metadata JSON for user {user_telegram_id}")
+        
+        # Fingerprints for duplicate detection (SimHash can be slow on long texts)
+        content_hash, signature = await asyncio.to_thread(
+            _item_signatures, original_share, content_type, metadata, extracted_info
+        )
+        blob_sha256 = None
+        duplicate_of = None
+        
+        async with self._pool.write() as db:
+            if parse_status == 'pending' and content_hash:
+                cursor = await db.execute('''
+                    SELECT id, extracted_info, taxonomy, simhash, blob_sha256 FROM content_items
+                    WHERE user_telegram_id = ? AND content_hash = ? AND parse_status = 'complete'
+                    ORDER BY id LIMIT 1
+                ''', (user_telegram_id, content_hash))
+                original = await cursor.fetchone()
+                if original:
+                    duplicate_of = original[0]
+                    extracted_info = extracted_info or original[1]
+                    taxonomy = taxonomy or original[2]
+                    signature = original[3] if signature is None else signature
+                    blob_sha256 = original[4]
+                    parse_status = 'complete'
             
             cursor = await db.execute('''
                 INSERT INTO content_items 
                 (user_telegram_id, original_share, content_type, metadata, extracted_info, 
-                 taxonomy, source_platform, processing_time_ms, content_hash, parse_status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                 taxonomy, source_platform, processing_time_ms, content_hash, parse_status,
+                 simhash, blob_sha256)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (user_telegram_id, original_share, content_type, metadata, extracted_info, 
-                  taxonomy, source_platform, processing_time_ms, content_hash, parse_status))
+                  taxonomy, source_platform, processing_time_ms, content_hash, parse_status,
+                  signature, blob_sha256))
             
-            await db.commit()
             item_id = cursor.lastrowid
             
+            if duplicate_of is not None:
+                await db.execute('''
+                    INSERT OR IGNORE INTO content_relationships
+                    (from_item_id, to_item_id, relationship_type, confidence_score)
+                    VALUES (?, ?, 'duplicate', 1.0)
+                ''', (item_id, duplicate_of))
+            
             # Log user activity
             await self._log_user_activity(db, user_telegram_id, 'store_content', item_id)
-            
+        
+        # Only after commit, otherwise a woken parser could miss the row
+        if parse_status == 'pending':
+            self._parser_notifier.notify()
+        
+        if duplicate_of is not None:
+            logger.info(f"Stored content item {item_id} for user {user_telegram_id} "
+                       f"as a duplicate of item {duplicate_of}")
+        else:
             logger.info(f"Stored content item {item_id} for user {user_telegram_id} "
                        f"(type: {content_type}, platform: {source_platform})")
-            return item_id
+        return item_id
     
     def _detect_source_platform(self, url: str) -> Optional[str]:
         """Detect source platform from URL."""
@@ -287,10 +1077,15 @@ class DatabaseManager:
         content_type: Optional[str] = None,
         source_platform: Optional[str] = None,
         limit: int = 20,
-        offset: int = 0
+        offset: int = 0,
+        cursor: Optional[str] = None
     ) -> Tuple[List[Dict[str, Any]], int]:
-        """Get user's content items with filtering and pagination."""
-        async with aiosqlite.connect(self.db_path) as db:
+        """Get user's content items with filtering and pagination.
+        
+        Pass a cursor from page_cursor() for keyset pagination; offset is
+        ignored when a cursor is given.
+        """
+        async with self._pool.read() as db:
             # Build WHERE clause conditions
             where_conditions = ['user_telegram_id = ?']
             params = [user_telegram_id]
@@ -304,32 +1099,31 @@ class DatabaseManager:
                 where_conditions.append('source_platform = ?')
                 params.append(source_platform)
             
-            where_clause = ' AND '.join(where_conditions)
+            keyset, order, offset, backwards = self._keyset_clause(
+                cursor, 'time', 'created_at', 'id', offset
+            )
+            if keyset:
+                where_conditions.append(keyset[0])
+                params.extend(keyset[1])
             
             # Build main query
             main_query = f'''
                 SELECT id, original_share, content_type, metadata, extracted_info, 
                        taxonomy, source_platform, created_at
                 FROM content_items 
-                WHERE {where_clause}
-                ORDER BY created_at DESC LIMIT ? OFFSET ?
-            '''
-            
-            # Build count query using the same WHERE clause
-            count_query = f'''
-                SELECT COUNT(*)
-                FROM content_items 
-                WHERE {where_clause}
+                WHERE {' AND '.join(where_conditions)}
+                ORDER BY {order} LIMIT ? OFFSET ?
             '''
             
             # Execute queries
             main_params = params + [limit, offset]
-            cursor = await db.execute(main_query, main_params)
-            rows = await cursor.fetchall()
+            db_cursor = await db.execute(main_query, main_params)
+            rows = await db_cursor.fetchall()
+            if backwards:
+                rows.reverse()
             
-            # Get total count
-            cursor = await db.execute(count_query, params)
-            total = (await cursor.fetchone())[0]
+            # Total comes from the trigger-maintained counters, not COUNT(*)
+            total = await self._count_user_content(db, user_telegram_id, content_type, source_platform)
             
             # Convert to dictionaries
             columns = ['id', 'original_share', 'content_type', 'metadata', 'extracted_info', 
@@ -338,6 +1132,129 @@ class DatabaseManager:
             
             return results, total
     
+    async def _count_user_content(
+        self,
+        db: aiosqlite.Connection,
+        user_telegram_id: int,
+        content_type: Optional[str] = None,
+        source_platform: Optional[str] = None
+    ) -> int:
+        """Count a user's items from user_content_counts."""
+        where_conditions = ['user_telegram_id = ?']
+        params = [user_telegram_id]
+        if content_type:
+            where_conditions.append('content_type = ?')
+            params.append(content_type)
+        if source_platform:
+            where_conditions.append('source_platform = ?')
+            params.append(source_platform)
+        
+        cursor = await db.execute(f'''
+            SELECT COALESCE(SUM(item_count), 0) FROM user_content_counts
+            WHERE {' AND '.join(where_conditions)}
+        ''', params)
+        return (await cursor.fetchone())[0]
+    
+    async def _count_matches(
+        self,
+        db: aiosqlite.Connection,
+        from_clause: str,
+        params: list,
+        exact: bool,
+        seen: Optional[int] = None
+    ) -> int:
+        """Count search matches, stopping at SEARCH_TOTAL_CAP + 1 unless exact.
+        
+        seen is the row count of an un-cursored page that came back short,
+        which is already the full total (see _short_page_total).
+        """
+        if seen is not None:
+            return seen
+        if exact:
+            cursor = await db.execute(f'SELECT COUNT(*) {from_clause}', params)
+        else:
+            cursor = await db.execute(
+                f'SELECT COUNT(*) FROM (SELECT 1 {from_clause} LIMIT ?)', params + [SEARCH_TOTAL_CAP + 1]
+            )
+        return (await cursor.fetchone())[0]
+    
+    @staticmethod
+    def _short_page_total(rows: list, limit: int, offset: int, cursor: Optional[str]) -> Optional[int]:
+        """Total implied by a short offset page, or None if it must be counted."""
+        if cursor or len(rows) >= limit or (not rows and offset):
+            return None
+        return offset + len(rows)
+    
+    @staticmethod
+    def is_total_capped(total: int) -> bool:
+        """True when a search total stopped at SEARCH_TOTAL_CAP (show as "1000+")."""
+        return total > SEARCH_TOTAL_CAP
+    
+    @staticmethod
+    def page_cursor(row: Dict[str, Any], direction: str = 'after') -> str:
+        """Build an opaque cursor for the page after (or before) a result row."""
+        if direction not in ('after', 'before'):
+            raise ValueError(f"Unknown cursor direction: {direction}")
+        if row.get('rank') is not None:
+            payload = ['rank', direction, row['rank'], row['id']]
+        else:
+            payload = ['time', direction, row['created_at'], row['id']]
+        encoded = base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8'))
+        return encoded.decode('ascii').rstrip('=')
+    
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[str, str, Any, int]:
+        """Decode a page cursor into (kind, direction, sort value, id)."""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            kind, direction, value, item_id = json.loads(base64.urlsafe_b64decode(padded))
+        except (ValueError, TypeError) as e:
+            raise InvalidCursorError(f"Malformed page cursor: {e}")
+        if kind not in ('time', 'rank') or direction not in ('after', 'before') or not isinstance(item_id, int):
+            raise InvalidCursorError("Malformed page cursor")
+        return kind, direction, value, item_id
+    
+    def _keyset_clause(
+        self,
+        cursor: Optional[str],
+        kind: str,
+        sort_column: str,
+        id_column: str,
+        offset: int
+    ) -> Tuple[Optional[Tuple[str, list]], str, int, bool]:
+        """Build the keyset condition and ORDER BY for a cursor.
+        
+        Time pages sort newest first (sort DESC, id DESC); rank pages sort
+        best bm25 first (sort ASC, id DESC). Returns (condition, order,
+        offset, backwards) where backwards rows must be reversed after fetch.
+        """
+        sort_desc = kind == 'time'
+        forward_order = f"{sort_column} {'DESC' if sort_desc else 'ASC'}, {id_column} DESC"
+        if not cursor:
+            return None, forward_order, offset, False
+        
+        cursor_kind, direction, value, item_id = self._decode_cursor(cursor)
+        if cursor_kind != kind:
+            raise InvalidCursorError(f"Cursor for {cursor_kind} ordering used with {kind} ordering")
+        
+        backwards = direction == 'before'
+        # "after" walks in sort order; "before" walks the reverse order
+        id_op = '<' if not backwards else '>'
+        if sort_desc:
+            # Both keys descend, so a row-value comparison can seek the index
+            condition = (f"({sort_column}, {id_column}) {id_op} (?, ?)", [value, item_id])
+        else:
+            sort_op = '>' if not backwards else '<'
+            condition = (
+                f"({sort_column} {sort_op} ? OR ({sort_column} = ? AND {id_column} {id_op} ?))",
+                [value, value, item_id]
+            )
+        if backwards:
+            order = f"{sort_column} {'ASC' if sort_desc else 'DESC'}, {id_column} ASC"
+        else:
+            order = forward_order
+        return condition, order, 0, backwards
+    
     async def search_content(
         self, 
         user_telegram_id: int, 
@@ -345,48 +1262,69 @@ class DatabaseManager:
         content_type: Optional[str] = None,
         source_platform: Optional[str] = None,
         limit: int = 10,
-        offset: int = 0
-    ) -> Tuple[List[Dict[str, Any]], int]:
-        """Search for content items with FTS5 support and ranking."""
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        exact_total: bool = False,
+        include_total: bool = True
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Search for content items with FTS5 support and ranking.
+        
+        Totals stop counting past SEARCH_TOTAL_CAP (see is_total_capped)
+        unless exact_total is set. Without include_total no count query runs
+        and the total is None.
+        """
         # If no search query, just get user content
         if not query or not query.strip():
-            return await self.get_user_content(user_telegram_id, content_type, source_platform, limit, offset)
+            return await self.get_user_content(
+                user_telegram_id, content_type, source_platform, limit, offset, cursor
+            )
         
         start_time = time.time()
         
-        async with aiosqlite.connect(self.db_path) as db:
-            # Log search activity
+        # Log search activity
+        async with self._pool.write() as db:
             await self._log_user_activity(db, user_telegram_id, 'search', query=query)
-            
-            fts5_available = await self.is_fts5_available()
-            
+        
+        fts5_available = await self.is_fts5_available()
+        use_fts = fts5_available and len(query.strip()) > 2
+        
+        async with self._pool.read() as db:
             try:
-                if fts5_available and len(query.strip()) > 2:
+                if use_fts:
                     # Use FTS5 for advanced search
                     results, total = await self._search_with_fts5(
-                        db, user_telegram_id, query, content_type, source_platform, limit, offset
+                        db, user_telegram_id, query, content_type, source_platform, limit, offset, cursor,
+                        exact_total, include_total
                     )
                 else:
                     # Fallback to basic LIKE search
                     results, total = await self._search_with_like(
-                        db, user_telegram_id, query, content_type, source_platform, limit, offset
+                        db, user_telegram_id, query, content_type, source_platform, limit, offset, cursor,
+                        exact_total, include_total
                     )
+            except InvalidCursorError:
+                raise
             except Exception as e:
+                if not use_fts:
+                    raise
                 logger.warning(f"FTS5 search failed, falling back to LIKE search: {e}")
-                # Fallback to basic LIKE search
+                # Fallback to basic LIKE search (rank cursors don't apply to it)
                 results, total = await self._search_with_like(
-                    db, user_telegram_id, query, content_type, source_platform, limit, offset
+                    db, user_telegram_id, query, content_type, source_platform, limit, offset,
+                    exact_total=exact_total, include_total=include_total
                 )
-            
-            search_time = (time.time() - start_time) * 1000
-            
-            # Update activity log with result count
+        
+        search_time = (time.time() - start_time) * 1000
+        
+        # Update activity log with result count
+        async with self._pool.write() as db:
             await self._log_user_activity(db, user_telegram_id, 'search_result', 
                                         result_count=len(results))
-            
-            logger.info(f"Found {len(results)}/{total} items for query '{query}' "
-                       f"by user {user_telegram_id} in {search_time:.1f}ms")
-            return results, total
+        
+        found = len(results) if total is None else f"{len(results)}/{total}"
+        logger.info(f"Found {found} items for query '{query}' "
+                   f"by user {user_telegram_id} in {search_time:.1f}ms")
+        return results, total
     
     async def _search_with_fts5(
         self, 
@@ -396,49 +1334,62 @@ class DatabaseManager:
         content_type: Optional[str] = None,
         source_platform: Optional[str] = None,
         limit: int = 10,
-        offset: int = 0
-    ) -> Tuple[List[Dict[str, Any]], int]:
-        """Search using FTS5 with ranking."""
-        # Prepare FTS5 query (escape special characters)
-        fts_query = query.replace('"', '""')
-        
-        # Build base query with JOIN to FTS5 table
-        base_query = '''
-            SELECT ci.id, ci.original_share, ci.content_type, ci.metadata, 
-                   ci.extracted_info, ci.taxonomy, ci.source_platform, ci.created_at,
-                   content_fts.rank
-            FROM content_items ci
-            JOIN content_fts ON ci.id = content_fts.content_item_id
-            WHERE ci.user_telegram_id = ? 
-            AND content_fts MATCH ?
-        '''
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        exact_total: bool = False,
+        include_total: bool = True
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Search using FTS5 with bm25 ranking."""
+        fts_query = _build_fts_query(query)
+        if fts_query is None:
+            return await self._search_with_like(
+                db, user_telegram_id, query, content_type, source_platform, limit, offset, cursor,
+                exact_total, include_total
+            )
         
-        params = [user_telegram_id, fts_query]
+        where_conditions = ['content_fts MATCH ?', 'ci.user_telegram_id = ?']
+        params = [fts_query, user_telegram_id]
         
         # Add optional filters
         if content_type:
-            base_query += ' AND ci.content_type = ?'
+            where_conditions.append('ci.content_type = ?')
             params.append(content_type)
         
         if source_platform:
-            base_query += ' AND ci.source_platform = ?'
+            where_conditions.append('ci.source_platform = ?')
             params.append(source_platform)
         
-        # Add ordering and pagination
-        query_with_order = base_query + ' ORDER BY content_fts.rank, ci.created_at DESC LIMIT ? OFFSET ?'
-        params.extend([limit, offset])
+        from_clause = f'''
+            FROM content_fts
+            JOIN content_items ci ON ci.id = content_fts.rowid
+            WHERE {' AND '.join(where_conditions)}
+        '''
+        weights = ', '.join(str(w) for w in FTS_BM25_WEIGHTS)
         
-        # Execute search query
-        cursor = await db.execute(query_with_order, params)
-        rows = await cursor.fetchall()
+        keyset, order, offset, backwards = self._keyset_clause(cursor, 'rank', 'rank', 'id', offset)
+        keyset_where = f'WHERE {keyset[0]}' if keyset else ''
         
-        # Get total count
-        count_query = base_query.replace(
-            'SELECT ci.id, ci.original_share, ci.content_type, ci.metadata, ci.extracted_info, ci.taxonomy, ci.source_platform, ci.created_at, cf.rank',
-            'SELECT COUNT(*)'
-        )
-        cursor = await db.execute(count_query, params[:-2])  # Exclude limit and offset
-        total = (await cursor.fetchone())[0]
+        # Execute search query (lower bm25 is a better match)
+        db_cursor = await db.execute(f'''
+            SELECT * FROM (
+                SELECT ci.id, ci.original_share, ci.content_type, ci.metadata, 
+                       ci.extracted_info, ci.taxonomy, ci.source_platform, ci.created_at,
+                       bm25(content_fts, {weights}) AS rank
+                {from_clause}
+            )
+            {keyset_where}
+            ORDER BY {order} LIMIT ? OFFSET ?
+        ''', params + (keyset[1] if keyset else []) + [limit, offset])
+        rows = await db_cursor.fetchall()
+        if backwards:
+            rows.reverse()
+        
+        # Get total count (capped unless exact_total)
+        total = None
+        if include_total:
+            total = await self._count_matches(
+                db, from_clause, params, exact_total, self._short_page_total(rows, limit, offset, cursor)
+            )
         
         # Convert to dictionaries
         columns = ['id', 'original_share', 'content_type', 'metadata', 'extracted_info', 
@@ -455,45 +1406,57 @@ class DatabaseManager:
         content_type: Optional[str] = None,
         source_platform: Optional[str] = None,
         limit: int = 10,
-        offset: int = 0
-    ) -> Tuple[List[Dict[str, Any]], int]:
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        exact_total: bool = False,
+        include_total: bool = True
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
         """Fallback search using LIKE operator."""
         search_term = f"%{query}%"
         
-        base_query = '''
-            SELECT id, original_share, content_type, metadata, extracted_info, 
-                   taxonomy, source_platform, created_at
-            FROM content_items 
-            WHERE user_telegram_id = ? 
-            AND (extracted_info LIKE ? OR original_share LIKE ?)
-        '''
-        
+        where_conditions = [
+            'user_telegram_id = ?',
+            '(extracted_info LIKE ? OR original_share LIKE ?)'
+        ]
         params = [user_telegram_id, search_term, search_term]
         
         # Add optional filters
         if content_type:
-            base_query += ' AND content_type = ?'
+            where_conditions.append('content_type = ?')
             params.append(content_type)
         
         if source_platform:
-            base_query += ' AND source_platform = ?'
+            where_conditions.append('source_platform = ?')
             params.append(source_platform)
         
-        # Add ordering and pagination
-        query_with_order = base_query + ' ORDER BY created_at DESC LIMIT ? OFFSET ?'
-        params.extend([limit, offset])
+        count_from = f"FROM content_items WHERE {' AND '.join(where_conditions)}"
+        count_params = list(params)
+        
+        keyset, order, offset, backwards = self._keyset_clause(
+            cursor, 'time', 'created_at', 'id', offset
+        )
+        if keyset:
+            where_conditions.append(keyset[0])
+            params.extend(keyset[1])
         
         # Execute search query
-        cursor = await db.execute(query_with_order, params)
-        rows = await cursor.fetchall()
+        db_cursor = await db.execute(f'''
+            SELECT id, original_share, content_type, metadata, extracted_info, 
+                   taxonomy, source_platform, created_at
+            FROM content_items 
+            WHERE {' AND '.join(where_conditions)}
+            ORDER BY {order} LIMIT ? OFFSET ?
+        ''', params + [limit, offset])
+        rows = await db_cursor.fetchall()
+        if backwards:
+            rows.reverse()
         
-        # Get total count
-        count_query = base_query.replace(
-            'SELECT id, original_share, content_type, metadata, extracted_info, taxonomy, source_platform, created_at',
-            'SELECT COUNT(*)'
-        )
-        cursor = await db.execute(count_query, params[:-2])  # Exclude limit and offset
-        total = (await cursor.fetchone())[0]
+        # Get total count (capped unless exact_total)
+        total = None
+        if include_total:
+            total = await self._count_matches(
+                db, count_from, count_params, exact_total, self._short_page_total(rows, limit, offset, cursor)
+            )
         
         # Convert to dictionaries  
         columns = ['id', 'original_share', 'content_type', 'metadata', 'extracted_info', 
@@ -502,85 +1465,114 @@ class DatabaseManager:
         
         return results, total
     
+    async def search_any_terms(
+        self,
+        user_telegram_id: int,
+        terms: List[str],
+        limit: int = 10
+    ) -> List[Dict[str, Any]]:
+        """Items matching any of several search terms, best first, in one query.
+        
+        With FTS5 the terms become one OR expression ranked by bm25;
+        otherwise items are ranked by how many terms they contain. Unlike
+        search_content it logs no activity and counts no total.
+        """
+        terms = [term.strip() for term in terms if isinstance(term, str) and term.strip()]
+        if not terms:
+            return []
+        
+        columns = ['id', 'original_share', 'content_type', 'metadata', 'extracted_info',
+                  'taxonomy', 'source_platform', 'created_at']
+        fts_query = _build_fts_any_query(terms) if await self.is_fts5_available() else None
+        
+        async with self._pool.read() as db:
+            if fts_query is not None:
+                try:
+                    weights = ', '.join(str(w) for w in FTS_BM25_WEIGHTS)
+                    db_cursor = await db.execute(f'''
+                        SELECT ci.id, ci.original_share, ci.content_type, ci.metadata,
+                               ci.extracted_info, ci.taxonomy, ci.source_platform, ci.created_at,
+                               bm25(content_fts, {weights}) AS rank
+                        FROM content_fts
+                        JOIN content_items ci ON ci.id = content_fts.rowid
+                        WHERE content_fts MATCH ? AND ci.user_telegram_id = ?
+                        ORDER BY rank, ci.id LIMIT ?
+                    ''', (fts_query, user_telegram_id, limit))
+                    return [dict(zip(columns + ['rank'], row)) for row in await db_cursor.fetchall()]
+                except Exception as e:
+                    logger.warning(f"FTS5 multi-term search failed, falling back to LIKE search: {e}")
+            
+            # Score = number of terms found in the item
+            matches = ['(extracted_info LIKE ? OR original_share LIKE ?)'] * len(terms)
+            like_params = [pattern for term in terms for pattern in (f"%{term}%",) * 2]
+            db_cursor = await db.execute(f'''
+                SELECT {', '.join(columns)}, ({' + '.join(matches)}) AS matched_terms
+                FROM content_items
+                WHERE user_telegram_id = ? AND ({' OR '.join(matches)})
+                ORDER BY matched_terms DESC, created_at DESC, id DESC
+                LIMIT ?
+            ''', like_params + [user_telegram_id] + like_params + [limit])
+            return [dict(zip(columns, row[:-1])) for row in await db_cursor.fetchall()]
+    
     async def get_user_stats(self, user_telegram_id: int) -> Dict[str, Any]:
-        """Get comprehensive statistics for a user's stored content."""
-        async with aiosqlite.connect(self.db_path) as db:
+        """Get comprehensive statistics for a user's stored content.
+        
+        Reads the trigger-maintained rollups (user_stats, user_content_counts,
+        user_daily_activity); recent windows are counted in whole UTC days.
+        """
+        async with self._pool.read() as db:
             stats = {}
             
-            # Total items
-            cursor = await db.execute('''
-                SELECT COUNT(*) FROM content_items WHERE user_telegram_id = ?
-            ''', (user_telegram_id,))
-            stats['total_items'] = (await cursor.fetchone())[0]
-            
-            # Items by type
-            cursor = await db.execute('''
-                SELECT content_type, COUNT(*) 
-                FROM content_items 
-                WHERE user_telegram_id = ? 
-                GROUP BY content_type
-                ORDER BY COUNT(*) DESC
-            ''', (user_telegram_id,))
-            stats['items_by_type'] = dict(await cursor.fetchall())
-            
-            # Items by source platform
-            cursor = await db.execute('''
-                SELECT COALESCE(source_platform, 'unknown') as platform, COUNT(*) 
-                FROM content_items 
-                WHERE user_telegram_id = ? 
-                GROUP BY source_platform
-                ORDER BY COUNT(*) DESC
+            # Totals, parse status and processing time from the user_stats row
+            status_columns = [f'{status}_items' for status in PARSE_STATUSES]
+            cursor = await db.execute(f'''
+                SELECT total_items, {', '.join(status_columns)}, processing_time_total_ms, processing_time_count
+                FROM user_stats WHERE user_telegram_id = ?
             ''', (user_telegram_id,))
-            stats['items_by_platform'] = dict(await cursor.fetchall())
+            row = await cursor.fetchone() or (0,) * (len(status_columns) + 3)
+            stats['total_items'] = row[0]
+            stats['items_by_status'] = dict(zip(PARSE_STATUSES, row[1:-2]))
+            time_total, time_count = row[-2:]
+            stats['avg_processing_time_ms'] = round(time_total / time_count, 2) if time_count else None
             
-            # Recent activity (last 7 days)
+            # Items by type and source platform
             cursor = await db.execute('''
-                SELECT COUNT(*) 
-                FROM content_items 
-                WHERE user_telegram_id = ? 
-                AND created_at >= datetime('now', '-7 days')
+                SELECT content_type, source_platform, item_count
+                FROM user_content_counts 
+                WHERE user_telegram_id = ? AND item_count > 0
             ''', (user_telegram_id,))
-            stats['recent_items'] = (await cursor.fetchone())[0]
+            items_by_type = {}
+            items_by_platform = {}
+            for content_type, source_platform, count in await cursor.fetchall():
+                content_type = content_type or None
+                platform = source_platform or 'unknown'
+                items_by_type[content_type] = items_by_type.get(content_type, 0) + count
+                items_by_platform[platform] = items_by_platform.get(platform, 0) + count
             
-            # Content growth over time (last 30 days)
-            cursor = await db.execute('''
-                SELECT DATE(created_at) as date, COUNT(*) as count
-                FROM content_items 
-                WHERE user_telegram_id = ? 
-                AND created_at >= datetime('now', '-30 days')
-                GROUP BY DATE(created_at)
-                ORDER BY date
-            ''', (user_telegram_id,))
-            stats['daily_activity'] = dict(await cursor.fetchall())
-            
-            # Search activity
-            cursor = await db.execute('''
-                SELECT COUNT(*) 
-                FROM user_activity 
-                WHERE user_telegram_id = ? 
-                AND action_type = 'search'
-                AND created_at >= datetime('now', '-7 days')
-            ''', (user_telegram_id,))
-            stats['recent_searches'] = (await cursor.fetchone())[0]
+            stats['items_by_type'] = dict(sorted(items_by_type.items(), key=lambda kv: -kv[1]))
+            stats['items_by_platform'] = dict(sorted(items_by_platform.items(), key=lambda kv: -kv[1]))
             
-            # Average processing time
+            # Content growth and search activity (last 30 / 7 days) from the histogram
             cursor = await db.execute('''
-                SELECT AVG(processing_time_ms) 
-                FROM content_items 
-                WHERE user_telegram_id = ? 
-                AND processing_time_ms IS NOT NULL
+                SELECT day, items_added, searches, day >= DATE('now', '-7 days')
+                FROM user_daily_activity 
+                WHERE user_telegram_id = ? AND day >= DATE('now', '-30 days')
+                ORDER BY day
             ''', (user_telegram_id,))
-            avg_time = (await cursor.fetchone())[0]
-            stats['avg_processing_time_ms'] = round(avg_time, 2) if avg_time else None
+            histogram = await cursor.fetchall()
+            stats['daily_activity'] = {day: added for day, added, _, _ in histogram if added > 0}
+            stats['recent_items'] = sum(added for _, added, _, recent in histogram if recent)
+            stats['recent_searches'] = sum(searches for _, _, searches, recent in histogram if recent)
             
             return stats
     
     async def get_content_by_id(self, user_telegram_id: int, content_id: int) -> Optional[Dict[str, Any]]:
         """Get a specific content item by ID."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._pool.read() as db:
             cursor = await db.execute('''
                 SELECT id, original_share, content_type, metadata, extracted_info, 
-                       taxonomy, source_platform, processing_time_ms, created_at, updated_at
+                       taxonomy, source_platform, processing_time_ms, parse_status, content_hash,
+                       created_at, updated_at
                 FROM content_items 
                 WHERE id = ? AND user_telegram_id = ?
             ''', (content_id, user_telegram_id))
@@ -600,7 +1592,7 @@ class DatabaseManager:
         taxonomy: Optional[str] = None
     ) -> bool:
         """Update an existing content item."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._pool.write() as db:
             # Check if item exists and belongs to user
             cursor = await db.execute('''
                 SELECT id, version FROM content_items 
@@ -623,8 +1615,6 @@ class DatabaseManager:
                 WHERE id = ? AND user_telegram_id = ?
             ''', (extracted_info, taxonomy, content_id, user_telegram_id))
             
-            await db.commit()
-            
             # Log activity
             await self._log_user_activity(db, user_telegram_id, 'update_content', content_id)
             
@@ -634,16 +1624,25 @@ class DatabaseManager:
     
     async def delete_content(self, user_telegram_id: int, content_id: int) -> bool:
         """Delete a content item."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._pool.write() as db:
             cursor = await db.execute('''
                 DELETE FROM content_items 
                 WHERE id = ? AND user_telegram_id = ?
             ''', (content_id, user_telegram_id))
             
-            await db.commit()
             deleted = cursor.rowcount > 0
             
             if deleted:
+                await db.execute(
+                    'DELETE FROM content_relationships WHERE from_item_id = ? OR to_item_id = ?',
+                    (content_id, content_id)
+                )
+                await db.execute('DELETE FROM content_embeddings WHERE content_item_id = ?', (content_id,))
+                # Loaded vector indexes (in any process) drop the item on their next sync
+                await db.execute(
+                    'INSERT INTO embedding_deletions (content_item_id, user_telegram_id) VALUES (?, ?)',
+                    (content_id, user_telegram_id)
+                )
                 # Log activity
                 await self._log_user_activity(db, user_telegram_id, 'delete_content', content_id)
                 logger.info(f"Deleted content item {content_id} for user {user_telegram_id}")
@@ -657,12 +1656,12 @@ class DatabaseManager:
         limit: int = 5
     ) -> List[Dict[str, Any]]:
         """Find content with similar hash (potential duplicates)."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._pool.read() as db:
             cursor = await db.execute('''
                 SELECT id, original_share, content_type, created_at
                 FROM content_items 
                 WHERE user_telegram_id = ? AND content_hash = ?
-                ORDER BY created_at DESC
+                ORDER BY created_at DESC, id DESC
                 LIMIT ?
             ''', (user_telegram_id, content_hash, limit))
             
@@ -670,13 +1669,84 @@ class DatabaseManager:
             columns = [desc[0] for desc in cursor.description]
             return [dict(zip(columns, row)) for row in rows]
     
+    async def find_near_duplicates(
+        self,
+        user_telegram_id: int,
+        text: str,
+        max_distance: int = NEAR_DUPLICATE_DISTANCE,
+        limit: int = 5,
+        exclude_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Find the user's items whose SimHash is within max_distance bits of text's.
+        
+        Results include 'distance' and are ordered closest first.
+        """
+        signature = await asyncio.to_thread(simhash, text)
+        if signature is None:
+            return []
+        async with self._pool.read() as db:
+            return await self._near_duplicate_rows(db, user_telegram_id, signature, max_distance, limit, exclude_id)
+    
+    async def _near_duplicate_rows(
+        self,
+        db,
+        user_telegram_id: int,
+        signature: int,
+        max_distance: int,
+        limit: int,
+        exclude_id: Optional[int]
+    ) -> List[Dict[str, Any]]:
+        """Band-index candidate lookup followed by an exact Hamming distance check.
+        
+        Only complete for max_distance < SIMHASH_BANDS (a closer match
+        always shares a band); larger distances return a subset.
+        """
+        branches = ' OR '.join(
+            f'(user_telegram_id = ? AND {simhash_band_sql(band)} = ? AND simhash IS NOT NULL)'
+            for band in range(SIMHASH_BANDS)
+        )
+        params = []
+        for band_value in simhash_bands(signature):
+            params += [user_telegram_id, band_value]
+        cursor = await db.execute(f'''
+            SELECT id, original_share, content_type, created_at, simhash
+            FROM content_items WHERE {branches}
+        ''', params)
+        
+        matches = []
+        for row in await cursor.fetchall():
+            distance = hamming_distance(signature, row[4])
+            if row[0] != exclude_id and distance <= max_distance:
+                matches.append({
+                    'id': row[0], 'original_share': row[1], 'content_type': row[2],
+                    'created_at': row[3], 'distance': distance
+                })
+        matches.sort(key=lambda match: (match['distance'], -match['id']))
+        return matches[:limit]
+    
+    async def _link_near_duplicates(self, db, item_id: int, signature: int):
+        """Record near_duplicate relationships from a newly parsed item."""
+        cursor = await db.execute('SELECT user_telegram_id FROM content_items WHERE id = ?', (item_id,))
+        row = await cursor.fetchone()
+        if row is None:
+            return
+        matches = await self._near_duplicate_rows(
+            db, row[0], signature, NEAR_DUPLICATE_DISTANCE, 10, item_id
+        )
+        if matches:
+            await db.executemany('''
+                INSERT OR IGNORE INTO content_relationships
+                (from_item_id, to_item_id, relationship_type, confidence_score)
+                VALUES (?, ?, 'near_duplicate', ?)
+            ''', [(item_id, match['id'], 1 - match['distance'] / 64) for match in matches])
+    
     async def get_user_activity(
         self, 
         user_telegram_id: int, 
         days: int = 7
     ) -> List[Dict[str, Any]]:
         """Get user activity history."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._pool.read() as db:
             cursor = await db.execute('''
                 SELECT action_type, content_item_id, query, result_count, created_at
                 FROM user_activity 
@@ -692,19 +1762,7 @@ class DatabaseManager:
     
     async def store_web_token(self, user_telegram_id: int, token: str, expiry: int):
         """Store a web authentication token for a user."""
-        async with aiosqlite.connect(self.db_path) as db:
-            # First check if web_tokens table exists, create if not
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS web_tokens (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_telegram_id INTEGER NOT NULL,
-                    token TEXT UNIQUE NOT NULL,
-                    expiry INTEGER NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    used_at TIMESTAMP NULL
-                )
-            ''')
-            
+        async with self._pool.write() as db:
             # Clean up expired tokens for this user
             await db.execute('''
                 DELETE FROM web_tokens 
@@ -717,12 +1775,11 @@ class DatabaseManager:
                 VALUES (?, ?, ?)
             ''', (user_telegram_id, token, expiry))
             
-            await db.commit()
             logger.info(f"Stored web token for user {user_telegram_id}")
     
     async def validate_web_token(self, token: str, user_telegram_id: int) -> bool:
         """Validate a web authentication token (single-use for security)."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._pool.write() as db:
             cursor = await db.execute('''
                 SELECT id, expiry FROM web_tokens 
                 WHERE token = ? AND user_telegram_id = ? AND used_at IS NULL
@@ -738,7 +1795,6 @@ class DatabaseManager:
             if expiry < current_time:
                 # Token expired, clean it up
                 await db.execute('DELETE FROM web_tokens WHERE id = ?', (token_id,))
-                await db.commit()
                 return False
             
             # Mark token as used (single-use for security)
@@ -746,27 +1802,119 @@ class DatabaseManager:
                 UPDATE web_tokens SET used_at = CURRENT_TIMESTAMP 
                 WHERE id = ?
             ''', (token_id,))
-            await db.commit()
             
             return True
     
     async def get_pending_items(self, limit: int = 10) -> List[Dict[str, Any]]:
-        """Get content items that need processing."""
-        async with aiosqlite.connect(self.db_path) as db:
+        """Get content items that need processing (read-only; use claim_items to work on them)."""
+        async with self._pool.read() as db:
             cursor = await db.execute('''
                 SELECT id, user_telegram_id, original_share, content_type, 
                        created_at, parse_attempts
                 FROM content_items 
                 WHERE parse_status = 'pending' 
-                AND parse_attempts < 3
-                ORDER BY created_at ASC
+                AND parse_attempts < ?
+                ORDER BY id ASC
                 LIMIT ?
-            ''', (limit,))
+            ''', (MAX_PARSE_ATTEMPTS, limit))
             
             rows = await cursor.fetchall()
             columns = [desc[0] for desc in cursor.description]
             return [dict(zip(columns, row)) for row in rows]
     
+    async def claim_items(
+        self, 
+        owner: str, 
+        limit: int = 10, 
+        lease_seconds: float = 300
+    ) -> List[Dict[str, Any]]:
+        """Atomically lease up to limit pending items to owner.
+        
+        The claim is a single UPDATE, so parser processes sharing the
+        database never receive the same row. Leases that aren't completed,
+        failed or extended before they expire are returned to the queue by
+        reclaim_expired_leases().
+        """
+        lease_expires_at = time.time() + lease_seconds
+        claim = '''
+            UPDATE content_items 
+            SET parse_status = 'processing',
+                lease_owner = ?,
+                lease_expires_at = ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id IN (
+                SELECT id FROM content_items 
+                WHERE parse_status = 'pending' AND parse_attempts < ?
+                ORDER BY id ASC
+                LIMIT ?
+            )
+        '''
+        returned = 'id, user_telegram_id, original_share, content_type, metadata, created_at, parse_attempts'
+        params = (owner, lease_expires_at, MAX_PARSE_ATTEMPTS, limit)
+        
+        async with self._pool.write() as db:
+            if _HAS_RETURNING:
+                cursor = await db.execute(f'{claim} RETURNING {returned}', params)
+            else:
+                await db.execute(claim, params)
+                cursor = await db.execute(f'''
+                    SELECT {returned} FROM content_items 
+                    WHERE parse_status = 'processing' AND lease_owner = ? AND lease_expires_at = ?
+                ''', (owner, lease_expires_at))
+            rows = await cursor.fetchall()
+            columns = [desc[0] for desc in cursor.description]
+        
+        items = sorted((dict(zip(columns, row)) for row in rows), key=lambda item: item['id'])
+        if items:
+            logger.debug(f"Claimed {len(items)} items for {owner} until {lease_expires_at:.0f}")
+        return items
+    
+    async def extend_lease(self, item_id: int, owner: str, lease_seconds: float = 300) -> bool:
+        """Push out the lease expiry for an item still owned by owner."""
+        async with self._pool.write() as db:
+            cursor = await db.execute('''
+                UPDATE content_items SET lease_expires_at = ?
+                WHERE id = ? AND parse_status = 'processing' AND lease_owner = ?
+            ''', (time.time() + lease_seconds, item_id, owner))
+            return cursor.rowcount > 0
+    
+    async def extend_leases(self, item_ids: List[int], owner: str, lease_seconds: float = 300) -> int:
+        """Push out the lease expiry of every listed item still owned by owner; returns how many."""
+        if not item_ids:
+            return 0
+        placeholders = ','.join('?' * len(item_ids))
+        async with self._pool.write() as db:
+            cursor = await db.execute(f'''
+                UPDATE content_items SET lease_expires_at = ?
+                WHERE id IN ({placeholders}) AND parse_status = 'processing' AND lease_owner = ?
+            ''', (time.time() + lease_seconds, *item_ids, owner))
+            return cursor.rowcount
+    
+    async def reclaim_expired_leases(self) -> int:
+        """Return items whose lease expired (e.g. the parser crashed) to the queue.
+        
+        Each expiry counts as an attempt, so an item that keeps killing its
+        worker ends up in 'error' after MAX_PARSE_ATTEMPTS. Rows left in
+        'processing' without a lease by older versions are reclaimed too.
+        """
+        async with self._pool.write() as db:
+            cursor = await db.execute('''
+                UPDATE content_items 
+                SET parse_status = CASE WHEN parse_attempts + 1 >= ? THEN 'error' ELSE 'pending' END,
+                    parse_attempts = parse_attempts + 1,
+                    parse_error = 'Lease expired (owner: ' || COALESCE(lease_owner, 'unknown') || ')',
+                    lease_owner = NULL,
+                    lease_expires_at = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE parse_status = 'processing' 
+                AND (lease_expires_at IS NULL OR lease_expires_at < ?)
+            ''', (MAX_PARSE_ATTEMPTS, time.time()))
+            reclaimed = cursor.rowcount
+        
+        if reclaimed:
+            logger.warning(f"Reclaimed {reclaimed} items with expired parse leases")
+        return reclaimed
+    
     async def update_parse_status(
         self, 
         item_id: int, 
@@ -774,46 +1922,71 @@ class DatabaseManager:
         extracted_info: Optional[str] = None,
         taxonomy: Optional[str] = None,
         processing_time_ms: Optional[float] = None,
-        error_message: Optional[str] = None
+        error_message: Optional[str] = None,
+        lease_owner: Optional[str] = None,
+        metadata: Optional[str] = None
     ) -> bool:
-        """Update the parsing status of an item."""
-        async with aiosqlite.connect(self.db_path) as db:
-            if status == 'processing':
-                # Mark as currently being processed
-                await db.execute('''
-                    UPDATE content_items 
-                    SET parse_status = 'processing', 
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                ''', (item_id,))
-            elif status == 'complete':
+        """Update the parsing status of an item.
+        
+        With lease_owner the update only applies while that owner still
+        holds the item's lease (returns False otherwise), and an 'error'
+        puts the item back in the queue until MAX_PARSE_ATTEMPTS is reached.
+        Items only enter 'processing' through claim_items(), with a lease.
+        """
+        lease_check = ' AND lease_owner = ?' if lease_owner else ''
+        lease_params = (lease_owner,) if lease_owner else ()
+        signature = None
+        if status == 'complete' and extracted_info:
+            signature = await asyncio.to_thread(simhash, extracted_info)
+        
+        if status not in ('complete', 'error'):
+            raise ValueError(f"Unknown parse status: {status} (items are set processing by claim_items)")
+        
+        async with self._pool.write() as db:
+            if status == 'complete':
                 # Mark as completed with results
-                await db.execute('''
+                cursor = await db.execute(f'''
                     UPDATE content_items 
                     SET parse_status = 'complete',
                         extracted_info = COALESCE(?, extracted_info),
                         taxonomy = COALESCE(?, taxonomy),
                         processing_time_ms = COALESCE(?, processing_time_ms),
+                        metadata = COALESCE(?, metadata),
+                        simhash = COALESCE(?, simhash),
+                        lease_owner = NULL,
+                        lease_expires_at = NULL,
                         updated_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                ''', (extracted_info, taxonomy, processing_time_ms, item_id))
+                    WHERE id = ?{lease_check}
+                ''', (extracted_info, taxonomy, processing_time_ms, metadata, signature, item_id) + lease_params)
             elif status == 'error':
-                # Mark as errored and increment attempts
-                await db.execute('''
+                # Mark as errored (or requeue a leased item) and increment attempts
+                next_status = (
+                    "CASE WHEN parse_attempts + 1 >= ? THEN 'error' ELSE 'pending' END"
+                    if lease_owner else "'error'"
+                )
+                status_params = (MAX_PARSE_ATTEMPTS,) if lease_owner else ()
+                cursor = await db.execute(f'''
                     UPDATE content_items 
-                    SET parse_status = 'error',
+                    SET parse_status = {next_status},
                         parse_error = ?,
                         parse_attempts = parse_attempts + 1,
+                        lease_owner = NULL,
+                        lease_expires_at = NULL,
                         updated_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                ''', (error_message, item_id))
+                    WHERE id = ?{lease_check}
+                ''', status_params + (error_message, item_id) + lease_params)
+            
+            if lease_owner and cursor.rowcount == 0:
+                logger.warning(f"Lease on item {item_id} was lost by {lease_owner}; status not updated")
+                return False
             
-            await db.commit()
+            if signature is not None and cursor.rowcount:
+                await self._link_near_duplicates(db, item_id, signature)
             return True
     
     async def get_parse_stats(self) -> Dict[str, int]:
         """Get parsing statistics."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._pool.read() as db:
             stats = {}
             
             # Count by status
@@ -831,11 +2004,19 @@ class DatabaseManager:
                 'error': status_counts.get('error', 0)
             })
             
-            # Failed items (3+ attempts)
+            # Failed items (out of attempts)
             cursor = await db.execute('''
                 SELECT COUNT(*) FROM content_items 
-                WHERE parse_attempts >= 3 AND parse_status IN ('error', 'pending')
-            ''')
+                WHERE parse_attempts >= ? AND parse_status IN ('error', 'pending')
+            ''', (MAX_PARSE_ATTEMPTS,))
             stats['failed'] = (await cursor.fetchone())[0]
             
+            # Leases waiting to be reclaimed
+            cursor = await db.execute('''
+                SELECT COUNT(*) FROM content_items 
+                WHERE parse_status = 'processing' 
+                AND (lease_expires_at IS NULL OR lease_expires_at < ?)
+            ''', (time.time(),))
+            stats['expired_leases'] = (await cursor.fetchone())[0]
+            
             return stats
\ No newline at end of file
@@ -0,0 +1,315 @@
+"""
+Connection pool for RememBot's SQLite database.
+Keeps a bounded set of long-lived reader connections and a single writer
+connection so callers don't pay for a new aiosqlite thread on every query,
+and applies a storage profile (journal mode and PRAGMAs) to each of them.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional, AsyncIterator
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+
+class StorageProfile:
+    """SQLite journal and PRAGMA settings shared by every connection to a database."""
+    
+    JOURNAL_MODES = ('wal', 'delete', 'truncate', 'persist', 'memory')
+    SYNCHRONOUS_MODES = ('off', 'normal', 'full', 'extra')
+    TEMP_STORES = ('default', 'file', 'memory')
+    
+    def __init__(
+        self,
+        journal_mode: str = 'wal',
+        synchronous: str = 'normal',
+        busy_timeout_ms: int = 5000,
+        mmap_size: int = 256 * 1024 * 1024,
+        cache_size_kb: int = 20000,
+        temp_store: str = 'memory',
+        wal_autocheckpoint: int = 1000,
+        checkpoint_interval: float = 300.0
+    ):
+        """Initialize storage profile with validated settings."""
+        journal_mode = journal_mode.lower()
+        synchronous = synchronous.lower()
+        temp_store = temp_store.lower()
+        if journal_mode not in self.JOURNAL_MODES:
+            raise ValueError(f"journal_mode must be one of: {self.JOURNAL_MODES}")
+        if synchronous not in self.SYNCHRONOUS_MODES:
+            raise ValueError(f"synchronous must be one of: {self.SYNCHRONOUS_MODES}")
+        if temp_store not in self.TEMP_STORES:
+            raise ValueError(f"temp_store must be one of: {self.TEMP_STORES}")
+        
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.busy_timeout_ms = int(busy_timeout_ms)
+        self.mmap_size = int(mmap_size)
+        self.cache_size_kb = int(cache_size_kb)
+        self.temp_store = temp_store
+        self.wal_autocheckpoint = int(wal_autocheckpoint)
+        self.checkpoint_interval = float(checkpoint_interval)
+    
+    @classmethod
+    def from_config(cls, config) -> 'StorageProfile':
+        """Build a profile from RememBotConfig (or any object with db_* attributes)."""
+        defaults = cls()
+        return cls(
+            journal_mode=getattr(config, 'db_journal_mode', defaults.journal_mode),
+            synchronous=getattr(config, 'db_synchronous', defaults.synchronous),
+            busy_timeout_ms=getattr(config, 'db_busy_timeout_ms', defaults.busy_timeout_ms),
+            mmap_size=getattr(config, 'db_mmap_size', defaults.mmap_size),
+            cache_size_kb=getattr(config, 'db_cache_size_kb', defaults.cache_size_kb),
+            temp_store=getattr(config, 'db_temp_store', defaults.temp_store),
+            wal_autocheckpoint=getattr(config, 'db_wal_autocheckpoint', defaults.wal_autocheckpoint),
+            checkpoint_interval=getattr(config, 'db_checkpoint_interval', defaults.checkpoint_interval)
+        )
+    
+    @property
+    def is_wal(self) -> bool:
+        """Whether the profile uses write-ahead logging."""
+        return self.journal_mode == 'wal'
+    
+    def connection_pragmas(self) -> List[str]:
+        """PRAGMA statements to run on every new connection."""
+        pragmas = [
+            f"PRAGMA busy_timeout = {self.busy_timeout_ms}",
+            f"PRAGMA synchronous = {self.synchronous.upper()}",
+            f"PRAGMA mmap_size = {self.mmap_size}",
+            # Negative cache_size is interpreted by SQLite as KiB
+            f"PRAGMA cache_size = -{self.cache_size_kb}",
+            f"PRAGMA temp_store = {self.temp_store.upper()}",
+        ]
+        if self.is_wal:
+            pragmas.append(f"PRAGMA wal_autocheckpoint = {self.wal_autocheckpoint}")
+        return pragmas
+    
+    def apply(self, conn: sqlite3.Connection) -> str:
+        """Set the persistent journal mode and connection PRAGMAs on a sync connection."""
+        mode = conn.execute(f"PRAGMA journal_mode = {self.journal_mode.upper()}").fetchone()[0]
+        if mode.lower() != self.journal_mode:
+            logger.warning(f"Requested journal_mode={self.journal_mode} but SQLite kept {mode}")
+        for pragma in self.connection_pragmas():
+            conn.execute(pragma)
+        return mode.lower()
+    
+    def as_dict(self) -> Dict[str, Any]:
+        """Summarize the profile for reporting."""
+        return {
+            'journal_mode': self.journal_mode,
+            'synchronous': self.synchronous,
+            'busy_timeout_ms': self.busy_timeout_ms,
+            'mmap_size': self.mmap_size,
+            'cache_size_kb': self.cache_size_kb,
+            'temp_store': self.temp_store,
+            'wal_autocheckpoint': self.wal_autocheckpoint,
+            'checkpoint_interval': self.checkpoint_interval
+        }
+
+
+class _PoolMetrics:
+    """Wait-time and utilization counters for one side of the pool."""
+    
+    def __init__(self):
+        self.acquisitions = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.busy_ms = 0.0
+    
+    def record_wait(self, wait_ms: float):
+        """Record how long a caller waited for a connection."""
+        self.acquisitions += 1
+        self.total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+    
+    def as_dict(self, size: int, elapsed_ms: float) -> Dict[str, Any]:
+        """Summarize metrics for reporting."""
+        capacity_ms = elapsed_ms * size if size else 0.0
+        return {
+            'size': size,
+            'in_use': self.in_use,
+            'waiting': self.waiting,
+            'acquisitions': self.acquisitions,
+            'avg_wait_ms': round(self.total_wait_ms / self.acquisitions, 3) if self.acquisitions else 0.0,
+            'max_wait_ms': round(self.max_wait_ms, 3),
+            'utilization': round(self.busy_ms / capacity_ms, 4) if capacity_ms else 0.0
+        }
+
+
+class ConnectionPool:
+    """Bounded pool of reader connections plus one queued writer connection."""
+    
+    def __init__(self, db_path: str, max_readers: int = 4, profile: Optional[StorageProfile] = None):
+        """Initialize connection pool (connections are opened lazily)."""
+        if max_readers < 1:
+            raise ValueError("max_readers must be at least 1")
+        self.db_path = db_path
+        self.max_readers = max_readers
+        self.profile = profile or StorageProfile()
+        self._last_checkpoint = time.monotonic()
+        self._checkpoints = 0
+        self._readers: List[aiosqlite.Connection] = []
+        self._idle_readers: Optional[asyncio.Queue] = None
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._reader_lock: Optional[asyncio.Lock] = None
+        self._read_metrics = _PoolMetrics()
+        self._write_metrics = _PoolMetrics()
+        self._opened_at: Optional[float] = None
+        self._closed = False
+    
+    def _ensure_primitives(self):
+        """Create asyncio primitives inside the running event loop."""
+        if self._idle_readers is None:
+            self._idle_readers = asyncio.Queue()
+            self._write_lock = asyncio.Lock()
+            self._reader_lock = asyncio.Lock()
+            self._opened_at = time.perf_counter()
+    
+    async def _connect(self) -> aiosqlite.Connection:
+        """Open a new long-lived connection with the storage profile applied."""
+        conn = await aiosqlite.connect(self.db_path, timeout=self.profile.busy_timeout_ms / 1000)
+        for pragma in self.profile.connection_pragmas():
+            await conn.execute(pragma)
+        return conn
+    
+    async def _acquire_reader(self) -> aiosqlite.Connection:
+        """Take an idle reader, opening a new one while under the size limit."""
+        if self._idle_readers.empty():
+            async with self._reader_lock:
+                if self._idle_readers.empty() and len(self._readers) < self.max_readers:
+                    conn = await self._connect()
+                    self._readers.append(conn)
+                    logger.debug(f"Opened reader connection {len(self._readers)}/{self.max_readers}")
+                    return conn
+        return await self._idle_readers.get()
+    
+    @asynccontextmanager
+    async def read(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow a reader connection for the duration of the block."""
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        self._ensure_primitives()
+        
+        metrics = self._read_metrics
+        start = time.perf_counter()
+        metrics.waiting += 1
+        try:
+            conn = await self._acquire_reader()
+        finally:
+            metrics.waiting -= 1
+        acquired = time.perf_counter()
+        metrics.record_wait((acquired - start) * 1000)
+        metrics.in_use += 1
+        
+        try:
+            yield conn
+        finally:
+            metrics.in_use -= 1
+            metrics.busy_ms += (time.perf_counter() - acquired) * 1000
+            if conn in self._readers:
+                self._idle_readers.put_nowait(conn)
+    
+    @asynccontextmanager
+    async def write(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Run the block on the writer connection, committing on success."""
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        self._ensure_primitives()
+        
+        metrics = self._write_metrics
+        start = time.perf_counter()
+        metrics.waiting += 1
+        try:
+            await self._write_lock.acquire()
+        finally:
+            metrics.waiting -= 1
+        
+        try:
+            acquired = time.perf_counter()
+            metrics.record_wait((acquired - start) * 1000)
+            metrics.in_use += 1
+            try:
+                if self._writer is None:
+                    self._writer = await self._connect()
+                    logger.debug("Opened writer connection")
+                try:
+                    yield self._writer
+                    await self._writer.commit()
+                except BaseException:
+                    await self._writer.rollback()
+                    raise
+                await self._maybe_checkpoint()
+            finally:
+                metrics.in_use -= 1
+                metrics.busy_ms += (time.perf_counter() - acquired) * 1000
+        finally:
+            self._write_lock.release()
+    
+    async def _maybe_checkpoint(self):
+        """Run a passive WAL checkpoint once the checkpoint interval has elapsed."""
+        if not self.profile.is_wal or self.profile.checkpoint_interval <= 0:
+            return
+        if time.monotonic() - self._last_checkpoint < self.profile.checkpoint_interval:
+            return
+        await self._checkpoint_locked('PASSIVE')
+    
+    async def _checkpoint_locked(self, mode: str) -> Dict[str, int]:
+        """Checkpoint the WAL on the writer connection (caller holds the write lock)."""
+        if self._writer is None:
+            self._writer = await self._connect()
+        cursor = await self._writer.execute(f"PRAGMA wal_checkpoint({mode})")
+        busy, log_frames, checkpointed = await cursor.fetchone()
+        self._last_checkpoint = time.monotonic()
+        self._checkpoints += 1
+        logger.debug(f"WAL checkpoint ({mode}): {checkpointed}/{log_frames} frames, busy={busy}")
+        return {'busy': busy, 'log_frames': log_frames, 'checkpointed_frames': checkpointed}
+    
+    async def checkpoint(self, mode: str = 'PASSIVE') -> Dict[str, int]:
+        """Checkpoint the WAL file into the main database."""
+        mode = mode.upper()
+        if mode not in ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'):
+            raise ValueError(f"Unknown checkpoint mode: {mode}")
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        self._ensure_primitives()
+        async with self._write_lock:
+            return await self._checkpoint_locked(mode)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get pool wait-time and utilization metrics."""
+        elapsed_ms = (time.perf_counter() - self._opened_at) * 1000 if self._opened_at else 0.0
+        return {
+            'db_path': self.db_path,
+            'closed': self._closed,
+            'journal_mode': self.profile.journal_mode,
+            'checkpoints': self._checkpoints,
+            'readers': self._read_metrics.as_dict(len(self._readers), elapsed_ms),
+            'writer': self._write_metrics.as_dict(1 if self._writer else 0, elapsed_ms)
+        }
+    
+    async def close(self):
+        """Close all pooled connections."""
+        self._closed = True
+        readers, self._readers = self._readers, []
+        for conn in readers:
+            try:
+                await conn.close()
+            except Exception as e:
+                logger.warning(f"Error closing reader connection: {e}")
+        
+        if self._writer is not None:
+            writer, self._writer = self._writer, None
+            try:
+                await writer.close()
+            except Exception as e:
+                logger.warning(f"Error closing writer connection: {e}")
+        
+        logger.debug(f"Closed connection pool for {self.db_path}")
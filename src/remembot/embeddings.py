@@ -1,36 +1,171 @@
 """
-Embeddings system for RememBot. (sentence-transformers removed)
-NOTE: All local semantic similarity and embedding features are disabled.
-For future development, consider using OpenAI's embeddings API or another cloud-based service for semantic search and similarity.
+Embeddings system for RememBot.
+Embeds extracted content with a pluggable provider (a deterministic local
+hashing vectorizer by default, or OpenAI embeddings), stores vectors as
+float32 BLOBs in content_embeddings and answers semantic searches from a
+per-user vector index kept in step with the table. Items are embedded in
+batches: long texts are chunked to the model's input limit, identical texts
+and chunks are embedded once, and requests run concurrently under a rate
+limit.
 """
 
 import asyncio
+import hashlib
 import logging
-import numpy as np
+import math
 import sqlite3
-from typing import List, Dict, Any, Optional, Tuple
-import pickle
-import os
-from pathlib import Path
+import threading
 import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
-SENTENCE_TRANSFORMERS_AVAILABLE = False  # sentence-transformers removed
+import numpy as np
 
+from .ai_client import AIClient
 from .config import get_config
+from .database import EMBEDDINGS_SCHEMA
+from .db_pool import StorageProfile
+from .fingerprint import WORD_PATTERN, normalize_text
+from .vector_index import VectorIndex, normalize_rows
 
 logger = logging.getLogger(__name__)
 
+EMBEDDING_PROVIDERS = ('hashing', 'openai')
+
+# Words too common to say anything about a text's topic
+STOP_WORDS = frozenset('''
+    a about after all also an and any are as at be because been but by can could did do does for from had
+    has have he her his how i if in into is it its just may more most my no not of on or our out over she
+    so some such than that the their them then there these they this those to up us was we were what when
+    which who will with would you your
+'''.split())
+
+# Conservative characters per token, so chunks fit a model's input limit without a tokenizer
+CHARS_PER_TOKEN = 3
+
+
+def text_hash(text: str) -> str:
+    """SHA-256 of stripped text, identifying texts whose embeddings can be shared."""
+    return hashlib.sha256(text.strip().encode('utf-8')).hexdigest()
+
+
+def chunk_text(text: str, max_chars: Optional[int]) -> List[str]:
+    """Split text into chunks of at most max_chars, at whitespace where possible."""
+    text = text.strip()
+    chunks = []
+    while max_chars and len(text) > max_chars:
+        cut = max(text.rfind(' ', max_chars // 2, max_chars), text.rfind('\n', max_chars // 2, max_chars))
+        if cut <= 0:
+            cut = max_chars
+        chunks.append(text[:cut].strip())
+        text = text[cut:].strip()
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+class HashingEmbeddingProvider:
+    """Deterministic local embeddings: signed feature hashing of words and word pairs.
+    
+    Needs no model or network, so results are identical across processes
+    and machines. Similarity is lexical (shared words), not semantic.
+    """
+    
+    VERSION = 1
+    # Texts per embed() call; any length is fine, so texts aren't chunked
+    batch_size = 256
+    max_tokens = None
+    
+    def __init__(self, dim: int = 384):
+        """Initialize provider producing dim-dimensional vectors."""
+        self.dim = dim
+        self.name = f'hashing-v{self.VERSION}-{dim}'
+    
+    def _vector(self, text: str) -> np.ndarray:
+        """Unnormalized feature-hashed vector of one text."""
+        words = [
+            word for word in WORD_PATTERN.findall(normalize_text(text))
+            if len(word) > 1 and word not in STOP_WORDS
+        ]
+        features = Counter(words)
+        # Word pairs add some phrase information at half weight
+        pairs = Counter(f'{first} {second}' for first, second in zip(words, words[1:]))
+        
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for counts, weight in ((features, 1.0), (pairs, 0.5)):
+            for feature, count in counts.items():
+                value = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+                sign = 1.0 if value >> 63 else -1.0
+                vector[value % self.dim] += sign * weight * (1.0 + math.log(count))
+        return vector
+    
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Unit-length float32 embeddings of texts, one row each."""
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return normalize_rows(np.stack([self._vector(text) for text in texts]))
+
+
+class OpenAIEmbeddingProvider:
+    """Embeddings from the OpenAI API through the shared AIClient."""
+    
+    # A request may carry 300k tokens, so 32 full-length inputs
+    batch_size = 32
+    max_tokens = 8191
+    
+    def __init__(self, ai_client: AIClient, model: str = 'text-embedding-3-small', dim: int = 1536):
+        """Initialize provider (text-embedding-3 models are shortened to dim)."""
+        self.ai_client = ai_client
+        self.model = model
+        self.dim = dim
+        self.name = f'openai-{model}-{dim}'
+    
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Unit-length float32 embeddings of texts, one row each."""
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        dimensions = self.dim if self.model.startswith('text-embedding-3') else None
+        vectors = await self.ai_client.embed(texts, self.model, dimensions)
+        return normalize_rows(np.asarray(vectors, dtype=np.float32))
+
+
+def embedding_provider_from_config(config, ai_client: Optional[AIClient] = None):
+    """Embedding provider named by config.embedding_provider.
+    
+    Falls back to the hashing provider when OpenAI isn't configured.
+    """
+    provider = getattr(config, 'embedding_provider', 'hashing')
+    if provider == 'openai':
+        if ai_client is not None and ai_client.has('openai'):
+            return OpenAIEmbeddingProvider(
+                ai_client,
+                model=getattr(config, 'embedding_model', 'text-embedding-3-small'),
+                dim=getattr(config, 'embedding_dim', 384)
+            )
+        logger.warning("OpenAI embeddings not available, using local hashing embeddings")
+    return HashingEmbeddingProvider(getattr(config, 'embedding_dim', 384))
+
 
 class EmbeddingsManager:
-    """Manages content embeddings for semantic search (DISABLED)."""
+    """Manages content embeddings for semantic search.
+    
+    content_embeddings is the source of truth. Each process keeps a vector
+    index per user it has searched, memory-mapped from a snapshot under
+    index_path and caught up from rows added since (by row id) before each
+    search. Indexes of at least vector_ann_min_items items switch from
+    exact to approximate (IVF) search.
+    """
     
-    def __init__(self, db_path: str):
+    def __init__(
+        self,
+        db_path: str,
+        provider=None,
+        ai_client: Optional[AIClient] = None,
+        index_path: Optional[str] = None
+    ):
         """Initialize embeddings manager."""
         self.db_path = db_path
-        self.model = None
-        self.model_name = "all-MiniLM-L6-v2"  # Placeholder name
-        self.embedding_dim = 384  # Placeholder dimension
-        self._model_lock = asyncio.Lock()
         
         try:
             self.config = get_config()
@@ -39,135 +174,418 @@ class EmbeddingsManager:
             from types import SimpleNamespace
             self.config = SimpleNamespace()
         
+        self.provider = provider or embedding_provider_from_config(self.config, ai_client)
+        self.model_name = self.provider.name
+        self.embedding_dim = self.provider.dim
+        self.busy_timeout = StorageProfile.from_config(self.config).busy_timeout_ms / 1000
+        index_root = index_path or getattr(self.config, 'vector_index_path', None) or str(
+            Path(db_path).resolve().parent / 'vectors'
+        )
+        self.index_dir = Path(index_root) / self.model_name
+        self.ann_min_items = getattr(self.config, 'vector_ann_min_items', 50000)
+        self.ann_nprobe = getattr(self.config, 'vector_ann_nprobe', 32)
+        self._indexes: Dict[int, VectorIndex] = {}
+        self._indexes_lock = threading.Lock()
+        # Provider requests: bounded concurrency, started at most requests_per_second
+        self._request_slots = asyncio.Semaphore(getattr(self.config, 'embedding_concurrency', 4))
+        self._request_interval = 1 / getattr(self.config, 'embedding_requests_per_second', 20.0)
+        self._next_request_at = 0.0
+        self.stats = {'texts': 0, 'reused': 0, 'chunks': 0, 'duplicate_chunks': 0, 'requests': 0}
+        
         self._ensure_embeddings_table()
     
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection to the database."""
+        return sqlite3.connect(self.db_path, timeout=self.busy_timeout)
+    
     def _ensure_embeddings_table(self):
         """Create embeddings table if it doesn't exist."""
-        with sqlite3.connect(self.db_path) as conn:
-            # Create embeddings table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS content_embeddings (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    content_item_id INTEGER NOT NULL,
-                    embedding BLOB NOT NULL,
-                    model_name TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (content_item_id) REFERENCES content_items (id),
-                    UNIQUE(content_item_id, model_name)
-                )
-            ''')
+        with self._connect() as conn:
+            for statement in EMBEDDINGS_SCHEMA:
+                conn.execute(statement)
+            # Migrate tables created before text hashes were stored
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(content_embeddings)')}
+            if 'text_hash' not in columns:
+                conn.execute('ALTER TABLE content_embeddings ADD COLUMN text_hash TEXT')
             
             # Create index for fast lookups
             conn.execute('''
-                CREATE INDEX IF NOT EXISTS idx_embeddings_content_id 
+                CREATE INDEX IF NOT EXISTS idx_embeddings_content_id
                 ON content_embeddings(content_item_id)
             ''')
             
             conn.execute('''
-                CREATE INDEX IF NOT EXISTS idx_embeddings_model 
+                CREATE INDEX IF NOT EXISTS idx_embeddings_model
                 ON content_embeddings(model_name)
             ''')
             
+            # Finds an existing embedding of the same text to reuse
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_embeddings_text_hash
+                ON content_embeddings(model_name, text_hash) WHERE text_hash IS NOT NULL
+            ''')
+            
             conn.commit()
             logger.info("Embeddings table initialized")
     
-    async def _get_model(self):
-        """
-        Stub: sentence-transformers is not available. For future semantic similarity, use a cloud API.
-        """
-        logger.warning("sentence-transformers not available (stubbed)")
-        return None
+    def _decode(self, blobs: List[bytes]) -> Tuple[np.ndarray, List[bool]]:
+        """Stack float32 BLOBs into a matrix; the mask marks BLOBs of the right size."""
+        size = self.embedding_dim * 4
+        valid = [len(blob) == size for blob in blobs]
+        matrix = np.frombuffer(b''.join(blob for blob, ok in zip(blobs, valid) if ok), dtype='<f4')
+        return matrix.reshape(-1, self.embedding_dim).astype(np.float32), valid
     
-    async def generate_embedding(self, text: str):
-        """
-        Stub: Embedding generation is disabled. For future, use OpenAI embeddings API or similar.
-        """
-        logger.warning("Embedding generation is disabled (sentence-transformers removed)")
-        return None
+    async def generate_embedding(self, text: str) -> Optional[np.ndarray]:
+        """Generate a unit-length float32 embedding for text (None for empty text)."""
+        if not text or not text.strip():
+            return None
+        return (await self.provider.embed([text]))[0]
     
     async def store_embedding(
-        self, 
-        content_item_id: int, 
+        self,
+        content_item_id: int,
         text: str,
         force_update: bool = False
     ) -> bool:
-        """Store embedding for content item."""
-        if not text or not text.strip():
-            return False
+        """Store embedding for content item.
         
-        # Stub: Embedding generation is disabled
-        return False
+        Returns False for empty text or an item that doesn't exist. Without
+        force_update an existing embedding is kept.
+        """
+        return await self.store_embeddings([(content_item_id, text)], force_update) == 1
+    
+    async def store_embeddings(self, items: List[Tuple[int, str]], force_update: bool = False) -> int:
+        """Store embeddings for (content item id, text) pairs in one batch.
+        
+        Returns how many items have an embedding afterwards; empty texts and
+        missing items are skipped. Without force_update existing embeddings
+        are kept.
+        """
+        items = [(item_id, text) for item_id, text in items if text and text.strip()]
+        if not items:
+            return 0
+        
+        def lookup(conn):
+            placeholders = ','.join('?' * len(items))
+            ids = [item_id for item_id, _ in items]
+            users = dict(conn.execute(
+                f'SELECT id, user_telegram_id FROM content_items WHERE id IN ({placeholders})', ids
+            ).fetchall())
+            embedded = {row[0] for row in conn.execute(
+                f'SELECT content_item_id FROM content_embeddings WHERE model_name = ? AND content_item_id IN ({placeholders})',
+                [self.model_name] + ids
+            )}
+            return users, embedded
+        
+        users, embedded = await asyncio.to_thread(self._with_connection, lookup)
+        existing = [item_id for item_id, _ in items if item_id in users and item_id in embedded]
+        todo = [
+            (item_id, text) for item_id, text in items
+            if item_id in users and (force_update or item_id not in embedded)
+        ]
+        if todo:
+            await asyncio.to_thread(self._write_embeddings, await self._embed_items(todo))
+            for user_telegram_id in {users[item_id] for item_id, _ in todo}:
+                if user_telegram_id in self._indexes:
+                    await asyncio.to_thread(self._synced_index, user_telegram_id)
+        return len(set(existing) | {item_id for item_id, _ in todo})
+    
+    def _with_connection(self, func):
+        """Run func(conn) on a new connection."""
+        with self._connect() as conn:
+            return func(conn)
+    
+    async def _embed_items(self, items: List[Tuple[int, str]]) -> List[Tuple[int, np.ndarray, str]]:
+        """(item id, embedding, text hash) for each item.
+        
+        A text already embedded by the current model (for any item) reuses
+        that vector; the rest go through _embed_texts once per distinct text.
+        """
+        hashes = [text_hash(text) for _, text in items]
+        
+        def lookup(conn):
+            distinct = list(set(hashes))
+            found = {}
+            for start in range(0, len(distinct), 500):
+                chunk = distinct[start:start + 500]
+                found.update(conn.execute(f'''
+                    SELECT text_hash, embedding FROM content_embeddings
+                    WHERE model_name = ? AND text_hash IN ({','.join('?' * len(chunk))})
+                ''', [self.model_name] + chunk).fetchall())
+            return found
+        
+        stored = await asyncio.to_thread(self._with_connection, lookup)
+        vectors = {}
+        if stored:
+            matrix, valid = self._decode(list(stored.values()))
+            vectors = dict(zip([digest for digest, ok in zip(stored, valid) if ok], matrix))
+        
+        texts = {digest: text for digest, (_, text) in zip(hashes, items) if digest not in vectors}
+        self.stats['reused'] += len(items) - len(texts)
+        vectors.update(zip(texts, await self._embed_texts(list(texts.values()))))
+        return [(item_id, vectors[digest], digest) for (item_id, _), digest in zip(items, hashes)]
+    
+    async def _embed_texts(self, texts: List[str]) -> List[np.ndarray]:
+        """Embed non-empty texts, one unit-length vector each.
+        
+        Texts are chunked to the model's input limit and each distinct chunk
+        is embedded once, in provider-sized batches sent concurrently; a long
+        text's vector is the length-weighted mean of its chunks.
+        """
+        if not texts:
+            return []
+        max_tokens = getattr(self.provider, 'max_tokens', None)
+        chunks = [chunk_text(text, max_tokens * CHARS_PER_TOKEN if max_tokens else None) for text in texts]
+        distinct = list(dict.fromkeys(chunk for text_chunks in chunks for chunk in text_chunks))
+        batch_size = getattr(self.provider, 'batch_size', 64)
+        batches = [distinct[start:start + batch_size] for start in range(0, len(distinct), batch_size)]
+        
+        matrices = await asyncio.gather(*(self._embed_batch(batch) for batch in batches))
+        vectors = dict(zip(distinct, (row for matrix in matrices for row in matrix)))
+        self.stats['texts'] += len(texts)
+        self.stats['chunks'] += len(distinct)
+        self.stats['duplicate_chunks'] += sum(len(text_chunks) for text_chunks in chunks) - len(distinct)
+        
+        results = []
+        for text_chunks in chunks:
+            if len(text_chunks) == 1:
+                results.append(vectors[text_chunks[0]])
+                continue
+            weights = np.array([len(chunk) for chunk in text_chunks], dtype=np.float32)
+            pooled = weights @ np.stack([vectors[chunk] for chunk in text_chunks])
+            results.append(normalize_rows(pooled[np.newaxis])[0])
+        return results
+    
+    async def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        """One provider request, waiting for a concurrency slot and the rate limit."""
+        async with self._request_slots:
+            # Reserve the next start time before sleeping, so waiters queue up in order
+            now = time.monotonic()
+            start = max(now, self._next_request_at)
+            self._next_request_at = start + self._request_interval
+            if start > now:
+                await asyncio.sleep(start - now)
+            self.stats['requests'] += 1
+            return await self.provider.embed(texts)
+    
+    def _write_embeddings(self, rows: List[Tuple[int, np.ndarray, str]]):
+        """Insert or replace embeddings in one transaction (replacing gives the row a new id for index catch-up)."""
+        with self._connect() as conn:
+            conn.executemany(
+                '''
+                INSERT OR REPLACE INTO content_embeddings (content_item_id, embedding, model_name, text_hash)
+                VALUES (?, ?, ?, ?)
+                ''',
+                [
+                    (item_id, np.asarray(vector, dtype='<f4').tobytes(), self.model_name, digest)
+                    for item_id, vector, digest in rows
+                ]
+            )
+    
+    def _synced_index(self, user_telegram_id: int) -> VectorIndex:
+        """The user's vector index, loaded if needed and caught up with the table."""
+        with self._indexes_lock:
+            index = self._indexes.get(user_telegram_id)
+            if index is None:
+                index = VectorIndex.load(str(self.index_dir), f'user_{user_telegram_id}', self.embedding_dim)
+                self._indexes[user_telegram_id] = index
+        
+        with index.lock, self._connect() as conn:
+            # Item ids are never reused, so deletions can apply before new rows
+            deleted = conn.execute('''
+                SELECT id, content_item_id FROM embedding_deletions
+                WHERE id > ? AND user_telegram_id = ?
+                ORDER BY id
+            ''', (index.deletions_watermark, user_telegram_id)).fetchall()
+            for _, item_id in deleted:
+                index.remove(item_id)
+            if deleted:
+                index.deletions_watermark = deleted[-1][0]
+            
+            rows = conn.execute('''
+                SELECT e.id, e.content_item_id, e.embedding
+                FROM content_embeddings e
+                JOIN content_items c ON c.id = e.content_item_id
+                WHERE e.id > ? AND e.model_name = ? AND c.user_telegram_id = ?
+                ORDER BY e.id
+            ''', (index.watermark, self.model_name, user_telegram_id)).fetchall()
+            if rows:
+                vectors, valid = self._decode([row[2] for row in rows])
+                index.upsert([row[1] for row, ok in zip(rows, valid) if ok], vectors)
+                index.watermark = rows[-1][0]
+            # Switch back to exact search only well below the threshold
+            use_ann = len(index) >= self.ann_min_items or (index.ann and len(index) >= self.ann_min_items // 2)
+            if index.needs_compaction() or use_ann != index.ann:
+                if use_ann and not index.ann:
+                    logger.info(f"Building approximate search index for user {user_telegram_id} ({len(index)} items)")
+                index.save(ann=use_ann)
+        return index
+    
+    def _search_index(
+        self,
+        user_telegram_id: int,
+        query: Optional[np.ndarray],
+        limit: int,
+        threshold: Optional[float],
+        exclude: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Top matches in the user's index joined to their content items, best first.
+        
+        With query None, the vector of item exclude is used.
+        """
+        index = self._synced_index(user_telegram_id)
+        with index.lock:
+            if query is None:
+                query = index.vector(exclude)
+                if query is None:
+                    return []
+            hits = index.search(query, limit, threshold, exclude, self.ann_nprobe if index.ann else None)
+        if not hits:
+            return []
+        
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            placeholders = ','.join('?' * len(hits))
+            items = {
+                row['id']: dict(row) for row in conn.execute(
+                    f'SELECT * FROM content_items WHERE user_telegram_id = ? AND id IN ({placeholders})',
+                    [user_telegram_id] + [item_id for item_id, _ in hits]
+                )
+            }
+        
+        results = []
+        with index.lock:
+            for item_id, similarity in hits:
+                if item_id in items:
+                    results.append(dict(items[item_id], similarity=round(similarity, 4)))
+                else:
+                    # Deleted without a recorded deletion (e.g. directly in SQL)
+                    index.remove(item_id)
+        return results
     
     async def semantic_search(
-        self, 
+        self,
         user_telegram_id: int,
         query: str,
         limit: int = 10,
         similarity_threshold: float = 0.3
-    ):
-        """
-        Stub: Semantic search is disabled. For future, use OpenAI embeddings API or similar.
-        """
-        logger.warning("Semantic search not available (sentence-transformers removed)")
-        return []
+    ) -> List[Dict[str, Any]]:
+        """Find the user's items most similar to query (content item rows plus similarity)."""
+        embedding = await self.generate_embedding(query)
+        if embedding is None:
+            return []
+        return await asyncio.to_thread(
+            self._search_index, user_telegram_id, embedding, limit, similarity_threshold
+        )
     
     async def batch_generate_embeddings(
-        self, 
+        self,
         user_telegram_id: Optional[int] = None,
-        batch_size: int = 50
-    ):
-        """
-        Stub: Batch embedding generation is disabled. For future, use OpenAI embeddings API or similar.
+        batch_size: int = 256,
+        after_id: int = 0,
+        max_items: Optional[int] = None
+    ) -> Dict[str, int]:
+        """Embed items that have extracted text but no embedding for the current model.
+        
+        Items are read in id order, batch_size at a time, and each batch is
+        written in one transaction. A stopped run loses at most the batch in
+        flight: the scan only selects items still missing an embedding, so
+        running again (or passing after_id=last_item_id) carries on.
+        max_items bounds the items read in one run.
         """
-        logger.warning("Batch embedding generation is disabled (sentence-transformers removed)")
-        return {'processed': 0, 'errors': 0, 'skipped': 0}
+        stats = {'processed': 0, 'reused': 0, 'errors': 0, 'skipped': 0, 'requests': 0, 'last_item_id': after_id}
+        user_filter = 'AND c.user_telegram_id = ?' if user_telegram_id is not None else ''
+        user_params = [user_telegram_id] if user_telegram_id is not None else []
+        started = dict(self.stats)
+        
+        def next_batch(conn, after_id, limit):
+            return conn.execute(f'''
+                SELECT c.id, c.extracted_info
+                FROM content_items c
+                LEFT JOIN content_embeddings e ON e.content_item_id = c.id AND e.model_name = ?
+                WHERE e.id IS NULL AND c.id > ? {user_filter}
+                ORDER BY c.id
+                LIMIT ?
+            ''', [self.model_name, after_id] + user_params + [limit]).fetchall()
+        
+        read = 0
+        while max_items is None or read < max_items:
+            limit = batch_size if max_items is None else min(batch_size, max_items - read)
+            after_id = stats['last_item_id']
+            rows = await asyncio.to_thread(self._with_connection, lambda conn: next_batch(conn, after_id, limit))
+            if not rows:
+                break
+            read += len(rows)
+            stats['last_item_id'] = rows[-1][0]
+            
+            items = [(item_id, text) for item_id, text in rows if text and text.strip()]
+            stats['skipped'] += len(rows) - len(items)
+            if not items:
+                continue
+            try:
+                await asyncio.to_thread(self._write_embeddings, await self._embed_items(items))
+                stats['processed'] += len(items)
+            except Exception as e:
+                logger.error(f"Error embedding items {items[0][0]}-{items[-1][0]}: {e}")
+                stats['errors'] += len(items)
+        
+        stats['reused'] = self.stats['reused'] - started['reused']
+        stats['requests'] = self.stats['requests'] - started['requests']
+        logger.info(f"Batch embedding finished: {stats}")
+        return stats
     
     async def get_similar_content(
-        self, 
+        self,
         content_item_id: int,
         user_telegram_id: int,
         limit: int = 5
-    ):
-        """
-        Stub: Similar content search is disabled. For future, use OpenAI embeddings API or similar.
-        """
-        logger.warning("Similar content search is disabled (sentence-transformers removed)")
-        return []
+    ) -> List[Dict[str, Any]]:
+        """Find the user's items most similar to one of their items."""
+        return await asyncio.to_thread(
+            self._search_index, user_telegram_id, None, limit, None, content_item_id
+        )
     
     async def get_embedding_stats(self) -> Dict[str, Any]:
         """Get statistics about embeddings."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 # Total embeddings
                 cursor = conn.execute('SELECT COUNT(*) FROM content_embeddings')
                 total_embeddings = cursor.fetchone()[0]
                 
                 # Embeddings by model
                 cursor = conn.execute('''
-                    SELECT model_name, COUNT(*) 
-                    FROM content_embeddings 
+                    SELECT model_name, COUNT(*)
+                    FROM content_embeddings
                     GROUP BY model_name
                 ''')
                 by_model = dict(cursor.fetchall())
                 
-                # Coverage (items with embeddings vs total items)
+                # Coverage (items with embeddings for the current model vs total items)
                 cursor = conn.execute('SELECT COUNT(*) FROM content_items')
                 total_items = cursor.fetchone()[0]
                 
-                coverage_percent = (total_embeddings / total_items * 100) if total_items > 0 else 0
+                current = by_model.get(self.model_name, 0)
+                coverage_percent = (current / total_items * 100) if total_items > 0 else 0
                 
                 return {
                     'total_embeddings': total_embeddings,
                     'total_content_items': total_items,
                     'coverage_percent': round(coverage_percent, 1),
                     'by_model': by_model,
-                    'model_available': SENTENCE_TRANSFORMERS_AVAILABLE,
-                    'current_model': self.model_name
+                    'model_available': True,
+                    'current_model': self.model_name,
+                    'embedding_dim': self.embedding_dim,
+                    'pipeline': dict(self.stats),
+                    'loaded_indexes': {
+                        user_id: {'items': len(index), 'ann_lists': index.list_count}
+                        for user_id, index in self._indexes.items()
+                    }
                 }
         
         except Exception as e:
             logger.error(f"Error getting embedding stats: {e}")
             return {
                 'error': str(e),
-                'model_available': SENTENCE_TRANSFORMERS_AVAILABLE
-            }
\ No newline at end of file
+                'model_available': True
+            }
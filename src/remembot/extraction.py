@@ -0,0 +1,365 @@
+"""
+Extraction engine for RememBot.
+Runs CPU-heavy extraction (OCR, PDF/Word/Excel parsing, HTML to text) in a
+recycled process pool so it never blocks the event loop.
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import multiprocessing
+import time
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from PIL import Image
+import pytesseract
+from docx import Document
+from pypdf import PdfReader
+import openpyxl
+
+from .page_text import DOCUMENT_EXTRACTORS
+
+logger = logging.getLogger(__name__)
+
+
+class ContentProcessingError(Exception):
+    """Custom exception for content processing errors."""
+    pass
+
+
+class ExtractionTimeout(ContentProcessingError):
+    """Raised when an extraction job exceeds its time limit."""
+    pass
+
+
+# Bump when OCR/document extraction output changes; cached per-blob results
+# recorded under an older version are ignored
+EXTRACTOR_VERSION = 1
+
+
+# Job functions: module-level so they can be pickled into worker processes
+
+def html_to_text(html: str, enhanced: bool = False, parser: str = 'lxml') -> Tuple[str, str]:
+    """Parse HTML into (title, whitespace-normalized text).
+    
+    The enhanced mode keeps only the main content (readability scoring);
+    otherwise the whole page minus scripts, styles and nav/header/footer.
+    parser is the BeautifulSoup tree builder.
+    """
+    extractor = DOCUMENT_EXTRACTORS['readability' if enhanced else 'basic']
+    return extractor(html, parser)
+
+
+def ocr_image(file_path: str) -> Dict[str, Any]:
+    """Validate an image and OCR it; returns size/format info and the text."""
+    try:
+        image = Image.open(file_path)
+        image.verify()  # Verify it's a valid image
+        image = Image.open(file_path)  # Reopen after verify
+    except Exception as e:
+        raise ContentProcessingError(f"Invalid image format: {e}")
+    
+    # Check image dimensions
+    width, height = image.size
+    if width < 10 or height < 10:
+        raise ContentProcessingError(f"Image too small: {width}x{height}")
+    
+    # Perform OCR with error handling
+    try:
+        ocr_text = pytesseract.image_to_string(image, timeout=30)
+    except Exception as e:
+        logger.warning(f"OCR failed: {e}")
+        ocr_text = "[OCR processing failed]"
+    
+    return {
+        'width': width,
+        'height': height,
+        'format': image.format or "Unknown",
+        'mode': image.mode,
+        'ocr_text': ocr_text
+    }
+
+
+def extract_document_text(file_path: str, file_ext: str) -> str:
+    """Extract text from a document based on its extension."""
+    if file_ext == '.pdf':
+        return extract_pdf_text(file_path)
+    elif file_ext in ['.docx', '.doc']:
+        return extract_word_text(file_path)
+    elif file_ext in ['.xlsx', '.xls']:
+        return extract_excel_text(file_path)
+    elif file_ext == '.txt':
+        return extract_txt_text(file_path)
+    raise ContentProcessingError(f"Unsupported file type: {file_ext}")
+
+
+def extract_txt_text(file_path: str) -> str:
+    """Extract text from plain text file."""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            content = file.read()
+            if not content.strip():
+                raise ContentProcessingError("Text file is empty")
+            return content.strip()
+    except UnicodeDecodeError:
+        # Try with different encodings
+        encodings = ['latin-1', 'cp1252', 'iso-8859-1']
+        for encoding in encodings:
+            try:
+                with open(file_path, 'r', encoding=encoding) as file:
+                    return file.read().strip()
+            except UnicodeDecodeError:
+                continue
+        raise ContentProcessingError("Unable to decode text file with any supported encoding")
+    except ContentProcessingError:
+        raise
+    except Exception as e:
+        raise ContentProcessingError(f"Error reading text file: {e}")
+
+
+def extract_pdf_text(file_path: str) -> str:
+    """Extract text from PDF file with enhanced error handling."""
+    try:
+        with open(file_path, 'rb') as file:
+            pdf_reader = PdfReader(file)
+            
+            if len(pdf_reader.pages) == 0:
+                raise ContentProcessingError("PDF has no pages")
+            
+            text = ""
+            pages_processed = 0
+            
+            for page_num, page in enumerate(pdf_reader.pages):
+                try:
+                    page_text = page.extract_text()
+                    if page_text:
+                        text += f"[Page {page_num + 1}]\n{page_text}\n\n"
+                        pages_processed += 1
+                except Exception as e:
+                    logger.warning(f"Failed to extract text from page {page_num + 1}: {e}")
+                    text += f"[Page {page_num + 1}: Error extracting text]\n\n"
+            
+            if not text.strip():
+                raise ContentProcessingError("No extractable text found in PDF")
+            
+            logger.debug(f"Extracted text from {pages_processed}/{len(pdf_reader.pages)} pages")
+            return text.strip()
+    
+    except ContentProcessingError:
+        raise
+    except Exception as e:
+        raise ContentProcessingError(f"Error extracting PDF text: {e}")
+
+
+def extract_word_text(file_path: str) -> str:
+    """Extract text from Word document with enhanced error handling."""
+    try:
+        doc = Document(file_path)
+        text = ""
+        paragraphs_processed = 0
+        
+        # Extract paragraph text
+        for paragraph in doc.paragraphs:
+            para_text = paragraph.text.strip()
+            if para_text:
+                text += para_text + "\n"
+                paragraphs_processed += 1
+        
+        # Extract table text
+        tables_processed = 0
+        for table in doc.tables:
+            try:
+                text += "\n[Table]\n"
+                for row in table.rows:
+                    row_text = []
+                    for cell in row.cells:
+                        cell_text = cell.text.strip()
+                        row_text.append(cell_text)
+                    text += " | ".join(row_text) + "\n"
+                text += "\n"
+                tables_processed += 1
+            except Exception as e:
+                logger.warning(f"Failed to extract table text: {e}")
+        
+        if not text.strip():
+            raise ContentProcessingError("No extractable text found in Word document")
+        
+        logger.debug(f"Extracted {paragraphs_processed} paragraphs and {tables_processed} tables")
+        return text.strip()
+    
+    except ContentProcessingError:
+        raise
+    except Exception as e:
+        raise ContentProcessingError(f"Error extracting Word text: {e}")
+
+
+def extract_excel_text(file_path: str) -> str:
+    """Extract text from Excel file with enhanced error handling."""
+    try:
+        workbook = openpyxl.load_workbook(file_path, data_only=True)
+        
+        if not workbook.sheetnames:
+            raise ContentProcessingError("Excel file has no sheets")
+        
+        text = ""
+        sheets_processed = 0
+        
+        for sheet_name in workbook.sheetnames:
+            try:
+                sheet = workbook[sheet_name]
+                text += f"[Sheet: {sheet_name}]\n"
+                
+                rows_with_data = 0
+                for row in sheet.iter_rows(values_only=True):
+                    # Skip completely empty rows
+                    if not any(cell is not None and str(cell).strip() for cell in row):
+                        continue
+                    
+                    row_text = "\t".join([
+                        str(cell).strip() if cell is not None else ""
+                        for cell in row
+                    ])
+                    
+                    if row_text.strip():
+                        text += row_text + "\n"
+                        rows_with_data += 1
+                
+                text += "\n"
+                sheets_processed += 1
+                logger.debug(f"Extracted {rows_with_data} rows from sheet '{sheet_name}'")
+            
+            except Exception as e:
+                logger.warning(f"Failed to extract text from sheet '{sheet_name}': {e}")
+                text += f"[Error extracting sheet '{sheet_name}']\n\n"
+        
+        if not text.strip() or sheets_processed == 0:
+            raise ContentProcessingError("No extractable data found in Excel file")
+        
+        logger.debug(f"Processed {sheets_processed}/{len(workbook.sheetnames)} sheets")
+        return text.strip()
+    
+    except ContentProcessingError:
+        raise
+    except Exception as e:
+        raise ContentProcessingError(f"Error extracting Excel text: {e}")
+
+
+class ExtractionEngine:
+    """Process pool for extraction jobs with timeouts, recycling and cancellation.
+    
+    Workers are replaced after max_jobs_per_worker jobs each (on average)
+    to cap memory growth from large documents, and the whole pool is killed
+    and replaced when a job times out, since a running job can't be
+    interrupted. With max_workers=0 jobs run on a thread instead.
+    """
+    
+    def __init__(
+        self,
+        max_workers: int = 4,
+        job_timeout: float = 120,
+        max_jobs_per_worker: int = 50
+    ):
+        """Initialize extraction engine (the pool starts on first use)."""
+        self.max_workers = max_workers
+        self.job_timeout = job_timeout
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self._executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self._generation_jobs = 0
+        self._closed = False
+        self.stats = {'jobs': 0, 'failures': 0, 'timeouts': 0, 'cancelled': 0, 'recycles': 0}
+    
+    @classmethod
+    def from_config(cls, config) -> 'ExtractionEngine':
+        """Build an engine from RememBotConfig (or a SimpleNamespace with the same fields)."""
+        return cls(
+            max_workers=getattr(config, 'max_workers', 4),
+            job_timeout=getattr(config, 'extraction_timeout', 120),
+            max_jobs_per_worker=getattr(config, 'extraction_max_jobs_per_worker', 50)
+        )
+    
+    def _get_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        """Return the current pool, starting a new generation when due."""
+        if self._executor is not None and self._generation_jobs >= self.max_jobs_per_worker * self.max_workers:
+            # Old workers finish their queued jobs and exit in the background
+            self._retire_executor()
+            self.stats['recycles'] += 1
+        if self._executor is None:
+            # spawn: forking a process that runs event-loop and sqlite threads is unsafe
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            self._generation_jobs = 0
+        self._generation_jobs += 1
+        return self._executor
+    
+    def _retire_executor(self, kill: bool = False, cancel_pending: bool = False):
+        """Detach the current pool; kill its workers if a job is stuck."""
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        if kill:
+            # ProcessPoolExecutor has no API to stop a running job
+            for process in list(getattr(executor, '_processes', {}).values()):
+                process.terminate()
+        try:
+            executor.shutdown(wait=False, cancel_futures=kill or cancel_pending)
+        except TypeError:  # Python 3.8 has no cancel_futures
+            executor.shutdown(wait=False)
+    
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None) -> Any:
+        """Run func(*args) in a worker process and return its result.
+        
+        Raises ExtractionTimeout after timeout (default job_timeout) seconds.
+        Cancelling the awaiting task cancels the job if it hasn't started;
+        a job that has started runs to completion and its result is dropped.
+        """
+        if self._closed:
+            raise ContentProcessingError("Extraction engine is closed")
+        timeout = timeout or self.job_timeout
+        loop = asyncio.get_running_loop()
+        self.stats['jobs'] += 1
+        start_time = time.time()
+        
+        for attempt in range(2):
+            if self.max_workers <= 0:
+                future = loop.run_in_executor(None, functools.partial(func, *args))
+            else:
+                future = loop.run_in_executor(self._get_executor(), func, *args)
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                self.stats['timeouts'] += 1
+                if self.max_workers > 0:
+                    self._retire_executor(kill=True)
+                raise ExtractionTimeout(f"{func.__name__} timed out after {timeout:.0f}s")
+            except asyncio.CancelledError:
+                self.stats['cancelled'] += 1
+                raise
+            except BrokenProcessPool:
+                # Another job's timeout (or a crashed worker) took the pool down; retry once
+                self._retire_executor()
+                if attempt or time.time() - start_time >= timeout:
+                    self.stats['failures'] += 1
+                    raise ContentProcessingError(f"{func.__name__} failed: extraction worker crashed")
+                logger.warning(f"Extraction pool broke during {func.__name__}; retrying on a new pool")
+            except Exception:
+                self.stats['failures'] += 1
+                raise
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get job counters and pool settings."""
+        return dict(
+            self.stats,
+            max_workers=self.max_workers,
+            job_timeout=self.job_timeout,
+            max_jobs_per_worker=self.max_jobs_per_worker,
+            pool_running=self._executor is not None
+        )
+    
+    def close(self):
+        """Shut the pool down, cancelling queued jobs."""
+        self._closed = True
+        self._retire_executor(cancel_pending=True)
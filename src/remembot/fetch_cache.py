@@ -0,0 +1,301 @@
+"""
+URL fetch cache for RememBot.
+Persists extracted web page results by canonical URL in a small SQLite file
+shared by all processes, so a link shared by many users is fetched once and
+stale entries are revalidated with ETag/Last-Modified instead of refetched.
+"""
+
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_AGE_PATTERN = re.compile(r'max-age\s*=\s*"?(\d+)')
+
+
+def freshness_lifetime(cache_control: Optional[str], default_ttl: float) -> Optional[float]:
+    """Seconds a response may be served without revalidation.
+    
+    None means it must not be stored. max-age can shorten the configured
+    TTL but not extend it.
+    """
+    directives = (cache_control or '').lower()
+    if 'no-store' in directives:
+        return None
+    if 'no-cache' in directives:
+        return 0.0
+    match = MAX_AGE_PATTERN.search(directives)
+    if match:
+        return min(float(match.group(1)), default_ttl)
+    return default_ttl
+
+
+class CacheStore:
+    """Base for small persistent LRU caches in their own SQLite file.
+    
+    One connection guarded by a lock, used from worker threads. Subclasses
+    create TABLE in _create_schema(); it needs KEY_COLUMN, size_bytes and
+    last_access columns for eviction. Entry and byte totals are kept in a
+    one-row TABLE_totals table by triggers, so writes don't scan the cache.
+    """
+    
+    TABLE = ''
+    KEY_COLUMN = ''
+    
+    def __init__(self, path: str, max_entries: int, max_bytes: int):
+        """Initialize store (the database file is opened on first use)."""
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_lock = threading.Lock()
+    
+    def _create_schema(self, conn: sqlite3.Connection):
+        """Create the cache table and indexes."""
+        raise NotImplementedError
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open the cache database (caller holds _conn_lock)."""
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=5000')
+            # So rows replaced by INSERT OR REPLACE fire the totals delete trigger
+            conn.execute('PRAGMA recursive_triggers=ON')
+            self._create_schema(conn)
+            self._create_totals(conn)
+            self._conn = conn
+        return self._conn
+    
+    def _create_totals(self, conn: sqlite3.Connection):
+        """Create the totals row and its triggers, counting existing entries once."""
+        table = self.TABLE
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table}_totals (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    entries INTEGER NOT NULL,
+                    bytes INTEGER NOT NULL
+                )
+            ''')
+            conn.execute(f'''
+                INSERT OR IGNORE INTO {table}_totals (id, entries, bytes)
+                SELECT 0, COUNT(*), COALESCE(SUM(size_bytes), 0) FROM {table}
+            ''')
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_totals_insert AFTER INSERT ON {table} BEGIN
+                    UPDATE {table}_totals SET entries = entries + 1, bytes = bytes + new.size_bytes WHERE id = 0;
+                END
+            ''')
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_totals_delete AFTER DELETE ON {table} BEGIN
+                    UPDATE {table}_totals SET entries = entries - 1, bytes = bytes - old.size_bytes WHERE id = 0;
+                END
+            ''')
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_totals_update AFTER UPDATE OF size_bytes ON {table} BEGIN
+                    UPDATE {table}_totals SET bytes = bytes - old.size_bytes + new.size_bytes WHERE id = 0;
+                END
+            ''')
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+    
+    async def _run(self, func, *args):
+        """Run a cache operation on a thread with the connection."""
+        def call():
+            with self._conn_lock:
+                return func(self._connect(), *args)
+        return await asyncio.to_thread(call)
+    
+    def _store(self, conn: sqlite3.Connection, sql: str, params) -> int:
+        """Write one entry and evict in a single transaction; returns entries evicted."""
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(sql, params)
+            evicted = self._evict(conn)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return evicted
+    
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        """Drop least recently used entries beyond the entry and size limits."""
+        count, total = conn.execute(f'SELECT entries, bytes FROM {self.TABLE}_totals WHERE id = 0').fetchone()
+        evicted = 0
+        while count > self.max_entries or total > self.max_bytes:
+            # Over the byte limit, drop the oldest tenth at a time
+            excess = count - self.max_entries
+            batch = excess if excess > 0 else max(count // 10, 1)
+            rows = conn.execute(
+                f'SELECT {self.KEY_COLUMN}, size_bytes FROM {self.TABLE} ORDER BY last_access LIMIT ?', (batch,)
+            ).fetchall()
+            if not rows:
+                break
+            conn.executemany(f'DELETE FROM {self.TABLE} WHERE {self.KEY_COLUMN} = ?', [(row[0],) for row in rows])
+            count -= len(rows)
+            total -= sum(row[1] for row in rows)
+            evicted += len(rows)
+        return evicted
+    
+    async def _size(self) -> Tuple[int, int]:
+        """(entries, bytes) currently stored."""
+        def size(conn):
+            return conn.execute(f'SELECT entries, bytes FROM {self.TABLE}_totals WHERE id = 0').fetchone()
+        return await self._run(size)
+    
+    def close(self):
+        """Close the cache database."""
+        with self._conn_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class FetchCache(CacheStore):
+    """Persistent LRU cache of URL fetch results with conditional revalidation."""
+    
+    TABLE = 'url_cache'
+    KEY_COLUMN = 'url'
+    
+    def __init__(
+        self,
+        path: str,
+        ttl_seconds: float = 6 * 3600,
+        max_entries: int = 10000,
+        max_bytes: int = 256 * 1024 * 1024,
+        max_entry_bytes: int = 1024 * 1024
+    ):
+        """Initialize cache (the database file is opened on first use)."""
+        super().__init__(path, max_entries, max_bytes)
+        self.ttl_seconds = ttl_seconds
+        self.max_entry_bytes = max_entry_bytes
+        # Per-URL locks so concurrent shares of one link cause a single fetch
+        self._url_locks: 'weakref.WeakValueDictionary[str, asyncio.Lock]' = weakref.WeakValueDictionary()
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'revalidated': 0, 'stale_served': 0, 'stores': 0, 'evictions': 0}
+    
+    @classmethod
+    def from_config(cls, config, db_path: str) -> Optional['FetchCache']:
+        """Build a cache from config (None when disabled), next to the database by default."""
+        if not getattr(config, 'url_cache_enabled', True):
+            return None
+        path = getattr(config, 'url_cache_path', None) or str(Path(db_path).resolve().parent / 'url_cache.db')
+        return cls(
+            path,
+            ttl_seconds=getattr(config, 'url_cache_ttl', 6 * 3600),
+            max_entries=getattr(config, 'url_cache_max_entries', 10000),
+            max_bytes=getattr(config, 'url_cache_max_mb', 256) * 1024 * 1024
+        )
+    
+    def _create_schema(self, conn: sqlite3.Connection):
+        """Create the URL cache table."""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS url_cache (
+                url TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_url_cache_lru ON url_cache(last_access)')
+    
+    def lock(self, url: str) -> asyncio.Lock:
+        """Lock serializing fetches of one canonical URL within this process."""
+        lock = self._url_locks.get(url)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._url_locks[url] = lock
+        return lock
+    
+    async def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """Look up a URL; returns result, etag, last_modified and whether it's fresh."""
+        def lookup(conn, url, now):
+            row = conn.execute(
+                'SELECT result, etag, last_modified, expires_at, fetched_at FROM url_cache WHERE url = ?', (url,)
+            ).fetchone()
+            if row:
+                conn.execute('UPDATE url_cache SET last_access = ?, hits = hits + 1 WHERE url = ?', (now, url))
+            return row
+        
+        now = time.time()
+        row = await self._run(lookup, url, now)
+        if row is None:
+            self.stats['misses'] += 1
+            return None
+        fresh = row[3] > now
+        self.stats['hits' if fresh else 'stale'] += 1
+        return {
+            'result': json.loads(row[0]),
+            'etag': row[1],
+            'last_modified': row[2],
+            'fresh': fresh,
+            'fetched_at': row[4]
+        }
+    
+    async def put(
+        self,
+        url: str,
+        result: Dict[str, Any],
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        cache_control: Optional[str] = None
+    ) -> bool:
+        """Store a fetch result; False if the response forbids it or it's too large."""
+        lifetime = freshness_lifetime(cache_control, self.ttl_seconds)
+        payload = json.dumps(result)
+        if lifetime is None or len(payload) > self.max_entry_bytes:
+            return False
+        
+        def store(conn, now):
+            return self._store(conn, '''
+                INSERT OR REPLACE INTO url_cache
+                (url, result, etag, last_modified, fetched_at, expires_at, last_access, size_bytes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (url, payload, etag, last_modified, now, now + lifetime, now, len(payload)))
+        
+        self.stats['evictions'] += await self._run(store, time.time())
+        self.stats['stores'] += 1
+        return True
+    
+    async def revalidated(
+        self,
+        url: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        cache_control: Optional[str] = None
+    ):
+        """Extend a stale entry after a 304 Not Modified."""
+        lifetime = freshness_lifetime(cache_control, self.ttl_seconds) or 0.0
+        
+        def refresh(conn, now):
+            conn.execute('''
+                UPDATE url_cache
+                SET expires_at = ?, etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified)
+                WHERE url = ?
+            ''', (now + lifetime, etag, last_modified, url))
+        
+        await self._run(refresh, time.time())
+        self.stats['revalidated'] += 1
+    
+    async def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and cache size."""
+        entries, size_bytes = await self._size()
+        return dict(self.stats, entries=entries, bytes=size_bytes)
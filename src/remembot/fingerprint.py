@@ -0,0 +1,134 @@
+"""
+Content fingerprints for RememBot duplicate detection.
+Deterministic SHA-256 fingerprints for exact duplicates (canonical URLs,
+normalized text, Telegram file ids) and 64-bit SimHash signatures for
+near-duplicates.
+"""
+
+import hashlib
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Bump when fingerprint or SimHash inputs change; startup recomputes them
+FINGERPRINT_VERSION = 1
+
+# SimHash bits are split into this many bands for indexed lookup. Two
+# signatures within NEAR_DUPLICATE_DISTANCE bits of each other share at
+# least one band exactly (pigeonhole), so the band indexes find them all.
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 4
+SIMHASH_BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+NEAR_DUPLICATE_DISTANCE = SIMHASH_BANDS - 1
+
+# Query parameters that only track where a link was shared from
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'mc_cid', 'mc_eid', 'igshid',
+    '_hsenc', '_hsmi', 'mkt_tok', 'ref_src', 'ref_url', 'si', 'spm', 'trk', 'cmpid',
+}
+TRACKING_PREFIXES = ('utm_', 'pk_', 'ga_', 'hsa_', 'oly_')
+
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+
+URL_PATTERN = re.compile(r'https?://[^\s<>"\']+', re.IGNORECASE)
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def canonicalize_url(url: str) -> str:
+    """Canonical form of a URL: lowercase scheme/host, no default port,
+    fragment or tracking parameters, and sorted query parameters."""
+    url = url.strip().rstrip('.,;:!?')
+    # A closing parenthesis is usually the sentence's, unless the URL opened one
+    while url.endswith(')') and url.count(')') > url.count('('):
+        url = url[:-1].rstrip('.,;:!?')
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if parts.port and str(parts.port) != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{parts.port}'
+    
+    path = re.sub(r'/{2,}', '/', parts.path or '/')
+    if len(path) > 1:
+        path = path.rstrip('/')
+    
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    )
+    return urlunsplit((scheme, host, path, urlencode(query), ''))
+
+
+def normalize_text(text: str) -> str:
+    """Unicode-normalized, case-folded text with collapsed whitespace."""
+    return ' '.join(unicodedata.normalize('NFKC', text).casefold().split())
+
+
+def content_fingerprint(
+    original_share: str,
+    content_type: Optional[str] = None,
+    metadata: Optional[Dict[str, Any]] = None
+) -> Optional[str]:
+    """SHA-256 fingerprint identifying the same shared content.
+    
+    URLs are compared in canonical form, files by Telegram file_unique_id
+    (or stored blob digest) and everything else as normalized text.
+    """
+    metadata = metadata or {}
+    if content_type in ('image', 'document') and (metadata.get('file_unique_id') or metadata.get('blob_sha256')):
+        key = f"file:{metadata.get('file_unique_id') or metadata['blob_sha256']}"
+    else:
+        urls = URL_PATTERN.findall(original_share or '')
+        if content_type == 'url' and urls:
+            key = 'url:' + ' '.join(canonicalize_url(url) for url in urls)
+        else:
+            text = normalize_text(original_share or '')
+            if not text:
+                return None
+            key = f'text:{text}'
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _shingles(text: str) -> List[str]:
+    """Overlapping three-word shingles (or the words of very short texts)."""
+    words = WORD_PATTERN.findall(normalize_text(text))
+    if len(words) < 3:
+        return words
+    return [' '.join(words[i:i + 3]) for i in range(len(words) - 2)]
+
+
+def simhash(text: Optional[str]) -> Optional[int]:
+    """64-bit SimHash of a text as a signed integer (SQLite INTEGER range).
+    
+    Returns None for text without words.
+    """
+    features = _shingles(text or '')
+    if not features:
+        return None
+    
+    weights = [0] * SIMHASH_BITS
+    for feature in features:
+        value = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    
+    signature = sum(1 << bit for bit in range(SIMHASH_BITS) if weights[bit] > 0)
+    return signature - (1 << SIMHASH_BITS) if signature >= 1 << (SIMHASH_BITS - 1) else signature
+
+
+def simhash_bands(signature: int) -> List[int]:
+    """Band values of a signature, matching the SQL band expressions."""
+    mask = (1 << SIMHASH_BAND_BITS) - 1
+    return [(signature >> (band * SIMHASH_BAND_BITS)) & mask for band in range(SIMHASH_BANDS)]
+
+
+def simhash_band_sql(band: int, column: str = 'simhash') -> str:
+    """SQL expression for one band (the same text is used by the indexes)."""
+    return f'(({column} >> {band * SIMHASH_BAND_BITS}) & {(1 << SIMHASH_BAND_BITS) - 1})'
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two signatures."""
+    return bin((a ^ b) & ((1 << SIMHASH_BITS) - 1)).count('1')
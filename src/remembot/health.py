@@ -9,9 +9,10 @@ import json
 import time
 from datetime import datetime, timezone
 from typing import Dict, Any, Optional
-from aiohttp import web, ClientSession
+from aiohttp import web
 from aiohttp.web import Application, Response, Request
 
+from .ai_client import AIClient
 from .config import get_config
 from .database import DatabaseManager
 
@@ -21,9 +22,10 @@ logger = logging.getLogger(__name__)
 class HealthChecker:
     """Health check service for RememBot."""
     
-    def __init__(self, db_manager: DatabaseManager):
-        """Initialize health checker."""
+    def __init__(self, db_manager: DatabaseManager, ai_client: Optional[AIClient] = None):
+        """Initialize health checker (AI probes use the shared AIClient when given)."""
         self.db_manager = db_manager
+        self.ai_client = ai_client
         self.app = None
         self.runner = None
         self.site = None
@@ -52,7 +54,7 @@ class HealthChecker:
             await self.site.start()
             
             logger.info(f"Health check service started on port {config.health_check_port}")
-            
+        
         except Exception as e:
             logger.error(f"Failed to start health check service: {e}")
             raise
@@ -139,7 +141,7 @@ class HealthChecker:
         
         # Database connectivity check
         try:
-            await self.db_manager._get_connection()
+            await self.db_manager.ping()
             checks['database'] = {
                 'status': 'healthy',
                 'message': 'Database connection successful'
@@ -247,81 +249,46 @@ class HealthChecker:
     
     async def _check_ai_services(self, config) -> Dict[str, Any]:
         """Check AI service connectivity."""
-        if config.openai_api_key:
-            return await self._check_openai_service(config.openai_api_key)
-        elif config.openrouter_api_key:
-            return await self._check_openrouter_service(config.openrouter_api_key)
+        if self.ai_client is None:
+            # Without the process's shared client, probe through a short-lived one
+            ai_client = AIClient.from_config(config)
+            try:
+                return await self._probe_ai_service(ai_client)
+            finally:
+                await ai_client.close()
+        return await self._probe_ai_service(self.ai_client)
+    
+    async def _probe_ai_service(self, ai_client: AIClient) -> Dict[str, Any]:
+        """Probe the primary configured AI provider."""
+        if ai_client.has('openai'):
+            service, name = 'openai', 'OpenAI'
+        elif ai_client.has('openrouter'):
+            service, name = 'openrouter', 'OpenRouter'
         else:
             return {
                 'status': 'info',
                 'message': 'No AI services configured'
             }
-    
-    async def _check_openai_service(self, api_key: str) -> Dict[str, Any]:
-        """Check OpenAI API connectivity."""
+        
         try:
-            async with ClientSession() as session:
-                headers = {
-                    'Authorization': f'Bearer {api_key}',
-                    'Content-Type': 'application/json'
-                }
-                
-                async with session.get(
-                    'https://api.openai.com/v1/models',
-                    headers=headers,
-                    timeout=10
-                ) as response:
-                    if response.status == 200:
-                        return {
-                            'status': 'healthy',
-                            'service': 'openai',
-                            'message': 'OpenAI API accessible'
-                        }
-                    else:
-                        return {
-                            'status': 'unhealthy',
-                            'service': 'openai',
-                            'message': f'OpenAI API returned status {response.status}'
-                        }
+            status = await ai_client.probe(service)
         except Exception as e:
             return {
                 'status': 'unhealthy',
-                'service': 'openai',
-                'message': f'OpenAI API check failed: {e}'
+                'service': service,
+                'message': f'{name} API check failed: {e}'
             }
-    
-    async def _check_openrouter_service(self, api_key: str) -> Dict[str, Any]:
-        """Check OpenRouter API connectivity."""
-        try:
-            async with ClientSession() as session:
-                headers = {
-                    'Authorization': f'Bearer {api_key}',
-                    'Content-Type': 'application/json'
-                }
-                
-                async with session.get(
-                    'https://openrouter.ai/api/v1/models',
-                    headers=headers,
-                    timeout=10
-                ) as response:
-                    if response.status == 200:
-                        return {
-                            'status': 'healthy',
-                            'service': 'openrouter',
-                            'message': 'OpenRouter API accessible'
-                        }
-                    else:
-                        return {
-                            'status': 'unhealthy',
-                            'service': 'openrouter',
-                            'message': f'OpenRouter API returned status {response.status}'
-                        }
-        except Exception as e:
+        if status == 200:
             return {
-                'status': 'unhealthy',
-                'service': 'openrouter',
-                'message': f'OpenRouter API check failed: {e}'
+                'status': 'healthy',
+                'service': service,
+                'message': f'{name} API accessible'
             }
+        return {
+            'status': 'unhealthy',
+            'service': service,
+            'message': f'{name} API returned status {status}'
+        }
     
     async def _get_metrics(self) -> Dict[str, Any]:
         """Get system metrics."""
@@ -333,11 +300,9 @@ class HealthChecker:
         
         # Database metrics
         try:
-            # Get some basic database stats
-            # Note: This would need to be implemented in DatabaseManager
             metrics['database'] = {
                 'status': 'available',
-                'last_query_time': None  # Would track query performance
+                'pool': self.db_manager.get_pool_stats()
             }
         except Exception as e:
             metrics['database'] = {
@@ -345,6 +310,9 @@ class HealthChecker:
                 'error': str(e)
             }
         
+        if self.ai_client is not None:
+            metrics['ai_client'] = self.ai_client.get_stats()
+        
         # System metrics (if psutil available)
         try:
             import psutil
@@ -0,0 +1,174 @@
+"""
+Hybrid retrieval for RememBot.
+Runs the lexical (FTS5/bm25) search and the vector search concurrently and
+fuses the two rankings with reciprocal rank fusion (RRF), so an item found
+by either kind of match is returned, and one found by both ranks first.
+The top of the fused list can optionally be reranked by the AI provider.
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from .ai_client import AIClient, is_json_reply, parse_json_reply
+from .database import DatabaseManager
+from .embeddings import EmbeddingsManager
+
+logger = logging.getLogger(__name__)
+
+# Prompt template version for the LLM response cache; bump when the prompt changes
+RERANK_TEMPLATE = 'rerank:v1'
+
+# Characters of each candidate shown to the reranker
+RERANK_SNIPPET_CHARS = 300
+
+
+def reciprocal_rank_fusion(rankings: Dict[str, List[Dict[str, Any]]], k: int = 60) -> List[Dict[str, Any]]:
+    """Fuse ranked result lists by item id: score = sum of 1 / (k + rank).
+    
+    Results keep the fields of every list they appear in, plus rrf_score and
+    matched_by (names of the lists that found them), best first.
+    """
+    fused: Dict[int, Dict[str, Any]] = {}
+    for name, results in rankings.items():
+        for rank, result in enumerate(results, start=1):
+            entry = fused.setdefault(result['id'], {'rrf_score': 0.0, 'matched_by': []})
+            for key, value in result.items():
+                entry.setdefault(key, value)
+            entry['rrf_score'] += 1.0 / (k + rank)
+            entry['matched_by'].append(name)
+    # Python's sort is stable, so ties keep first-seen order (earlier lists first)
+    return sorted(fused.values(), key=lambda entry: -entry['rrf_score'])
+
+
+class HybridSearcher:
+    """Lexical + vector search fused with RRF, with optional AI reranking."""
+    
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        embeddings: Optional[EmbeddingsManager] = None,
+        ai_client: Optional[AIClient] = None,
+        candidates: int = 50,
+        rrf_k: int = 60,
+        min_similarity: float = 0.2,
+        rerank_top_n: int = 0
+    ):
+        """Initialize searcher (without embeddings only the lexical ranking is used)."""
+        self.db_manager = db_manager
+        self.embeddings = embeddings
+        self.ai_client = ai_client
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.min_similarity = min_similarity
+        self.rerank_top_n = rerank_top_n
+        self.stats = {'searches': 0, 'lexical_errors': 0, 'vector_errors': 0, 'reranked': 0, 'rerank_errors': 0}
+    
+    @classmethod
+    def from_config(
+        cls,
+        config,
+        db_manager: DatabaseManager,
+        embeddings: Optional[EmbeddingsManager] = None,
+        ai_client: Optional[AIClient] = None
+    ) -> 'HybridSearcher':
+        """Build a searcher from config."""
+        return cls(
+            db_manager,
+            embeddings,
+            ai_client,
+            candidates=getattr(config, 'search_candidates', 50),
+            rrf_k=getattr(config, 'search_rrf_k', 60),
+            min_similarity=getattr(config, 'search_min_similarity', 0.2),
+            rerank_top_n=getattr(config, 'search_rerank_top_n', 0)
+        )
+    
+    async def search(
+        self,
+        user_id: int,
+        query: str,
+        limit: int = 10,
+        offset: int = 0,
+        bypass_cache: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Items offset to offset + limit of the fused ranking for query.
+        
+        Either search failing leaves the other's ranking. Each ranking
+        contributes candidates items (more for pages beyond that), so pages
+        within the first candidates results slice one stable fused list.
+        bypass_cache reranks without reusing a cached reply.
+        """
+        self.stats['searches'] += 1
+        depth = max(self.candidates, offset + limit)
+        searches = {'lexical': self._lexical(user_id, query, depth)}
+        if self.embeddings is not None:
+            searches['vector'] = self.embeddings.semantic_search(
+                user_id, query, limit=depth, similarity_threshold=self.min_similarity
+            )
+        
+        rankings = {}
+        for name, result in zip(searches, await asyncio.gather(*searches.values(), return_exceptions=True)):
+            if isinstance(result, Exception):
+                logger.warning(f"{name.capitalize()} search failed for user {user_id}: {result}")
+                self.stats[f'{name}_errors'] += 1
+                result = []
+            rankings[name] = result
+        
+        fused = reciprocal_rank_fusion(rankings, self.rrf_k)
+        if self.rerank_top_n > 1 and len(fused) > 1 and self.ai_client is not None and self.ai_client.available:
+            fused[:self.rerank_top_n] = await self._rerank(query, fused[:self.rerank_top_n], bypass_cache)
+        return fused[offset:offset + limit]
+    
+    async def _lexical(self, user_id: int, query: str, limit: int) -> List[Dict[str, Any]]:
+        """FTS5/bm25 candidates (LIKE matches without FTS5); fusion needs no total, so none is counted."""
+        results, _ = await self.db_manager.search_content(user_id, query, limit=limit, include_total=False)
+        return results
+    
+    async def _rerank(self, query: str, results: List[Dict[str, Any]], bypass_cache: bool = False) -> List[Dict[str, Any]]:
+        """Reorder results by the AI's judgement of relevance (unchanged if that fails)."""
+        provider = 'openrouter' if self.ai_client.has('openrouter') else 'openai'
+        model = 'openai/gpt-3.5-turbo' if provider == 'openrouter' else 'gpt-3.5-turbo'
+        numbered = '\n'.join(
+            f"{number}. {' '.join((result.get('extracted_info') or result.get('original_share') or '').split())[:RERANK_SNIPPET_CHARS]}"
+            for number, result in enumerate(results, start=1)
+        )
+        prompt = f"""
+        A user searched their personal knowledge base for: "{query}"
+        
+        Candidate items:
+        {numbered}
+        
+        Respond with a JSON array of the item numbers ordered from most to least relevant to the search,
+        e.g. [3, 1, 2]. Include every number exactly once.
+        """
+        
+        try:
+            reply = await self.ai_client.chat(
+                provider,
+                [
+                    {"role": "system", "content": "You rank search results by relevance to a query."},
+                    {"role": "user", "content": prompt}
+                ],
+                model=model,
+                max_tokens=200,
+                temperature=0.0,
+                title='RememBot Search Rerank',
+                template=RERANK_TEMPLATE,
+                bypass_cache=bypass_cache,
+                validate=is_json_reply
+            )
+            order = [int(number) - 1 for number in parse_json_reply(reply)]
+        except Exception as e:
+            logger.warning(f"Reranking failed, keeping fused order: {e}")
+            self.stats['rerank_errors'] += 1
+            return results
+        
+        # Numbers the reply left out (or repeated) keep their fused order after the ranked ones
+        ranked = list(dict.fromkeys(index for index in order if 0 <= index < len(results)))
+        ranked += [index for index in range(len(results)) if index not in ranked]
+        self.stats['reranked'] += 1
+        return [results[index] for index in ranked]
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Get search counters."""
+        return dict(self.stats)
@@ -0,0 +1,137 @@
+"""
+LLM response cache for RememBot.
+Persists AI provider replies in a small SQLite file shared by all processes,
+keyed by model, prompt template version and a hash of the normalized input,
+so repeated classifications, query expansions and summaries cost no API
+call.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+import weakref
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .fetch_cache import CacheStore
+
+logger = logging.getLogger(__name__)
+
+
+def response_key(
+    provider: str,
+    model: str,
+    template: str,
+    messages: List[Dict[str, str]],
+    max_tokens: int,
+    temperature: float
+) -> str:
+    """SHA-256 cache key of a chat request.
+    
+    Message text is compared with whitespace collapsed, so prompt
+    indentation doesn't split entries.
+    """
+    normalized = [[message['role'], ' '.join(message['content'].split())] for message in messages]
+    payload = json.dumps([provider, model, template, max_tokens, temperature, normalized], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache(CacheStore):
+    """Persistent LRU cache of chat completion replies with a TTL."""
+    
+    TABLE = 'llm_cache'
+    KEY_COLUMN = 'key'
+    
+    def __init__(
+        self,
+        path: str,
+        ttl_seconds: float = 7 * 86400,
+        max_entries: int = 50000,
+        max_bytes: int = 64 * 1024 * 1024
+    ):
+        """Initialize cache (the database file is opened on first use)."""
+        super().__init__(path, max_entries, max_bytes)
+        self.ttl_seconds = ttl_seconds
+        # Per-key locks so concurrent identical requests cause a single call
+        self._key_locks: 'weakref.WeakValueDictionary[str, asyncio.Lock]' = weakref.WeakValueDictionary()
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'bypassed': 0, 'stores': 0, 'evictions': 0}
+    
+    @classmethod
+    def from_config(cls, config, db_path: str) -> Optional['LLMCache']:
+        """Build a cache from config (None when disabled), next to the database by default."""
+        if not getattr(config, 'llm_cache_enabled', True):
+            return None
+        path = getattr(config, 'llm_cache_path', None) or str(Path(db_path).resolve().parent / 'llm_cache.db')
+        return cls(
+            path,
+            ttl_seconds=getattr(config, 'llm_cache_ttl', 7 * 86400),
+            max_entries=getattr(config, 'llm_cache_max_entries', 50000),
+            max_bytes=getattr(config, 'llm_cache_max_mb', 64) * 1024 * 1024
+        )
+    
+    def _create_schema(self, conn: sqlite3.Connection):
+        """Create the response cache table."""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                template TEXT NOT NULL,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_lru ON llm_cache(last_access)')
+    
+    def lock(self, key: str) -> asyncio.Lock:
+        """Lock serializing calls for one cache key within this process."""
+        lock = self._key_locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._key_locks[key] = lock
+        return lock
+    
+    async def get(self, key: str) -> Optional[str]:
+        """Cached reply for a key, or None when missing or expired."""
+        def lookup(conn, key, now):
+            row = conn.execute('SELECT response, expires_at FROM llm_cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                conn.execute('DELETE FROM llm_cache WHERE key = ?', (key,))
+            else:
+                conn.execute('UPDATE llm_cache SET last_access = ?, hits = hits + 1 WHERE key = ?', (now, key))
+            return row
+        
+        now = time.time()
+        row = await self._run(lookup, key, now)
+        if row is None or row[1] <= now:
+            self.stats['expired' if row else 'misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        return row[0]
+    
+    async def put(self, key: str, template: str, model: str, response: str):
+        """Store a reply for the configured TTL."""
+        size = len(response.encode('utf-8'))
+        
+        def store(conn, now):
+            return self._store(conn, '''
+                INSERT OR REPLACE INTO llm_cache
+                (key, template, model, response, created_at, expires_at, last_access, size_bytes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (key, template, model, response, now, now + self.ttl_seconds, now, size))
+        
+        self.stats['evictions'] += await self._run(store, time.time())
+        self.stats['stores'] += 1
+    
+    async def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and cache size."""
+        entries, size_bytes = await self._size()
+        return dict(self.stats, entries=entries, bytes=size_bytes)
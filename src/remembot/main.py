@@ -12,6 +12,7 @@ from pathlib import Path
 
 from .bot import RememBot
 from .database import DatabaseManager
+from .db_pool import StorageProfile
 from .config import config_manager
 
 
@@ -23,7 +24,11 @@ def main():
         config_manager.validate_startup_requirements()
         
         # Initialize database
-        db_manager = DatabaseManager(config.database_path)
+        db_manager = DatabaseManager(
+            config.database_path,
+            pool_size=config.db_pool_size,
+            storage_profile=StorageProfile.from_config(config)
+        )
         
         # Initialize and run bot
         bot = RememBot(config.telegram_bot_token, db_manager)
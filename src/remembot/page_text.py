@@ -0,0 +1,371 @@
+"""
+Web page text extraction for RememBot.
+StreamingTextExtractor turns a page into text while it downloads: the
+charset is sniffed from the first bytes, lxml parses each chunk as it
+arrives, and reading stops once enough text has been collected.
+readability_text() works on a whole document instead, scoring blocks of
+text to keep the main content and drop navigation, sidebars and comments.
+"""
+
+import codecs
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+
+from bs4 import BeautifulSoup, Tag
+from bs4.builder import builder_registry
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+# Content types worth downloading; anything else is rejected from the headers
+HTML_CONTENT_TYPES = {'text/html', 'application/xhtml+xml'}
+TEXT_CONTENT_TYPES = HTML_CONTENT_TYPES | {'text/plain'}
+
+# Bytes buffered before deciding the charset (meta tags sit near the top)
+SNIFF_BYTES = 2048
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Text in these elements is page chrome or code, not content
+SKIPPED_TAGS = {'script', 'style', 'noscript', 'template', 'nav', 'footer', 'header', 'head', 'svg'}
+# Elements whose boundaries separate words
+BLOCK_TAGS = {
+    'p', 'div', 'br', 'li', 'ul', 'ol', 'tr', 'td', 'th', 'table', 'section', 'article',
+    'main', 'aside', 'blockquote', 'pre', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'dt', 'dd', 'hr'
+}
+
+# BeautifulSoup tree builders, fastest first; html5lib is optional
+HTML_PARSERS = ('lxml', 'html.parser', 'html5lib')
+
+# Ways of turning a fetched page into text (see ContentProcessor._fetch_url)
+URL_EXTRACTORS = ('stream', 'readability', 'basic')
+
+# Chrome stripped by the basic extractor and before readability scoring
+BASIC_STRIPPED_TAGS = ['script', 'style', 'nav', 'footer', 'header']
+READABILITY_STRIPPED_TAGS = [
+    'script', 'style', 'noscript', 'template', 'svg', 'iframe', 'form', 'button',
+    'input', 'select', 'nav', 'footer', 'aside'
+]
+
+# class/id hints for and against an element being main content
+POSITIVE_HINTS = re.compile(r'article|body|content|entry|hentry|main|page|post|text|blog|story|recipe', re.IGNORECASE)
+NEGATIVE_HINTS = re.compile(
+    r'comment|disqus|footer|footnote|masthead|sidebar|sponsor|promo|related|share|social|'
+    r'widget|menu|nav|breadcrumb|cookie|banner|advert|\bads?\b|newsletter|subscribe|popup|modal|tags?\b',
+    re.IGNORECASE
+)
+# Elements whose own text is scored as a paragraph
+SCORED_TAGS = ['p', 'pre', 'td', 'blockquote']
+# A div without these children is treated like a paragraph
+DIV_BLOCK_CHILDREN = {'a', 'blockquote', 'dl', 'div', 'img', 'ol', 'p', 'pre', 'table', 'ul', 'section', 'article'}
+TAG_WEIGHTS = {'div': 5, 'article': 10, 'section': 3, 'pre': 3, 'td': 3, 'blockquote': 3,
+               'form': -3, 'ol': -3, 'ul': -3, 'li': -3, 'h1': -5, 'h2': -5, 'h3': -5, 'th': -5}
+MIN_PARAGRAPH_CHARS = 25
+
+META_CHARSET_PATTERN = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([a-zA-Z0-9_.:-]+)', re.IGNORECASE)
+
+BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# Browsers decode these labels as windows-1252, and so do pages that use them
+CHARSET_ALIASES = {'iso-8859-1': 'cp1252', 'latin1': 'cp1252', 'latin-1': 'cp1252', 'us-ascii': 'cp1252', 'ascii': 'cp1252'}
+
+
+def _known_charset(name: Optional[str]) -> Optional[str]:
+    """Python codec for a charset label, or None if it isn't one."""
+    if not name:
+        return None
+    name = name.strip().strip('"\'').lower()
+    name = CHARSET_ALIASES.get(name, name)
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+
+def sniff_charset(head: bytes, declared: Optional[str] = None) -> str:
+    """Charset of a page from its first bytes.
+    
+    A byte order mark wins, then the Content-Type charset, then a <meta>
+    declaration, then UTF-8.
+    """
+    for bom, charset in BOMS:
+        if head.startswith(bom):
+            return charset
+    charset = _known_charset(declared)
+    if charset:
+        return charset
+    match = META_CHARSET_PATTERN.search(head[:SNIFF_BYTES])
+    if match:
+        charset = _known_charset(match.group(1).decode('ascii', 'ignore'))
+        if charset:
+            return charset
+    return 'utf-8'
+
+
+class _TextTarget:
+    """lxml parser target collecting the title and visible text."""
+    
+    def __init__(self):
+        self.title: List[str] = []
+        self.pieces: List[str] = []
+        self.length = 0
+        self._skip_depth = 0
+        self._in_title = False
+    
+    def start(self, tag, attrib):
+        """Enter an element."""
+        if not isinstance(tag, str):
+            return
+        tag = tag.lower()
+        if tag == 'title':
+            self._in_title = True
+        elif tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self.pieces.append(' ')
+    
+    def end(self, tag):
+        """Leave an element."""
+        if not isinstance(tag, str):
+            return
+        tag = tag.lower()
+        if tag == 'title':
+            self._in_title = False
+        elif tag in SKIPPED_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        elif tag in BLOCK_TAGS:
+            self.pieces.append(' ')
+    
+    def data(self, data):
+        """Collect text outside skipped elements."""
+        if self._in_title:
+            self.title.append(data)
+        elif not self._skip_depth:
+            self.pieces.append(data)
+            self.length += len(data.strip())
+    
+    def close(self):
+        """End of document (results are read from the attributes)."""
+        return None
+
+
+class StreamingTextExtractor:
+    """Extracts (title, text) from a page fed to it chunk by chunk.
+    
+    feed() returns True once max_chars of text have been collected, at
+    which point the rest of the download can be skipped. Memory use is
+    bounded by max_chars plus one chunk, however large the page is.
+    """
+    
+    def __init__(self, content_type: str = 'text/html', charset: Optional[str] = None, max_chars: int = 10000):
+        """Initialize extractor for a response's content type and declared charset."""
+        self.html = content_type not in ('text/plain',)
+        self.declared_charset = charset
+        self.max_chars = max_chars
+        self.charset: Optional[str] = None
+        self.bytes_fed = 0
+        self.truncated = False
+        self._head = b''
+        self._decoder = None
+        self._target = _TextTarget()
+        self._parser = etree.HTMLParser(target=self._target, recover=True) if self.html else None
+    
+    @property
+    def complete(self) -> bool:
+        """True once enough text has been collected."""
+        return self._target.length >= self.max_chars
+    
+    def feed(self, chunk: bytes) -> bool:
+        """Parse the next chunk of the body; returns True when no more is needed."""
+        self.bytes_fed += len(chunk)
+        if self._decoder is None:
+            # Hold the first bytes back until the charset can be decided
+            self._head += chunk
+            if len(self._head) < SNIFF_BYTES:
+                return False
+            chunk, self._head = self._head, b''
+            self._start_decoding(chunk)
+        self._feed_text(self._decoder.decode(chunk))
+        return self.complete
+    
+    def _start_decoding(self, head: bytes):
+        """Pick the charset from the buffered head of the body."""
+        self.charset = sniff_charset(head, self.declared_charset)
+        self._decoder = codecs.getincrementaldecoder(self.charset)(errors='replace')
+    
+    def _feed_text(self, text: str):
+        """Pass decoded text to the parser (or straight through for plain text)."""
+        if not text:
+            return
+        if self._parser is not None:
+            self._parser.feed(text)
+        else:
+            self._target.data(text)
+    
+    def close(self) -> Tuple[str, str]:
+        """Finish parsing and return (title, whitespace-normalized text)."""
+        if self._decoder is None:
+            self._start_decoding(self._head)
+            self._feed_text(self._decoder.decode(self._head))
+            self._head = b''
+        self._feed_text(self._decoder.decode(b'', final=True))
+        if self._parser is not None and self.bytes_fed:
+            try:
+                self._parser.close()
+            except etree.XMLSyntaxError:
+                # Nothing parseable (e.g. whitespace only); keep what was collected
+                pass
+        
+        title = ' '.join(''.join(self._target.title).split()) or "No title"
+        text = ' '.join(''.join(self._target.pieces).split())
+        self.truncated = len(text) > self.max_chars
+        return title, text[:self.max_chars].rstrip()
+
+
+def resolve_parser(name: str) -> str:
+    """A BeautifulSoup parser that is installed, falling back to html.parser."""
+    if builder_registry.lookup(name) is not None:
+        return name
+    logger.warning(f"HTML parser {name!r} is not installed, using html.parser")
+    return 'html.parser'
+
+
+def _normalize(text: str) -> str:
+    """Collapse all whitespace runs to single spaces."""
+    return ' '.join(text.split())
+
+
+def _title(soup: BeautifulSoup) -> str:
+    """The document title, or "No title"."""
+    title = soup.find('title')
+    return _normalize(title.get_text()) if title and title.get_text().strip() else "No title"
+
+
+def basic_text(html: str, parser: str = 'lxml') -> Tuple[str, str]:
+    """(title, text) of the whole page minus scripts, styles and nav/header/footer."""
+    soup = BeautifulSoup(html, parser)
+    title = _title(soup)
+    for unwanted in soup.find_all(BASIC_STRIPPED_TAGS):
+        unwanted.decompose()
+    return title, _normalize(soup.get_text(' '))
+
+
+def _class_weight(element) -> int:
+    """Score adjustment from an element's class and id."""
+    weight = 0
+    for hint in (' '.join(element.get('class') or []), element.get('id') or ''):
+        if hint:
+            if NEGATIVE_HINTS.search(hint):
+                weight -= 25
+            if POSITIVE_HINTS.search(hint):
+                weight += 25
+    return weight
+
+
+def _link_density(element) -> float:
+    """Share of an element's text that is link text."""
+    text_length = len(_normalize(element.get_text(' ')))
+    if not text_length:
+        return 0.0
+    link_length = sum(len(_normalize(link.get_text(' '))) for link in element.find_all('a'))
+    return link_length / text_length
+
+
+def _is_unlikely(element) -> bool:
+    """True for boilerplate containers (comments, sidebars, share bars...)."""
+    if element.name in ('html', 'body', 'article', 'main'):
+        return False
+    hint = ' '.join(element.get('class') or []) + ' ' + (element.get('id') or '')
+    return bool(NEGATIVE_HINTS.search(hint)) and not POSITIVE_HINTS.search(hint)
+
+
+def _prune(root, predicate):
+    """Remove every element under root that matches predicate (top-down, so
+    a removed element's descendants are never visited)."""
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        for child in [child for child in node.contents if isinstance(child, Tag)]:
+            if predicate(child):
+                child.decompose()
+            else:
+                stack.append(child)
+
+
+def _low_value_block(block) -> bool:
+    """Link lists and boilerplate blocks left inside the chosen content."""
+    if block.name not in ('div', 'ul', 'ol', 'table', 'section'):
+        return False
+    if _class_weight(block) < 0:
+        return True
+    return _link_density(block) > 0.5 and len(_normalize(block.get_text(' '))) < 500
+
+
+def readability_text(html: str, parser: str = 'lxml') -> Tuple[str, str]:
+    """(title, main content text) using readability-style block scoring.
+    
+    Each paragraph scores for its length and commas; the score flows to
+    its parent and (halved) grandparent, is adjusted by class/id hints and
+    scaled down by link density. The best container, plus siblings that
+    score nearly as well, is the article. Falls back to basic_text() when
+    no paragraph qualifies.
+    """
+    soup = BeautifulSoup(html, parser)
+    title = _title(soup)
+    for unwanted in soup.find_all(READABILITY_STRIPPED_TAGS):
+        unwanted.decompose()
+    _prune(soup, _is_unlikely)
+    
+    paragraphs = soup.find_all(SCORED_TAGS) + [
+        div for div in soup.find_all('div')
+        if not any(isinstance(child, Tag) and child.name in DIV_BLOCK_CHILDREN for child in div.contents)
+    ]
+    scores: Dict[int, float] = {}
+    candidates = {}
+    for paragraph in paragraphs:
+        text = _normalize(paragraph.get_text(' '))
+        if len(text) < MIN_PARAGRAPH_CHARS:
+            continue
+        score = 1 + text.count(',') + min(len(text) // 100, 3)
+        for level, ancestor in enumerate((paragraph.parent, paragraph.parent.parent if paragraph.parent else None)):
+            if ancestor is None or ancestor.name == '[document]':
+                break
+            key = id(ancestor)
+            if key not in candidates:
+                candidates[key] = ancestor
+                scores[key] = TAG_WEIGHTS.get(ancestor.name, 0) + _class_weight(ancestor)
+            scores[key] += score if level == 0 else score / 2
+    
+    if not candidates:
+        return basic_text(html, parser)
+    
+    for key, candidate in candidates.items():
+        scores[key] *= 1 - _link_density(candidate)
+    top_key = max(scores, key=scores.get)
+    top = candidates[top_key]
+    
+    # Siblings can hold the rest of the article (e.g. split by an ad slot)
+    threshold = max(10.0, scores[top_key] * 0.2)
+    parts = []
+    siblings = top.parent.find_all(True, recursive=False) if top.parent else [top]
+    for sibling in siblings:
+        if sibling is top or scores.get(id(sibling), float('-inf')) >= threshold:
+            parts.append(sibling)
+        elif sibling.name == 'p':
+            text = _normalize(sibling.get_text(' '))
+            if len(text) > 80 and _link_density(sibling) < 0.25:
+                parts.append(sibling)
+    
+    # Drop link lists and other low-text blocks left inside the article
+    for part in parts:
+        _prune(part, _low_value_block)
+    
+    return title, _normalize(' '.join(part.get_text(' ') for part in parts))
+
+
+# Full-document extractors by name (the streaming extractor works on the download itself)
+DOCUMENT_EXTRACTORS = {'readability': readability_text, 'basic': basic_text}
@@ -0,0 +1,156 @@
+"""
+Parser wakeup channel for RememBot.
+Lets the ingest path nudge background parsers over local Unix datagram
+sockets, so new items are picked up without waiting for the next poll.
+"""
+
+import asyncio
+import errno
+import hashlib
+import logging
+import os
+import socket
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+HAS_UNIX_SOCKETS = hasattr(socket, 'AF_UNIX')
+
+
+def wakeup_dir(db_path: str) -> Path:
+    """Directory holding one wakeup socket per parser process for a database.
+    
+    Lives under the temp dir (keyed by the database path) because Unix
+    socket paths are limited to ~100 bytes.
+    """
+    key = hashlib.sha256(str(Path(db_path).resolve()).encode('utf-8')).hexdigest()[:16]
+    return Path(tempfile.gettempdir()) / f'remembot-wakeup-{key}'
+
+
+class ParserNotifier:
+    """Sends a wakeup datagram to every parser listening on a database."""
+    
+    def __init__(self, db_path: str):
+        """Initialize notifier."""
+        self.directory = wakeup_dir(db_path)
+        self._sock: Optional[socket.socket] = None
+    
+    def notify(self) -> int:
+        """Wake listening parsers; returns how many were reached. Never raises."""
+        if not HAS_UNIX_SOCKETS:
+            return 0
+        try:
+            targets = [entry.path for entry in os.scandir(self.directory) if entry.name.endswith('.sock')]
+        except OSError:
+            return 0
+        
+        if self._sock is None:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sock.setblocking(False)
+        
+        reached = 0
+        for target in targets:
+            try:
+                self._sock.sendto(b'1', target)
+                reached += 1
+            except BlockingIOError:
+                # Listener's queue is full, so a wakeup is already pending
+                reached += 1
+            except OSError as e:
+                if e.errno in (errno.ECONNREFUSED, errno.ENOENT):
+                    # Parser died without cleaning up its socket
+                    try:
+                        os.unlink(target)
+                    except OSError:
+                        pass
+                else:
+                    logger.debug(f"Parser wakeup to {target} failed: {e}")
+        return reached
+    
+    def close(self):
+        """Close the sending socket."""
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+class ParserWakeupListener:
+    """Receives wakeups for one parser process inside the running event loop."""
+    
+    def __init__(self, db_path: str, worker_id: str):
+        """Initialize listener (call start() from the event loop)."""
+        safe_name = hashlib.sha256(worker_id.encode('utf-8')).hexdigest()[:16]
+        self.path = wakeup_dir(db_path) / f'{safe_name}.sock'
+        self._sock: Optional[socket.socket] = None
+        self._event: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    @property
+    def active(self) -> bool:
+        """True when wakeups can be received (otherwise callers just poll)."""
+        return self._sock is not None
+    
+    def start(self) -> bool:
+        """Bind the socket and register it with the loop; False if unsupported."""
+        if not HAS_UNIX_SOCKETS:
+            return False
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        try:
+            self.path.parent.mkdir(mode=0o700, exist_ok=True)
+            if self.path.exists():
+                self.path.unlink()
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            sock.bind(str(self.path))
+            self._loop.add_reader(sock.fileno(), self._on_readable)
+        except (OSError, NotImplementedError) as e:
+            logger.warning(f"Parser wakeup socket unavailable, polling only: {e}")
+            return False
+        self._sock = sock
+        return True
+    
+    def _on_readable(self):
+        """Drain queued datagrams; any number of them is one wakeup."""
+        while True:
+            try:
+                self._sock.recv(64)
+            except OSError:
+                # BlockingIOError once the queue is empty
+                break
+        self._event.set()
+    
+    async def wait(self, timeout: float) -> bool:
+        """Wait up to timeout seconds; True if woken by a notification."""
+        if self._event is None:
+            await asyncio.sleep(timeout)
+            return False
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._event.clear()
+    
+    def wake(self):
+        """Wake a pending wait() from this process; safe from signal handlers."""
+        if self._event is not None:
+            self._loop.call_soon_threadsafe(self._event.set)
+    
+    def close(self):
+        """Unregister and remove the socket."""
+        if self._sock is None:
+            return
+        try:
+            self._loop.remove_reader(self._sock.fileno())
+        except Exception:
+            pass
+        self._sock.close()
+        self._sock = None
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
@@ -4,63 +4,81 @@ Processes natural language queries and converts them to database searches.
 """
 
 import logging
-import os
 from typing import Dict, List, Any, Optional
 import json
 
+from .ai_client import AIClient, is_json_reply, parse_json_reply
 from .database import DatabaseManager
+from .embeddings import EmbeddingsManager
+from .hybrid_search import HybridSearcher
 from .config import get_config
 
-# Optional integrations
-try:
-    import openai
-    HAS_OPENAI = True
-except ImportError:
-    HAS_OPENAI = False
-
-try:
-    import aiohttp
-    HAS_AIOHTTP = True
-except ImportError:
-    HAS_AIOHTTP = False
-
 logger = logging.getLogger(__name__)
 
+# Prompt template versions for the LLM response cache; bump when a prompt changes
+EXPAND_QUERY_TEMPLATE = 'expand_query:v1'
+SUMMARIZE_TEMPLATE = 'summarize:v1'
+
 
 class QueryHandler:
     """Handles user queries and converts them to database searches."""
     
-    def __init__(self, db_manager: DatabaseManager):
-        """Initialize query handler."""
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        ai_client: Optional[AIClient] = None,
+        embeddings_manager: Optional[EmbeddingsManager] = None
+    ):
+        """Initialize query handler (creating its own AIClient if none is shared).
+        
+        With an embeddings manager, first pages fuse keyword and semantic
+        search; without one they use keyword search only.
+        """
         self.db_manager = db_manager
-        self.openai_client = None
-        self.openrouter_api_key = None
+        self._owns_ai_client = ai_client is None
         
         try:
             self.config = get_config()
-            # Set up OpenRouter if available
-            if self.config.openrouter_api_key:
-                self.openrouter_api_key = self.config.openrouter_api_key
-            
-            # Set up OpenAI as fallback if available
-            if HAS_OPENAI and self.config.openai_api_key:
-                self.openai_client = openai.AsyncOpenAI(api_key=self.config.openai_api_key)
         except Exception:
             # Fallback for testing
-            if os.getenv('OPENROUTER_API_KEY'):
-                self.openrouter_api_key = os.getenv('OPENROUTER_API_KEY')
-            if HAS_OPENAI and os.getenv('OPENAI_API_KEY'):
-                self.openai_client = openai.AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+            from types import SimpleNamespace
+            self.config = SimpleNamespace()
+        
+        if ai_client is None:
+            database_path = getattr(self.config, 'database_path', None)
+            # Without config (testing), keys come from the environment
+            ai_client = AIClient.from_config(self.config, database_path) if database_path else AIClient.from_config()
+        self.ai_client = ai_client
+        self.hybrid = HybridSearcher.from_config(self.config, db_manager, embeddings_manager, ai_client)
     
-    async def process_query(self, user_id: int, query: str) -> List[Dict[str, Any]]:
-        """Process a natural language query and return results."""
-        # First, try a simple search
-        results = await self.db_manager.search_content(user_id, query, limit=10)
+    async def process_query(
+        self,
+        user_id: int,
+        query: str,
+        cursor: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 10,
+        bypass_cache: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Process a natural language query and return results.
+        
+        Searches page through the hybrid (keyword + semantic) ranking: pass
+        the number of results already shown as offset. Without a query the
+        user's items are listed newest first; pass
+        DatabaseManager.page_cursor(results[-1]) as cursor for the next page.
+        bypass_cache asks the AI provider again instead of reusing cached
+        reranking and query expansion replies.
+        """
+        if not query or not query.strip():
+            results, _ = await self.db_manager.get_user_content(user_id, limit=limit, cursor=cursor)
+            return results
+        
+        results = await self.hybrid.search(user_id, query, limit=limit, offset=offset, bypass_cache=bypass_cache)
         
-        # If we have AI available and no/few results, try AI-enhanced search
-        if (self.openrouter_api_key and HAS_AIOHTTP) or self.openai_client:
+        # AI query expansion only when hybrid search still finds next to nothing
+        if offset == 0 and self.ai_client.available:
             if len(results) < 3:
-                enhanced_results = await self._ai_enhanced_search(user_id, query)
+                enhanced_results = await self._ai_enhanced_search(user_id, query, bypass_cache)
                 if enhanced_results:
                     # Combine and deduplicate results
                     all_results = results + enhanced_results
@@ -74,22 +92,22 @@ class QueryHandler:
         
         return results
     
-    async def _ai_enhanced_search(self, user_id: int, query: str) -> List[Dict[str, Any]]:
+    async def _ai_enhanced_search(self, user_id: int, query: str, bypass_cache: bool = False) -> List[Dict[str, Any]]:
         """Use AI to generate better search terms and strategies."""
         # Try OpenRouter first if available
-        if self.openrouter_api_key and HAS_AIOHTTP:
+        if self.ai_client.has('openrouter'):
             try:
-                return await self._openrouter_enhanced_search(user_id, query)
+                return await self._openrouter_enhanced_search(user_id, query, bypass_cache)
             except Exception as e:
                 logger.warning(f"OpenRouter enhanced search failed, falling back: {e}")
         
         # Fallback to OpenAI if available
-        if self.openai_client:
-            return await self._openai_enhanced_search(user_id, query)
+        if self.ai_client.has('openai'):
+            return await self._openai_enhanced_search(user_id, query, bypass_cache)
         
         return []
     
-    async def _openrouter_enhanced_search(self, user_id: int, query: str) -> List[Dict[str, Any]]:
+    async def _openrouter_enhanced_search(self, user_id: int, query: str, bypass_cache: bool = False) -> List[Dict[str, Any]]:
         """Use OpenRouter API to generate better search terms."""
         try:
             # First, get user stats to understand their content
@@ -110,65 +128,38 @@ class QueryHandler:
             Focus on practical, concrete terms that would appear in stored content.
             """
             
-            headers = {
-                'Authorization': f'Bearer {self.openrouter_api_key}',
-                'Content-Type': 'application/json',
-                'HTTP-Referer': 'https://github.com/raymondclowe/RememBot',
-                'X-Title': 'RememBot Enhanced Search'
-            }
-            
-            payload = {
-                'model': 'openai/gpt-3.5-turbo',
-                'messages': [
+            response_text = await self.ai_client.chat(
+                'openrouter',
+                [
                     {"role": "system", "content": "You are a search optimization expert helping users find content in their personal knowledge base."},
                     {"role": "user", "content": prompt}
                 ],
-                'max_tokens': 150,
-                'temperature': 0.3
-            }
+                model='openai/gpt-3.5-turbo',
+                max_tokens=150,
+                temperature=0.3,
+                title='RememBot Enhanced Search',
+                template=EXPAND_QUERY_TEMPLATE,
+                bypass_cache=bypass_cache,
+                validate=is_json_reply
+            )
+            
+            # Parse search terms
+            try:
+                search_terms = parse_json_reply(response_text)
+            except json.JSONDecodeError:
+                logger.warning(f"Failed to parse OpenRouter search terms: {response_text}")
+                return []
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    'https://openrouter.ai/api/v1/chat/completions',
-                    headers=headers,
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    
-                    if response.status != 200:
-                        raise Exception(f"OpenRouter API error: {response.status}")
-                    
-                    data = await response.json()
-                    response_text = data['choices'][0]['message']['content'].strip()
-                    
-                    # Parse search terms
-                    try:
-                        # Remove any markdown formatting
-                        if "```json" in response_text:
-                            response_text = response_text.split("```json")[1].split("```")[0]
-                        elif "```" in response_text:
-                            response_text = response_text.split("```")[1].split("```")[0]
-                        
-                        search_terms = json.loads(response_text)
-                        
-                        # Perform searches with each term
-                        all_results = []
-                        for term in search_terms:
-                            if isinstance(term, str) and term.strip():
-                                results = await self.db_manager.search_content(user_id, term.strip(), limit=5)
-                                all_results.extend(results)
-                        
-                        return all_results
-                        
-                    except json.JSONDecodeError:
-                        logger.warning(f"Failed to parse OpenRouter search terms: {response_text}")
-                        return []
+            # One query for all terms, ranked and deduplicated in SQL
+            return await self.db_manager.search_any_terms(
+                user_id, search_terms if isinstance(search_terms, list) else [], limit=10
+            )
         
         except Exception as e:
             logger.error(f"Error in OpenRouter enhanced search: {e}")
             return []
     
-    async def _openai_enhanced_search(self, user_id: int, query: str) -> List[Dict[str, Any]]:
+    async def _openai_enhanced_search(self, user_id: int, query: str, bypass_cache: bool = False) -> List[Dict[str, Any]]:
         """Use OpenAI to generate better search terms and strategies."""
         try:
             # First, get user stats to understand their content
@@ -189,64 +180,58 @@ class QueryHandler:
             Focus on practical, concrete terms that would appear in stored content.
             """
             
-            response = await self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
+            response_text = await self.ai_client.chat(
+                'openai',
+                [
                     {"role": "system", "content": "You are a search optimization expert helping users find content in their personal knowledge base."},
                     {"role": "user", "content": prompt}
                 ],
+                model="gpt-3.5-turbo",
                 max_tokens=150,
-                temperature=0.3
+                temperature=0.3,
+                template=EXPAND_QUERY_TEMPLATE,
+                bypass_cache=bypass_cache,
+                validate=is_json_reply
             )
             
-            response_text = response.choices[0].message.content.strip()
-            
             # Parse search terms
             try:
-                # Remove any markdown formatting
-                if "```json" in response_text:
-                    response_text = response_text.split("```json")[1].split("```")[0]
-                elif "```" in response_text:
-                    response_text = response_text.split("```")[1].split("```")[0]
-                
-                search_terms = json.loads(response_text)
-                
-                # Perform searches with each term
-                all_results = []
-                for term in search_terms:
-                    if isinstance(term, str) and term.strip():
-                        results = await self.db_manager.search_content(user_id, term.strip(), limit=5)
-                        all_results.extend(results)
-                
-                return all_results
-                
+                search_terms = parse_json_reply(response_text)
             except json.JSONDecodeError:
                 logger.warning(f"Failed to parse AI search terms: {response_text}")
                 return []
+            
+            # One query for all terms, ranked and deduplicated in SQL
+            return await self.db_manager.search_any_terms(
+                user_id, search_terms if isinstance(search_terms, list) else [], limit=10
+            )
         
         except Exception as e:
             logger.error(f"Error in AI-enhanced search: {e}")
             return []
     
-    async def summarize_results(self, results: List[Dict[str, Any]], query: str) -> str:
-        """Summarize search results using AI if available."""
-        if not ((self.openrouter_api_key and HAS_AIOHTTP) or self.openai_client) or not results:
+    async def summarize_results(self, results: List[Dict[str, Any]], query: str, bypass_cache: bool = False) -> str:
+        """Summarize search results using AI if available.
+        
+        bypass_cache asks the AI provider again instead of reusing a cached summary.
+        """
+        if not self.ai_client.available or not results:
             return self._simple_summary(results, query)
         
         # Try OpenRouter first if available
-        if self.openrouter_api_key and HAS_AIOHTTP:
+        if self.ai_client.has('openrouter'):
             try:
-                return await self._openrouter_summarize_results(results, query)
+                return await self._openrouter_summarize_results(results, query, bypass_cache)
             except Exception as e:
                 logger.warning(f"OpenRouter summarization failed, falling back: {e}")
         
         # Fallback to OpenAI if available
-        if self.openai_client:
-            return await self._openai_summarize_results(results, query)
+        if self.ai_client.has('openai'):
+            return await self._openai_summarize_results(results, query, bypass_cache)
         
         return self._simple_summary(results, query)
     
-    async def _openrouter_summarize_results(self, results: List[Dict[str, Any]], query: str) -> str:
+    async def _openrouter_summarize_results(self, results: List[Dict[str, Any]], query: str, bypass_cache: bool = False) -> str:
         """Summarize search results using OpenRouter API."""
         try:
             # Prepare content for summarization
@@ -274,42 +259,25 @@ class QueryHandler:
             Keep the summary under 200 words and focus on being helpful and informative.
             """
             
-            headers = {
-                'Authorization': f'Bearer {self.openrouter_api_key}',
-                'Content-Type': 'application/json',
-                'HTTP-Referer': 'https://github.com/raymondclowe/RememBot',
-                'X-Title': 'RememBot Search Summary'
-            }
-            
-            payload = {
-                'model': 'openai/gpt-3.5-turbo',
-                'messages': [
+            return await self.ai_client.chat(
+                'openrouter',
+                [
                     {"role": "system", "content": "You are a helpful assistant that summarizes search results from a personal knowledge base."},
                     {"role": "user", "content": prompt}
                 ],
-                'max_tokens': 250,
-                'temperature': 0.5
-            }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    'https://openrouter.ai/api/v1/chat/completions',
-                    headers=headers,
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    
-                    if response.status != 200:
-                        raise Exception(f"OpenRouter API error: {response.status}")
-                    
-                    data = await response.json()
-                    return data['choices'][0]['message']['content'].strip()
+                model='openai/gpt-3.5-turbo',
+                max_tokens=250,
+                temperature=0.5,
+                title='RememBot Search Summary',
+                template=SUMMARIZE_TEMPLATE,
+                bypass_cache=bypass_cache
+            )
         
         except Exception as e:
             logger.error(f"Error in OpenRouter summarization: {e}")
             return self._simple_summary(results, query)
     
-    async def _openai_summarize_results(self, results: List[Dict[str, Any]], query: str) -> str:
+    async def _openai_summarize_results(self, results: List[Dict[str, Any]], query: str, bypass_cache: bool = False) -> str:
         """Summarize search results using OpenAI if available."""
         
         try:
@@ -338,17 +306,18 @@ class QueryHandler:
             Keep the summary under 200 words and focus on being helpful and informative.
             """
             
-            response = await self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
+            return await self.ai_client.chat(
+                'openai',
+                [
                     {"role": "system", "content": "You are a helpful assistant that summarizes search results from a personal knowledge base."},
                     {"role": "user", "content": prompt}
                 ],
+                model="gpt-3.5-turbo",
                 max_tokens=250,
-                temperature=0.5
+                temperature=0.5,
+                template=SUMMARIZE_TEMPLATE,
+                bypass_cache=bypass_cache
             )
-            
-            return response.choices[0].message.content.strip()
         
         except Exception as e:
             logger.error(f"Error in AI summarization: {e}")
@@ -369,4 +338,9 @@ class QueryHandler:
         for content_type, count in type_counts.items():
             summary += f"• {count} {content_type} item(s)\n"
         
-        return summary
\ No newline at end of file
+        return summary
+    
+    async def close(self):
+        """Close the AI client if this handler created it."""
+        if self._owns_ai_client:
+            await self.ai_client.close()
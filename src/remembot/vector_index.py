@@ -0,0 +1,348 @@
+"""
+Vector index for RememBot semantic search.
+Holds one user's unit-length float32 embeddings as a contiguous matrix,
+memory-mapped from an .npy snapshot, and answers cosine top-k queries with
+one matrix-vector product and argpartition. Large indexes add an inverted
+file (IVF) layer: rows are grouped by nearest k-means centroid and a query
+only scans the lists of its closest centroids.
+"""
+
+import fcntl
+import json
+import logging
+import math
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rows added since the snapshot before compaction writes a new one
+MIN_COMPACT_ROWS = 1024
+
+# IVF training: k-means runs on a sample of this many rows per list
+KMEANS_SAMPLE_PER_LIST = 64
+KMEANS_ITERATIONS = 12
+# Rows scored per matrix product while assigning lists
+ASSIGN_CHUNK_ROWS = 65536
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length (zero rows stay zero) as contiguous float32."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indexes of the k highest scores, best first."""
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.size:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.size)
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def default_list_count(rows: int) -> int:
+    """IVF list count for an index of this many rows (about the square root)."""
+    return int(min(max(math.sqrt(rows), 1), 4096))
+
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of each row's most similar centroid."""
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_CHUNK_ROWS):
+        chunk = vectors[start:start + ASSIGN_CHUNK_ROWS]
+        labels[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return labels
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """Unit-length centroids of k clusters of unit-length rows (cosine k-means).
+    
+    Trains on a random sample; empty clusters are re-seeded from random rows.
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(vectors))
+    sample_size = min(len(vectors), k * KMEANS_SAMPLE_PER_LIST)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, k, replace=False)].copy()
+    
+    for _ in range(iterations):
+        labels = assign_lists(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        empty = np.bincount(labels, minlength=k) == 0
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class VectorIndex:
+    """Cosine top-k index over one user's embeddings.
+    
+    The snapshot matrix is memory-mapped copy-on-write, so updates never
+    touch the file; rows added since the snapshot live in an in-memory tail
+    until save() writes a new snapshot. watermark is the highest
+    content_embeddings id applied, and deletions_watermark the highest
+    embedding_deletions id, so callers can catch up incrementally.
+    
+    A snapshot saved with ann=True is sorted into IVF lists (centroids and
+    list offsets are saved alongside). Search with nprobe then scans only
+    the nprobe closest lists plus the tail; without nprobe it stays exact.
+    Methods are not thread-safe; hold lock around them.
+    """
+    
+    def __init__(self, directory: str, name: str, dim: int):
+        """Initialize an empty index stored as directory/name-*.npy."""
+        self.directory = Path(directory)
+        self.name = name
+        self.dim = dim
+        self.watermark = 0
+        self.deletions_watermark = 0
+        self.lock = threading.Lock()
+        self._snapshot = np.zeros((0, dim), dtype=np.float32)
+        self._snapshot_ids = np.zeros(0, dtype=np.int64)
+        self._tail = np.zeros((16, dim), dtype=np.float32)
+        self._tail_ids = np.full(16, -1, dtype=np.int64)
+        self._tail_len = 0
+        # Content item id -> (in tail, row)
+        self._rows: Dict[int, Tuple[bool, int]] = {}
+        # IVF lists: snapshot rows offsets[i]:offsets[i + 1] are closest to centroids[i]
+        self._centroids: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+        self._trained_rows = 0
+    
+    @property
+    def _meta_path(self) -> Path:
+        """Snapshot metadata file naming the current snapshot files."""
+        return self.directory / f'{self.name}.json'
+    
+    @contextmanager
+    def _snapshot_lock(self, exclusive: bool):
+        """flock on directory/name.lock: exclusive while saving, shared while opening.
+        
+        Processes sharing the directory (bot and background parser) then
+        never delete files another process is writing or about to open.
+        """
+        fd = os.open(self.directory / f'{self.name}.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            os.close(fd)
+    
+    @classmethod
+    def load(cls, directory: str, name: str, dim: int) -> 'VectorIndex':
+        """Open the saved snapshot, or an empty index if there is none (or it's unreadable)."""
+        index = cls(directory, name, dim)
+        if not index._meta_path.exists():
+            return index
+        try:
+            # Once mapped, the files stay readable even if a later save deletes them
+            with index._snapshot_lock(exclusive=False):
+                meta = json.loads(index._meta_path.read_text())
+                if meta['dim'] != dim:
+                    return index
+                vectors = np.load(index.directory / meta['vectors'], mmap_mode='c')
+                ids = np.load(index.directory / meta['ids'])
+                centroids = offsets = None
+                if meta.get('centroids'):
+                    centroids = np.load(index.directory / meta['centroids'])
+                    offsets = np.load(index.directory / meta['offsets'])
+            if vectors.shape != (len(ids), dim):
+                raise ValueError(f"snapshot shape {vectors.shape} doesn't match {len(ids)} ids")
+            if centroids is not None and (
+                centroids.shape[1] != dim or len(offsets) != len(centroids) + 1 or offsets[-1] != len(ids)
+            ):
+                raise ValueError("IVF lists don't match the snapshot")
+        except FileNotFoundError:
+            return index
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable vector index snapshot {name}: {e}")
+            return index
+        
+        index._snapshot = vectors
+        index._snapshot_ids = ids.astype(np.int64)
+        index._rows = {int(item_id): (False, row) for row, item_id in enumerate(index._snapshot_ids) if item_id >= 0}
+        index._centroids, index._offsets = centroids, offsets
+        index._trained_rows = meta.get('trained_rows', 0)
+        index.watermark = meta['watermark']
+        index.deletions_watermark = meta.get('deletions_watermark', 0)
+        return index
+    
+    def __len__(self) -> int:
+        """Number of indexed items."""
+        return len(self._rows)
+    
+    def __contains__(self, item_id: int) -> bool:
+        """True when the item has a vector in the index."""
+        return item_id in self._rows
+    
+    @property
+    def tail_size(self) -> int:
+        """Rows added since the snapshot."""
+        return self._tail_len
+    
+    @property
+    def ann(self) -> bool:
+        """True when the snapshot is partitioned into IVF lists."""
+        return self._centroids is not None
+    
+    @property
+    def list_count(self) -> int:
+        """Number of IVF lists (0 without them)."""
+        return 0 if self._centroids is None else len(self._centroids)
+    
+    def needs_compaction(self) -> bool:
+        """True when enough rows were added that a new snapshot is worth writing."""
+        return self._tail_len > max(MIN_COMPACT_ROWS, len(self._snapshot_ids) // 4) or (
+            self._tail_len > 0 and len(self._snapshot_ids) == 0
+        )
+    
+    def upsert(self, item_ids: Iterable[int], vectors: np.ndarray):
+        """Add or replace vectors (rows are normalized to unit length)."""
+        vectors = normalize_rows(vectors)
+        for item_id, vector in zip(item_ids, vectors):
+            item_id = int(item_id)
+            location = self._rows.get(item_id)
+            if location is not None:
+                in_tail, row = location
+                if in_tail or not self.ann:
+                    (self._tail if in_tail else self._snapshot)[row] = vector
+                    continue
+                # A changed vector may belong to another IVF list; move it to the tail
+                self.remove(item_id)
+            if self._tail_len == len(self._tail_ids):
+                self._tail = np.concatenate([self._tail, np.zeros_like(self._tail)])
+                self._tail_ids = np.concatenate([self._tail_ids, np.full(len(self._tail_ids), -1, dtype=np.int64)])
+            self._tail[self._tail_len] = vector
+            self._tail_ids[self._tail_len] = item_id
+            self._rows[item_id] = (True, self._tail_len)
+            self._tail_len += 1
+    
+    def remove(self, item_id: int) -> bool:
+        """Drop an item's vector; False if it wasn't indexed."""
+        location = self._rows.pop(item_id, None)
+        if location is None:
+            return False
+        in_tail, row = location
+        (self._tail if in_tail else self._snapshot)[row] = 0.0
+        (self._tail_ids if in_tail else self._snapshot_ids)[row] = -1
+        return True
+    
+    def vector(self, item_id: int) -> Optional[np.ndarray]:
+        """An item's stored vector, or None."""
+        location = self._rows.get(item_id)
+        if location is None:
+            return None
+        in_tail, row = location
+        return np.array((self._tail if in_tail else self._snapshot)[row])
+    
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        threshold: Optional[float] = None,
+        exclude: Optional[int] = None,
+        nprobe: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """(item id, cosine similarity) of the k most similar items, best first.
+        
+        With IVF lists and nprobe, only the nprobe lists whose centroids are
+        closest to the query are scanned (approximate); otherwise all rows.
+        """
+        query = normalize_rows(np.asarray(query, dtype=np.float32).reshape(1, -1))[0]
+        if self.ann and nprobe is not None and nprobe < self.list_count:
+            probes = top_k(self._centroids @ query, nprobe)
+            ranges = [(self._offsets[probe], self._offsets[probe + 1]) for probe in probes]
+            snapshot_scores = [self._snapshot[start:end] @ query for start, end in ranges]
+            snapshot_ids = [self._snapshot_ids[start:end] for start, end in ranges]
+        else:
+            snapshot_scores, snapshot_ids = [self._snapshot @ query], [self._snapshot_ids]
+        scores = np.concatenate(snapshot_scores + [self._tail[:self._tail_len] @ query])
+        ids = np.concatenate(snapshot_ids + [self._tail_ids[:self._tail_len]])
+        # Removed rows and the excluded item never make the cut
+        scores[ids < 0] = -np.inf
+        if exclude is not None:
+            scores[ids == exclude] = -np.inf
+        if threshold is not None:
+            scores[scores < threshold] = -np.inf
+        
+        results = []
+        for position in top_k(scores, k):
+            if scores[position] == -np.inf:
+                break
+            results.append((int(ids[position]), float(scores[position])))
+        return results
+    
+    def save(self, ann: bool = False):
+        """Write all live rows as a new snapshot and memory-map it.
+        
+        With ann, rows are sorted into IVF lists. Centroids are kept from the
+        previous snapshot (new rows join their nearest list) until the index
+        has doubled since training, then retrained.
+        
+        Files are written under a fresh name and the metadata is replaced
+        atomically, so readers in other processes see either snapshot whole.
+        Saves of the same index from several processes are serialized by
+        the snapshot lock.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tail_ids = self._tail_ids[:self._tail_len]
+        live, tail_live = self._snapshot_ids >= 0, tail_ids >= 0
+        ids = np.concatenate([self._snapshot_ids[live], tail_ids[tail_live]])
+        vectors = np.concatenate([self._snapshot[live], self._tail[:self._tail_len][tail_live]])
+        
+        centroids = offsets = None
+        trained_rows = 0
+        if ann and len(ids):
+            if self.ann and len(ids) <= 2 * self._trained_rows:
+                centroids, trained_rows = self._centroids, self._trained_rows
+                # Snapshot rows keep their lists; only tail rows are assigned
+                snapshot_labels = np.repeat(np.arange(len(centroids)), np.diff(self._offsets))[live]
+                labels = np.concatenate([snapshot_labels, assign_lists(vectors[len(snapshot_labels):], centroids)])
+            else:
+                centroids = spherical_kmeans(vectors, default_list_count(len(ids)))
+                labels = assign_lists(vectors, centroids)
+                trained_rows = len(ids)
+            order = np.argsort(labels, kind='stable')
+            ids, vectors = ids[order], vectors[order]
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=len(centroids)))])
+        
+        token = uuid.uuid4().hex[:12]
+        files = {'vectors': f'{self.name}-{token}.npy', 'ids': f'{self.name}-{token}.ids.npy'}
+        with self._snapshot_lock(exclusive=True):
+            np.save(self.directory / files['vectors'], np.ascontiguousarray(vectors, dtype=np.float32))
+            np.save(self.directory / files['ids'], ids)
+            if centroids is not None:
+                files.update(centroids=f'{self.name}-{token}.centroids.npy', offsets=f'{self.name}-{token}.offsets.npy')
+                np.save(self.directory / files['centroids'], centroids)
+                np.save(self.directory / files['offsets'], offsets)
+            tmp_meta = self.directory / f'{self.name}.json.{token}'
+            tmp_meta.write_text(json.dumps(dict(
+                files, dim=self.dim, count=len(ids), watermark=self.watermark,
+                deletions_watermark=self.deletions_watermark, trained_rows=trained_rows
+            )))
+            os.replace(tmp_meta, self._meta_path)
+            self._snapshot = np.load(self.directory / files['vectors'], mmap_mode='c')
+            
+            # No other save is running and loaders have mapped what they opened, so
+            # every other snapshot file (older, or left by a crashed save) can go
+            for path in self.directory.glob(f'{self.name}-*.npy'):
+                if token not in path.name:
+                    path.unlink(missing_ok=True)
+        
+        self._snapshot_ids = ids
+        self._centroids, self._offsets, self._trained_rows = centroids, offsets, trained_rows
+        self._tail = np.zeros((16, self.dim), dtype=np.float32)
+        self._tail_ids = np.full(16, -1, dtype=np.int64)
+        self._tail_len = 0
+        self._rows = {int(item_id): (False, row) for row, item_id in enumerate(ids)}
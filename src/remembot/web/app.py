@@ -7,6 +7,7 @@ import json
 import logging
 import math
 import os
+from contextlib import asynccontextmanager
 from typing import Optional
 from fastapi import FastAPI, Request, Form, Depends, HTTPException, Query
 from fastapi.responses import HTMLResponse, RedirectResponse
@@ -15,12 +16,20 @@ from starlette.middleware.sessions import SessionMiddleware
 from starlette.templating import Jinja2Templates
 
 # Import RememBot database manager using proper relative imports
-from ..database import DatabaseManager
+from ..config import get_config
+from ..database import DatabaseManager, InvalidCursorError, SEARCH_TOTAL_CAP
+from ..db_pool import StorageProfile
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Close pooled database connections on shutdown."""
+    yield
+    await db_manager.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # Load secret key from environment for security
 session_secret_key = os.environ.get("SESSION_SECRET_KEY", "supersecretkey-change-in-production")
@@ -30,12 +39,29 @@ app.add_middleware(SessionMiddleware, secret_key=session_secret_key)
 app.mount("/static", StaticFiles(directory="src/remembot/web/static"), name="static")
 templates = Jinja2Templates(directory="src/remembot/web/templates")
 
-# Initialize database manager with default path
-database_path = os.environ.get('REMEMBOT_DATABASE_PATH', 'data/remembot.db')
-db_manager = DatabaseManager(database_path)
+# Initialize database manager with the bot's storage settings (defaults without a full config)
+try:
+    config = get_config()
+    database_path = config.database_path
+except Exception as e:
+    logger.warning(f"Could not load config, using default storage settings: {e}")
+    config = None
+    database_path = os.environ.get('REMEMBOT_DATABASE_PATH', 'data/remembot.db')
+db_manager = DatabaseManager(
+    database_path,
+    pool_size=getattr(config, 'db_pool_size', 4),
+    storage_profile=StorageProfile.from_config(config)
+)
 
 @app.get("/", response_class=HTMLResponse)
-async def index(request: Request, page: int = Query(1, ge=1), search: str = Query(""), content_type: str = Query("")):
+async def index(
+    request: Request,
+    page: int = Query(1, ge=1),
+    cursor: str = Query(""),
+    search: str = Query(""),
+    content_type: str = Query(""),
+    exact: bool = Query(False)
+):
     """Main page - show user's content if authenticated, otherwise show login."""
     session = request.session
     telegram_user_id = session.get("telegram_user_id")
@@ -43,27 +69,31 @@ async def index(request: Request, page: int = Query(1, ge=1), search: str = Quer
     if telegram_user_id:
         # Show table of real saved info
         items_per_page = 20
-        offset = (page - 1) * items_per_page
         
         try:
-            if search.strip():
-                # Perform search
+            # Keyset pagination: the cursor points at the edge of the previous page,
+            # so every page costs the same as the first (empty query lists recent items)
+            try:
                 results, total = await db_manager.search_content(
                     user_telegram_id=telegram_user_id,
                     query=search,
                     content_type=content_type if content_type else None,
                     limit=items_per_page,
-                    offset=offset
+                    cursor=cursor or None,
+                    exact_total=exact
                 )
-            else:
-                # Get recent items (use search with empty query to leverage pagination)
+            except InvalidCursorError as e:
+                logger.warning(f"Ignoring invalid page cursor: {e}")
+                page = 1
                 results, total = await db_manager.search_content(
                     user_telegram_id=telegram_user_id,
-                    query="",
+                    query=search,
                     content_type=content_type if content_type else None,
                     limit=items_per_page,
-                    offset=offset
+                    exact_total=exact
                 )
+            if not cursor:
+                page = 1
             
             # Process results for display
             processed_items = []
@@ -104,8 +134,16 @@ async def index(request: Request, page: int = Query(1, ge=1), search: str = Quer
                 
                 processed_items.append(display_item)
             
-            # Calculate pagination
+            # Calculate pagination (inexact search totals past the cap are shown as "1000+")
+            total_capped = bool(search.strip()) and not exact and db_manager.is_total_capped(total)
+            if total_capped:
+                total = SEARCH_TOTAL_CAP
             total_pages = math.ceil(total / items_per_page) if total > 0 else 1
+            has_more = page < total_pages or (total_capped and len(results) == items_per_page)
+            if not total_capped:
+                page = min(page, total_pages)
+            next_cursor = db_manager.page_cursor(results[-1]) if results and has_more else None
+            prev_cursor = db_manager.page_cursor(results[0], 'before') if results and page > 1 else None
             
             # Get user stats
             stats = await db_manager.get_user_stats(telegram_user_id)
@@ -117,6 +155,10 @@ async def index(request: Request, page: int = Query(1, ge=1), search: str = Quer
                 "current_page": page,
                 "total_pages": total_pages,
                 "total_items": total,
+                "total_capped": total_capped,
+                "exact_total": exact,
+                "next_cursor": next_cursor,
+                "prev_cursor": prev_cursor,
                 "search_query": search,
                 "content_type_filter": content_type,
                 "stats": stats
@@ -113,4 +113,225 @@ class TestEmbeddingsManager:
         
         assert isinstance(stats, dict)
         assert 'model_available' in stats
-        assert 'total_embeddings' in stats or 'error' in stats
\ No newline at end of file
+        assert 'total_embeddings' in stats or 'error' in stats    
+    @pytest.mark.asyncio
+    async def test_local_vector_index(self, embeddings_manager):
+        """Test semantic search over the incrementally updated, memory-mapped index."""
+        import sqlite3
+        import numpy as np
+        from remembot.vector_index import VectorIndex
+        
+        def add_item(user_id, text):
+            with sqlite3.connect(embeddings_manager.db_path) as conn:
+                cursor = conn.execute('''
+                    INSERT INTO content_items (user_telegram_id, original_share, content_type, extracted_info)
+                    VALUES (?, ?, ?, ?)
+                ''', (user_id, text, "text", text))
+                return cursor.lastrowid
+        
+        with tempfile.TemporaryDirectory() as index_dir:
+            manager = EmbeddingsManager(embeddings_manager.db_path, index_path=index_dir)
+            python_id = add_item(12345, "Learn Python programming basics with examples")
+            cake_id = add_item(12345, "How to bake a chocolate cake")
+            add_item(99999, "Python programming for other users")
+            assert (await manager.batch_generate_embeddings())['processed'] == 3
+            
+            # Deterministic unit-length float32 vectors
+            first = await manager.generate_embedding("Python programming")
+            assert first.dtype == np.float32 and abs(np.linalg.norm(first) - 1) < 1e-5
+            assert np.array_equal(first, await manager.generate_embedding("python   PROGRAMMING"))
+            
+            results = await manager.semantic_search(12345, "python programming tutorial", similarity_threshold=0.1)
+            assert [r['id'] for r in results] == [python_id]
+            assert results[0]['similarity'] > 0.1
+            
+            # Items finished later join the loaded index incrementally
+            recipe_id = add_item(12345, "Chocolate cake recipe with cocoa and butter")
+            assert await manager.store_embedding(recipe_id, "Chocolate cake recipe with cocoa and butter")
+            similar = await manager.get_similar_content(cake_id, 12345)
+            assert similar[0]['id'] == recipe_id and cake_id not in [r['id'] for r in similar]
+            
+            # A new process maps the saved snapshot and catches up from the table
+            with sqlite3.connect(manager.db_path) as conn:
+                conn.execute('DELETE FROM content_items WHERE id = ?', (python_id,))
+            reloaded = EmbeddingsManager(manager.db_path, index_path=index_dir)
+            index = reloaded._synced_index(12345)
+            assert isinstance(index._snapshot, np.memmap) and len(index) == 3
+            assert await reloaded.semantic_search(12345, "python programming", similarity_threshold=0.1) == []
+            
+            # Top-k from argpartition matches a full sort
+            rng = np.random.default_rng(0)
+            vectors = rng.normal(size=(500, 32)).astype(np.float32)
+            large = VectorIndex(index_dir, 'random', 32)
+            large.upsert(range(500), vectors)
+            query = rng.normal(size=32)
+            scores = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)) @ (query / np.linalg.norm(query))
+            assert [item_id for item_id, _ in large.search(query, 10)] == list(np.argsort(-scores)[:10])
+    
+    def test_concurrent_snapshot_saves(self):
+        """Test that indexes saving the same snapshot concurrently never leave it unreadable."""
+        import threading
+        import numpy as np
+        from remembot.vector_index import VectorIndex, normalize_rows
+        
+        vectors = normalize_rows(np.random.default_rng(2).normal(size=(200, 16)))
+        failures = []
+        
+        with tempfile.TemporaryDirectory() as index_dir:
+            # Two writers (like the bot and the background parser) and a reader
+            def save_repeatedly():
+                index = VectorIndex(index_dir, 'shared', 16)
+                index.upsert(range(200), vectors)
+                for _ in range(20):
+                    index.save()
+                    if index.search(vectors[0], 1)[0][0] != 0:
+                        failures.append('search')
+            
+            def load_repeatedly():
+                for _ in range(60):
+                    loaded = VectorIndex.load(index_dir, 'shared', 16)
+                    if Path(index_dir, 'shared.json').exists() and len(loaded) != 200:
+                        failures.append('load')
+            
+            threads = [threading.Thread(target=target) for target in (save_repeatedly, save_repeatedly, load_repeatedly)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            
+            assert not failures
+            assert len(VectorIndex.load(index_dir, 'shared', 16)) == 200
+            # Only the current snapshot's files are left
+            assert len(list(Path(index_dir).glob('shared-*.npy'))) == 2
+    
+    @pytest.mark.asyncio
+    async def test_approximate_search(self, embeddings_manager):
+        """Test IVF search: persisted lists, incremental updates, recall and the automatic switch."""
+        import sqlite3
+        import numpy as np
+        from remembot.vector_index import VectorIndex, normalize_rows
+        
+        rng = np.random.default_rng(1)
+        centers = normalize_rows(rng.normal(size=(40, 64)))
+        topics = rng.integers(0, 40, 4000)
+        vectors = normalize_rows(centers[topics] + rng.normal(scale=0.1, size=(4000, 64)))
+        
+        with tempfile.TemporaryDirectory() as index_dir:
+            index = VectorIndex(index_dir, 'large', 64)
+            index.upsert(range(4000), vectors)
+            index.save(ann=True)
+            index = VectorIndex.load(index_dir, 'large', 64)
+            assert index.ann and index.list_count == 63
+            
+            queries = normalize_rows(centers[:20] + rng.normal(scale=0.1, size=(20, 64)))
+            recall = np.mean([
+                len({i for i, _ in index.search(q, 10, nprobe=8)} & {i for i, _ in index.search(q, 10)}) / 10
+                for q in queries
+            ])
+            assert recall >= 0.9
+            
+            # Inserts, updates and deletes apply before the next snapshot
+            index.upsert([5000], queries[:1])
+            assert index.search(queries[0], 1, nprobe=1)[0][0] == 5000
+            index.upsert([0], -vectors[:1])
+            assert index.search(-vectors[0], 1, nprobe=1)[0][0] == 0
+            index.remove(5000)
+            assert 5000 not in [i for i, _ in index.search(queries[0], 10, nprobe=8)]
+            index.save(ann=True)
+            assert len(index) == 4000 and index.tail_size == 0
+            assert index.search(-vectors[0], 1, nprobe=1)[0][0] == 0
+            
+            # The manager switches to approximate search once a user's index is large enough
+            manager = EmbeddingsManager(embeddings_manager.db_path, index_path=index_dir)
+            manager.ann_min_items = 3
+            with sqlite3.connect(manager.db_path) as conn:
+                for text in ("Python programming basics", "Chocolate cake recipe", "Gardening in spring"):
+                    conn.execute('''
+                        INSERT INTO content_items (user_telegram_id, original_share, content_type, extracted_info)
+                        VALUES (?, ?, ?, ?)
+                    ''', (777, text, "text", text))
+            await manager.batch_generate_embeddings(777)
+            results = await manager.semantic_search(777, "python programming", similarity_threshold=0.1)
+            assert results[0]['original_share'] == "Python programming basics"
+            assert (await manager.get_embedding_stats())['loaded_indexes'][777]['ann_lists'] > 0
+    
+    @pytest.mark.asyncio
+    async def test_deleted_items_leave_the_index(self):
+        """Test that delete_content removes the item from loaded and reloaded vector indexes."""
+        from remembot.database import DatabaseManager
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = str(Path(tmp_dir) / 'remembot.db')
+            db = DatabaseManager(db_path)
+            manager = EmbeddingsManager(db_path, index_path=str(Path(tmp_dir) / 'vectors'))
+            try:
+                texts = ["Python programming basics", "Python programming tutorial", "Chocolate cake recipe"]
+                ids = [await db.store_content(12345, text, "text") for text in texts]
+                await manager.store_embeddings(list(zip(ids, texts)))
+                index = manager._synced_index(12345)
+                index.save()
+                
+                assert await db.delete_content(12345, ids[0])
+                # The best remaining match fills the page; nothing stale is fetched
+                results = await manager.semantic_search(12345, "python programming basics", limit=1, similarity_threshold=0.1)
+                assert [r['id'] for r in results] == [ids[1]]
+                assert ids[0] not in index and index.deletions_watermark == 1
+                
+                # Another process loading the older snapshot replays the deletion
+                other = EmbeddingsManager(db_path, index_path=str(Path(tmp_dir) / 'vectors'))
+                assert ids[0] not in other._synced_index(12345) and len(other._synced_index(12345)) == 2
+            finally:
+                await db.close()
+    
+    @pytest.mark.asyncio
+    async def test_batch_embedding_pipeline(self, embeddings_manager):
+        """Test chunking, deduplication, provider batching and resuming of batch embedding."""
+        import sqlite3
+        from remembot.embeddings import HashingEmbeddingProvider
+        
+        class RecordingProvider(HashingEmbeddingProvider):
+            batch_size = 4
+            max_tokens = 20
+            
+            def __init__(self):
+                super().__init__(64)
+                self.calls = []
+            
+            async def embed(self, texts):
+                self.calls.append(list(texts))
+                return await super().embed(texts)
+        
+        provider = RecordingProvider()
+        manager = EmbeddingsManager(embeddings_manager.db_path, provider=provider)
+        long_text = ' '.join(f"word{i}" for i in range(60))
+        texts = ["Shared article text"] * 3 + [f"Note number {i}" for i in range(6)] + [long_text, "", None]
+        with sqlite3.connect(manager.db_path) as conn:
+            for text in texts:
+                conn.execute('''
+                    INSERT INTO content_items (user_telegram_id, original_share, content_type, extracted_info)
+                    VALUES (?, ?, ?, ?)
+                ''', (1, "share", "text", text))
+        
+        stats = await manager.batch_generate_embeddings(batch_size=5, max_items=5)
+        assert stats['processed'] == 5 and stats['last_item_id'] == 5
+        stats = await manager.batch_generate_embeddings(batch_size=5, after_id=stats['last_item_id'])
+        assert stats['processed'] == 5 and stats['skipped'] == 2
+        
+        sent = [text for call in provider.calls for text in call]
+        # The shared text is embedded once; the long text is split into chunks under 60 characters
+        assert sent.count("Shared article text") == 1
+        assert all(len(call) <= 4 for call in provider.calls)
+        assert all(len(text) <= 60 for text in sent) and sum(text.startswith('word') for text in sent) > 1
+        
+        # Already embedded items aren't read again; an identical text reuses the stored vector
+        assert (await manager.batch_generate_embeddings())['processed'] == 0
+        with sqlite3.connect(manager.db_path) as conn:
+            item_id = conn.execute('''
+                INSERT INTO content_items (user_telegram_id, original_share, content_type, extracted_info)
+                VALUES (?, ?, ?, ?)
+            ''', (2, "share", "text", "Shared article text")).lastrowid
+        calls = len(provider.calls)
+        assert await manager.store_embeddings([(item_id, "Shared article text")]) == 1
+        assert len(provider.calls) == calls
+        results = await manager.semantic_search(2, "shared article", similarity_threshold=0.1)
+        assert [result['id'] for result in results] == [item_id]
@@ -7,18 +7,49 @@ import pytest_asyncio
 import asyncio
 import tempfile
 import os
+import json
+import sqlite3
+import time
 from pathlib import Path
 
-from remembot.database import DatabaseManager
-from remembot.content_processor import ContentProcessor
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from remembot import database
+from remembot.database import DatabaseManager, InvalidCursorError
+from remembot.content_processor import ContentProcessor, FetchScheduler
+from remembot.extraction import ExtractionEngine, ExtractionTimeout, html_to_text
+from remembot.fetch_cache import FetchCache
+from remembot.parser_wakeup import ParserWakeupListener
+from remembot.ai_client import AIClient
+from remembot.llm_cache import LLMCache
 from remembot.classifier import ContentClassifier
+from remembot.health import HealthChecker
+from remembot.query_handler import QueryHandler
+from remembot.background_parser import BackgroundParser
+
+
+@pytest_asyncio.fixture
+async def serve():
+    """Serve aiohttp apps on local ports: await serve(app) returns the base URL."""
+    servers = []
+    
+    async def start(app: web.Application) -> str:
+        server = TestServer(app, host='127.0.0.1')
+        await server.start_server()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.port}'
+    
+    yield start
+    for server in servers:
+        await server.close()
 
 
 class TestDatabaseManager:
     """Test database operations."""
     
-    @pytest.fixture
-    def db_manager(self):
+    @pytest_asyncio.fixture
+    async def db_manager(self):
         """Create a temporary database for testing."""
         with tempfile.NamedTemporaryFile(delete=False, suffix='.db') as tmp_file:
             db_path = tmp_file.name
@@ -27,6 +58,7 @@ class TestDatabaseManager:
         yield db_manager
         
         # Cleanup
+        await db_manager.close()
         os.unlink(db_path)
     
     @pytest.mark.asyncio
@@ -65,6 +97,326 @@ class TestDatabaseManager:
         # Check stats for user 67890
         stats = await db_manager.get_user_stats(67890)
         assert stats['total_items'] == 1
+    
+    @pytest.mark.asyncio
+    async def test_connection_pool_reuse(self, db_manager):
+        """Test that concurrent calls share a bounded set of pooled connections."""
+        await db_manager.store_content(12345, "pooled", "text", extracted_info="Pooled content")
+        
+        # More concurrent readers than pool slots
+        await asyncio.gather(*[db_manager.get_user_content(12345) for _ in range(20)])
+        
+        stats = db_manager.get_pool_stats()
+        assert stats['readers']['size'] <= 4
+        assert stats['readers']['acquisitions'] == 20
+        assert stats['readers']['in_use'] == 0
+        assert stats['writer']['size'] == 1
+        assert stats['writer']['acquisitions'] >= 1
+        assert await db_manager.ping()
+    
+    @pytest.mark.asyncio
+    async def test_storage_profile(self, db_manager):
+        """Test that the WAL storage profile is applied to pooled connections."""
+        async with db_manager._pool.read() as db:
+            cursor = await db.execute("PRAGMA journal_mode")
+            assert (await cursor.fetchone())[0] == 'wal'
+            cursor = await db.execute("PRAGMA synchronous")
+            assert (await cursor.fetchone())[0] == 1  # NORMAL
+            cursor = await db.execute("PRAGMA busy_timeout")
+            assert (await cursor.fetchone())[0] == db_manager.storage_profile.busy_timeout_ms
+        
+        await db_manager.store_content(12345, "wal", "text")
+        result = await db_manager.checkpoint('TRUNCATE')
+        assert result['busy'] == 0
+        assert db_manager.get_pool_stats()['checkpoints'] == 1
+    
+    @pytest.mark.asyncio
+    async def test_fts_index_sync(self, db_manager):
+        """Test that FTS5 triggers follow inserts, updates and deletes."""
+        assert await db_manager.is_fts5_available()
+        
+        item_id = await db_manager.store_content(
+            12345, "https://example.com/post", "url",
+            metadata=json.dumps({'url': 'https://example.com/post', 'title': 'Gardening Notes'}),
+            extracted_info="Tomatoes need plenty of sunlight",
+            taxonomy=json.dumps({'subjects': ['horticulture', 'plants']})
+        )
+        
+        for query in ("tomatoes", "gardening", "horticulture", "example.com"):
+            results, total = await db_manager.search_content(12345, query)
+            assert total == 1, query
+            assert results[0]['id'] == item_id
+            assert 'rank' in results[0]
+        
+        # Other users never see the item
+        results, total = await db_manager.search_content(67890, "tomatoes")
+        assert total == 0
+        
+        # Updates replace the indexed text
+        await db_manager.update_content(12345, item_id, extracted_info="Cucumbers prefer shade")
+        assert (await db_manager.search_content(12345, "tomatoes"))[1] == 0
+        assert (await db_manager.search_content(12345, "cucumbers"))[1] == 1
+        
+        # Deletes remove it from the index
+        await db_manager.delete_content(12345, item_id)
+        assert (await db_manager.search_content(12345, "cucumbers"))[1] == 0
+    
+    @pytest.mark.asyncio
+    async def test_cursor_pagination(self, db_manager):
+        """Test keyset pagination forwards and backwards for listings and searches."""
+        for i in range(45):
+            await db_manager.store_content(12345, f"item {i}", "text", extracted_info=f"shared topic {i}")
+        
+        expected, total = await db_manager.get_user_content(12345, limit=45)
+        assert total == 45
+        
+        for query in ("", "shared"):
+            pages = []
+            cursor = None
+            while True:
+                results, total = await db_manager.search_content(12345, query, limit=20, cursor=cursor)
+                pages.append(results)
+                if len(results) < 20:
+                    break
+                cursor = db_manager.page_cursor(results[-1])
+            
+            assert [len(page) for page in pages] == [20, 20, 5]
+            walked = [row['id'] for page in pages for row in page]
+            assert len(set(walked)) == 45
+            if not query:
+                assert walked == [row['id'] for row in expected]
+            
+            # Walking back from the last page returns the middle page again
+            before = db_manager.page_cursor(pages[2][0], 'before')
+            results, _ = await db_manager.search_content(12345, query, limit=20, cursor=before)
+            assert [row['id'] for row in results] == [row['id'] for row in pages[1]]
+        
+        with pytest.raises(InvalidCursorError):
+            await db_manager.get_user_content(12345, cursor="not-a-cursor")
+    
+    @pytest.mark.asyncio
+    async def test_content_counts_and_capped_totals(self, db_manager, monkeypatch):
+        """Test trigger-maintained listing totals and capped search totals."""
+        ids = []
+        for i in range(12):
+            content_type = 'url' if i % 3 == 0 else 'text'
+            ids.append(await db_manager.store_content(12345, f"https://example.com/{i} widget", content_type))
+        
+        assert (await db_manager.get_user_content(12345))[1] == 12
+        assert (await db_manager.get_user_content(12345, content_type='url'))[1] == 4
+        
+        await db_manager.delete_content(12345, ids[0])
+        async with db_manager._pool.write() as db:
+            await db.execute("UPDATE content_items SET content_type = 'image' WHERE id = ?", (ids[1],))
+        
+        stats = await db_manager.get_user_stats(12345)
+        assert stats['total_items'] == 11
+        assert stats['items_by_type'] == {'text': 7, 'url': 3, 'image': 1}
+        assert (await db_manager.get_user_content(12345, content_type='url'))[1] == 3
+        
+        # Search totals stop at the cap unless an exact count is requested
+        monkeypatch.setattr(database, 'SEARCH_TOTAL_CAP', 5)
+        results, total = await db_manager.search_content(12345, "widget", limit=3)
+        assert len(results) == 3 and db_manager.is_total_capped(total)
+        results, total = await db_manager.search_content(12345, "widget", limit=3, exact_total=True)
+        assert total == 11 and not db_manager.is_total_capped(3)
+        # Callers that don't show a total (hybrid search) skip counting
+        uncounted, total = await db_manager.search_content(12345, "widget", limit=3, include_total=False)
+        assert total is None and [r['id'] for r in uncounted] == [r['id'] for r in results]
+    
+    @pytest.mark.asyncio
+    async def test_user_stats_rollup_matches_rebuild(self, db_manager):
+        """Test that trigger-maintained statistics equal a from-scratch repair."""
+        ids = [await db_manager.store_content(12345, f"note {i}", "text") for i in range(6)]
+        await db_manager.update_parse_status(ids[0], 'complete', processing_time_ms=100.0)
+        await db_manager.update_parse_status(ids[1], 'complete', processing_time_ms=300.0)
+        await db_manager.update_parse_status(ids[2], 'error', error_message="boom")
+        await db_manager.delete_content(12345, ids[5])
+        await db_manager.search_content(12345, "note")
+        
+        stats = await db_manager.get_user_stats(12345)
+        assert stats['total_items'] == 5
+        assert stats['items_by_status'] == {'pending': 2, 'processing': 0, 'complete': 2, 'error': 1}
+        assert stats['avg_processing_time_ms'] == 200.0
+        assert stats['recent_items'] == 5 and stats['recent_searches'] == 1
+        assert sum(stats['daily_activity'].values()) == 5
+        
+        assert (await db_manager.rebuild_user_stats())['users'] == 1
+        assert await db_manager.get_user_stats(12345) == stats
+    
+    @pytest.mark.asyncio
+    async def test_parse_queue_claims(self, db_manager):
+        """Test atomic claims across managers, lease expiry and requeue on error."""
+        ids = [await db_manager.store_content(12345, f"note {i}", "text") for i in range(10)]
+        other = DatabaseManager(db_manager.db_path)
+        try:
+            claims = await asyncio.gather(
+                db_manager.claim_items('worker-a', limit=6),
+                other.claim_items('worker-b', limit=6)
+            )
+            claimed = [item['id'] for batch in claims for item in batch]
+            assert sorted(claimed) == ids
+        finally:
+            await other.close()
+        
+        a_ids = [item['id'] for item in claims[0]]
+        # A failed item goes back to the queue while attempts remain
+        assert await db_manager.update_parse_status(a_ids[0], 'error', error_message="boom", lease_owner='worker-a')
+        assert [item['id'] for item in await db_manager.claim_items('worker-c', limit=1)] == [a_ids[0]]
+        
+        # Expired leases are reclaimed, and the old owner can no longer finish
+        assert await db_manager.extend_lease(a_ids[1], 'worker-a', lease_seconds=-1)
+        assert await db_manager.reclaim_expired_leases() == 1
+        assert not await db_manager.update_parse_status(a_ids[1], 'complete', lease_owner='worker-a')
+        stats = await db_manager.get_parse_stats()
+        assert stats['pending'] == 1 and stats['expired_leases'] == 0
+        
+        # Only claims put items in 'processing', so every processing row has a lease
+        with pytest.raises(ValueError):
+            await db_manager.update_parse_status(a_ids[1], 'processing')
+    
+    @pytest.mark.asyncio
+    async def test_store_wakes_parser(self, db_manager):
+        """Test that storing a pending item wakes a listening parser."""
+        listener = ParserWakeupListener(db_manager.db_path, 'test-worker')
+        if not listener.start():
+            pytest.skip("Unix sockets not available")
+        try:
+            assert not await listener.wait(0.05)
+            await db_manager.store_content(12345, "wake up", "text")
+            assert await listener.wait(2)
+            # Already-processed items don't wake anyone
+            await db_manager.store_content(12345, "done", "text", parse_status='complete')
+            assert not await listener.wait(0.05)
+        finally:
+            listener.close()
+        assert not listener.path.exists()
+    
+    @pytest.mark.asyncio
+    async def test_duplicate_detection(self, db_manager):
+        """Test stable fingerprints, duplicate linking and near-duplicate lookup."""
+        url_id = await db_manager.store_content(12345, "Read https://www.example.com/post/?utm_source=tg#top", "url")
+        await db_manager.update_parse_status(url_id, 'complete', extracted_info="Example post body")
+        # Same page behind different tracking params is linked, not queued again
+        dup_id = await db_manager.store_content(12345, "https://example.com/post?fbclid=abc", "url")
+        dup = await db_manager.get_content_by_id(12345, dup_id)
+        assert dup['parse_status'] == 'complete' and dup['extracted_info'] == "Example post body"
+        assert [row['id'] for row in await db_manager.find_similar_content(12345, dup['content_hash'])] == [dup_id, url_id]
+        # Fingerprints are scoped per user
+        other_id = await db_manager.store_content(999, "https://example.com/post", "url")
+        assert (await db_manager.get_content_by_id(999, other_id))['parse_status'] == 'pending'
+        
+        notes = (
+            "Notes from the community garden meeting: we agreed to plant tomatoes, beans and squash along the south fence, "
+            "repair the shed roof before winter, order compost in March, and rotate watering duty weekly among members. "
+            "Treasurer reported the seed budget is on track and the rain barrels were donated by the hardware store. "
+            "Volunteers are needed for the spring plant sale, and the children's plot will be expanded next season."
+        )
+        notes_id = await db_manager.store_content(12345, notes, "text")
+        edited_id = await db_manager.store_content(12345, notes.replace("March", "April"), "text")
+        await db_manager.update_parse_status(edited_id, 'complete', extracted_info=notes.replace("March", "April"))
+        matches = await db_manager.find_near_duplicates(12345, notes)
+        assert [match['id'] for match in matches] == [notes_id, edited_id]
+        assert matches[1]['distance'] > 0
+        assert await db_manager.find_near_duplicates(12345, "Unrelated recipe for lemon cake") == []
+        
+        with sqlite3.connect(db_manager.db_path) as conn:
+            relationships = set(conn.execute(
+                "SELECT from_item_id, to_item_id, relationship_type FROM content_relationships"
+            ).fetchall())
+        assert relationships == {(dup_id, url_id, 'duplicate'), (edited_id, notes_id, 'near_duplicate')}
+    
+    @pytest.mark.asyncio
+    async def test_fts_backfill_and_rebuild(self, db_manager):
+        """Test that pre-existing rows are backfilled and the index can be rebuilt."""
+        with sqlite3.connect(db_manager.db_path) as conn:
+            # Simulate a database from before the FTS5 index existed
+            for trigger in ('content_fts_ai', 'content_fts_ad', 'content_fts_au'):
+                conn.execute(f"DROP TRIGGER {trigger}")
+            conn.execute("DROP TABLE content_fts")
+            conn.execute("DELETE FROM system_config WHERE key LIKE 'fts_%'")
+            conn.executemany(
+                "INSERT INTO content_items (user_telegram_id, original_share, content_type, extracted_info) "
+                "VALUES (?, ?, 'text', ?)",
+                [(12345, f"note {i}", f"legacy quantum note {i}") for i in range(25)]
+            )
+        
+        migrated = DatabaseManager(db_manager.db_path)
+        try:
+            results, total = await migrated.search_content(12345, "quantum")
+            assert total == 25
+            status = await migrated.get_fts_status()
+            assert status['backfill_complete']
+            
+            assert await migrated.rebuild_fts_index(batch_size=10) == 25
+            await migrated.optimize_fts_index()
+            assert (await migrated.search_content(12345, "quantum", limit=5))[1] == 25
+        finally:
+            await migrated.close()
+    
+    @pytest.mark.asyncio
+    async def test_expanded_terms_single_query(self, db_manager):
+        """Test that AI-expanded search terms run as one combined, deduplicated query."""
+        python_id = await db_manager.store_content(12345, "note", "text", extracted_info="Python tutorial")
+        both_id = await db_manager.store_content(12345, "note", "text", extracted_info="Baking a Python shaped cake")
+        await db_manager.store_content(12345, "note", "text", extracted_info="Gardening in spring")
+        await db_manager.store_content(999, "note", "text", extracted_info="Python for someone else")
+        
+        query_handler = QueryHandler(db_manager, AIClient(openai_api_key='sk-test'))
+        
+        async def chat(*args, **kwargs):
+            return '["python", "cake", "python"]'
+        query_handler.ai_client.chat = chat
+        
+        async def activity_rows():
+            async with db_manager._pool.read() as db:
+                cursor = await db.execute('SELECT COUNT(*) FROM user_activity')
+                return (await cursor.fetchone())[0]
+        logged = await activity_rows()
+        
+        for fts5 in (True, False):
+            db_manager._fts5_available = fts5
+            results = await query_handler._ai_enhanced_search(12345, "snake language")
+            # Each item once; with LIKE, the item matching both terms ranks first
+            assert sorted(r['id'] for r in results) == [python_id, both_id]
+            if not fts5:
+                assert results[0]['id'] == both_id
+        assert await activity_rows() == logged
+    
+    @pytest.mark.asyncio
+    async def test_hybrid_search(self, db_manager):
+        """Test that keyword and semantic rankings are fused with reciprocal rank fusion."""
+        from remembot.embeddings import EmbeddingsManager
+        from remembot.hybrid_search import reciprocal_rank_fusion
+        
+        ranked = reciprocal_rank_fusion({'a': [{'id': 1}, {'id': 2}], 'b': [{'id': 2}, {'id': 3}]}, k=60)
+        assert [r['id'] for r in ranked] == [2, 1, 3] and ranked[0]['matched_by'] == ['a', 'b']
+        
+        tutorial_id = await db_manager.store_content(12345, "note", "text", extracted_info="Python tutorial for beginners")
+        basics_id = await db_manager.store_content(12345, "note", "text", extracted_info="Python basics")
+        await db_manager.store_content(12345, "note", "text", extracted_info="Chocolate cake recipe")
+        
+        with tempfile.TemporaryDirectory() as index_dir:
+            embeddings = EmbeddingsManager(db_manager.db_path, index_path=index_dir)
+            await embeddings.batch_generate_embeddings(12345)
+            query_handler = QueryHandler(db_manager, AIClient(), embeddings)
+            
+            # Only the tutorial has both words; the semantic ranking adds the basics note
+            results = await query_handler.process_query(12345, "python tutorial")
+            assert [r['id'] for r in results] == [tutorial_id, basics_id]
+            assert results[0]['matched_by'] == ['lexical', 'vector'] and results[1]['matched_by'] == ['vector']
+            
+            # Pages slice the fused ranking, also past a vector-only result
+            pages = [await query_handler.process_query(12345, "python tutorial", offset=offset, limit=1) for offset in range(3)]
+            assert [[r['id'] for r in page] for page in pages] == [[tutorial_id], [basics_id], []]
+            
+            # A failing semantic search leaves the keyword ranking
+            async def failing_search(*args, **kwargs):
+                raise RuntimeError("index unavailable")
+            embeddings.semantic_search = failing_search
+            results = await query_handler.process_query(12345, "python tutorial")
+            assert [r['id'] for r in results] == [tutorial_id]
+            assert query_handler.hybrid.get_stats()['vector_errors'] == 1
 
 
 class TestContentProcessor:
@@ -102,6 +454,204 @@ class TestContentProcessor:
         assert processor._is_url("http://test.org") == True
         assert processor._is_url("not a url") == False
         assert processor._is_url("example.com") == False
+    
+    @pytest.mark.asyncio
+    async def test_url_fetch_cache(self, serve):
+        """Test fresh hits, conditional revalidation and tracking-param canonicalization."""
+        requests_seen = []
+        
+        async def page(request):
+            requests_seen.append((request.path, request.headers.get('If-None-Match')))
+            if request.path == '/news' and request.headers.get('If-None-Match') == '"v1"':
+                return web.Response(status=304, headers={'ETag': '"v1"'})
+            headers = {'ETag': '"v1"'}
+            if request.path == '/news':
+                headers['Cache-Control'] = 'max-age=0'
+            html = f"<html><head><title>{request.path}</title></head><body><p>Body of {request.path}</p></body></html>"
+            return web.Response(text=html, content_type='text/html', headers=headers)
+        
+        app = web.Application()
+        app.router.add_get('/{name}', page)
+        base_url = await serve(app)
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            processor = ContentProcessor(url_cache=FetchCache(str(Path(tmp_dir) / 'url_cache.db')))
+            processor.extraction.max_workers = 0
+            try:
+                first = await processor.process_text(f"{base_url}/article?utm_source=tg")
+                assert "Body of /article" in first['extracted_info'] and 'cache' not in first['metadata']
+                again = await processor.process_text(f"{base_url}/article")
+                assert again['metadata']['cache'] == 'hit'
+                assert again['extracted_info'] == first['extracted_info']
+                assert len(requests_seen) == 1
+                
+                # max-age=0: every use revalidates, and a 304 reuses the cached result
+                await processor.process_text(f"{base_url}/news")
+                revalidated = await processor.process_text(f"{base_url}/news")
+                assert revalidated['metadata']['cache'] == 'revalidated'
+                assert "Body of /news" in revalidated['extracted_info']
+                assert requests_seen[-1] == ('/news', '"v1"')
+                
+                stats = await processor.url_cache.get_stats()
+                assert stats['entries'] == 2 and stats['hits'] == 1 and stats['revalidated'] == 1
+            finally:
+                await processor.close()
+    
+    @pytest.mark.asyncio
+    async def test_streaming_page_download(self, serve):
+        """Test that page downloads stop early, respect the byte cap and sniff the charset."""
+        
+        async def page(request):
+            if request.path == '/long':
+                body = b'<html><head><title>Long</title></head><body>' + b'<p>Lots of article text here.</p>' * 200000
+                return web.Response(body=body, content_type='text/html')
+            if request.path == '/scripts':
+                body = b'<html><body><script>' + b'x();' * 100000 + b'</script><p>Late text</p></body></html>'
+                return web.Response(body=body, content_type='text/html')
+            if request.path == '/latin':
+                html = '<html><head><meta charset="iso-8859-1"><title>Caf\xe9</title></head><body><p>Cr\xe8me br\xfbl\xe9e</p></body></html>'
+                return web.Response(body=html.encode('latin-1'), headers={'Content-Type': 'text/html'})
+            return web.Response(body=b'%PDF-1.4', content_type='application/pdf')
+        
+        app = web.Application()
+        app.router.add_get('/{name}', page)
+        base_url = await serve(app)
+        
+        processor = ContentProcessor()
+        processor.max_text_chars = 500
+        processor.max_download_bytes = 128 * 1024
+        try:
+            long_page = await processor.process_text(f"{base_url}/long")
+            assert long_page['metadata']['title'] == 'Long'
+            assert long_page['extracted_info'].endswith('... [truncated]')
+            assert long_page['metadata']['bytes_read'] < 128 * 1024
+            assert not long_page['metadata']['download_truncated']
+            
+            scripts = await processor.process_text(f"{base_url}/scripts")
+            assert scripts['metadata']['error'] == 'No extractable text content found'
+            
+            latin = await processor.process_text(f"{base_url}/latin")
+            assert latin['metadata']['title'] == 'Caf\xe9'
+            assert 'Cr\xe8me br\xfbl\xe9e' in latin['extracted_info']
+            
+            pdf = await processor.process_text(f"{base_url}/file")
+            assert pdf['metadata']['error'] == 'Unsupported content type: application/pdf'
+            
+            # Whole-page extractors read the same capped body
+            processor.url_extractor = 'readability'
+            processor.extraction.max_workers = 0
+            capped = await processor.process_text(f"{base_url}/long")
+            assert capped['metadata']['download_truncated'] and capped['metadata']['bytes_read'] == 128 * 1024
+            assert capped['extracted_info'].endswith('... [truncated]')
+        finally:
+            await processor.close()
+    
+    def test_readability_extraction(self):
+        """Test main-content extraction against the saved page corpus."""
+        fixtures = Path(__file__).parent / 'fixtures' / 'html'
+        for html_path in sorted(fixtures.glob('*.html')):
+            expected = html_path.with_suffix('.txt').read_text(encoding='utf-8').split()
+            for parser in ('lxml', 'html.parser'):
+                title, text = html_to_text(html_path.read_text(encoding='utf-8'), True, parser)
+                words = text.split()
+                assert title != "No title"
+                # Every content word kept, almost nothing else
+                assert not set(expected) - set(words), html_path.name
+                assert len(words) <= len(expected) * 1.1, html_path.name
+        
+        _, text = html_to_text((fixtures / 'news_article.html').read_text(encoding='utf-8'), True)
+        for boilerplate in ('cookies', 'Related stories', 'newsletter', 'About time!', 'All rights reserved'):
+            assert boilerplate not in text
+    
+    @pytest.mark.asyncio
+    async def test_fetch_scheduler(self, serve):
+        """Test priority order, per-host rate limits, Retry-After and the circuit breaker."""
+        scheduler = FetchScheduler(max_concurrency=1, host_rate=10.0, host_burst=1)
+        order = []
+        
+        async def fetch(url, priority):
+            async with scheduler.slot(url, priority):
+                order.append(url)
+        
+        first_request = time.monotonic()
+        async with scheduler.slot('http://a.example/'):
+            tasks = [asyncio.create_task(fetch(f'http://{name}.example/', priority)) for name, priority in (('low', 5), ('high', 1), ('mid', 3))]
+            await asyncio.sleep(0.05)
+            assert not order and scheduler.get_stats()['waiting'] == 3
+        await asyncio.gather(*tasks)
+        assert order == ['http://high.example/', 'http://mid.example/', 'http://low.example/']
+        
+        # One token per host: the second request to a host waits for a refill (0.1s after the first)
+        await fetch('http://a.example/', 0)
+        assert time.monotonic() - first_request >= 0.09
+        
+        # Without Retry-After, consecutive throttling doubles the delay until a success resets it
+        assert [scheduler.record('http://t.example/', 429) for _ in range(3)] == [2.0, 4.0, 8.0]
+        scheduler.record('http://t.example/', 200)
+        assert scheduler.record('http://t.example/', 503) == 2.0
+        
+        requests_seen = []
+        
+        async def page(request):
+            requests_seen.append(request.path)
+            if request.path == '/busy' and requests_seen.count('/busy') == 1:
+                return web.Response(status=429, headers={'Retry-After': '1'})
+            if request.path == '/throttled':
+                return web.Response(status=429, headers={'Retry-After': '0'})
+            if request.path == '/down':
+                return web.Response(status=500)
+            return web.Response(text=f"<html><body><p>Body of {request.path}</p></body></html>", content_type='text/html')
+        
+        app = web.Application()
+        app.router.add_get('/{name}', page)
+        base_url = await serve(app)
+        
+        processor = ContentProcessor()
+        processor.extraction.max_workers = 0
+        processor.scheduler = FetchScheduler(host_rate=100.0, breaker_threshold=2, breaker_cooldown=60)
+        try:
+            started = time.monotonic()
+            result = await processor.process_text(f"{base_url}/busy")
+            assert "Body of /busy" in result['extracted_info']
+            assert requests_seen == ['/busy', '/busy'] and time.monotonic() - started >= 0.9
+            assert processor.scheduler.stats['throttled'] == 1
+            
+            # Still throttled after every retry: no enhanced-extraction requests follow
+            result = await processor.process_text(f"{base_url}/throttled")
+            assert result['metadata']['error_type'] == 'RetryableFetchError'
+            assert requests_seen.count('/throttled') == processor.config.max_retries
+            
+            # Two server errors open the breaker; later fetches fail without a request
+            for _ in range(2):
+                await processor.process_text(f"{base_url}/down")
+            assert processor.scheduler.get_stats()['open_breakers'] == ['127.0.0.1']
+            seen = len(requests_seen)
+            skipped = await processor.process_text(f"{base_url}/other")
+            assert skipped['metadata']['error_type'] == 'HostUnavailable'
+            assert len(requests_seen) == seen
+        finally:
+            await processor.close()
+    
+    @pytest.mark.asyncio
+    async def test_extraction_pool(self):
+        """Test extraction in worker processes, including timeouts."""
+        engine = ExtractionEngine(max_workers=1, job_timeout=30)
+        try:
+            html = "<html><head><title>Pool</title><script>x()</script></head><body><p>Hello worker</p></body></html>"
+            title, text = await engine.run(html_to_text, html)
+            assert title == "Pool"
+            assert "Hello worker" in text and "x()" not in text
+            
+            with pytest.raises(ExtractionTimeout):
+                await engine.run(time.sleep, 10, timeout=0.5)
+            assert engine.get_stats()['timeouts'] == 1
+            assert engine.get_stats()['pool_running'] is False
+            
+            # A fresh pool replaces the killed one
+            title, _ = await engine.run(html_to_text, html)
+            assert title == "Pool"
+        finally:
+            engine.close()
 
 
 class TestContentClassifier:
@@ -130,7 +680,390 @@ class TestContentClassifier:
         assert result['dewey_decimal'] in ["000", "800"]  # Could be general knowledge or literature
         # AI classification typically has higher confidence than keyword matching
         assert 0.0 <= result['confidence'] <= 1.0
+    
+    
+    
+    @pytest.mark.asyncio
+    async def test_shared_ai_client(self, serve):
+        """Test that components share one pooled AI client with per-provider limits."""
+        connections = set()
+        in_flight = {'now': 0, 'max': 0}
+        
+        async def chat(request):
+            connections.add(request.transport.get_extra_info('peername'))
+            in_flight['now'] += 1
+            in_flight['max'] = max(in_flight['max'], in_flight['now'])
+            await asyncio.sleep(0.05)
+            in_flight['now'] -= 1
+            body = await request.json()
+            reply = '{"dewey_decimal": "004", "subjects": ["programming"], "confidence": 0.9}'
+            if 'summarizes' in body['messages'][0]['content']:
+                reply = 'A summary'
+            return web.json_response({'choices': [{'message': {'content': reply}}]})
+        
+        async def models(request):
+            return web.json_response({'data': []})
+        
+        app = web.Application()
+        app.router.add_post('/chat/completions', chat)
+        app.router.add_get('/models', models)
+        base_url = await serve(app)
+        
+        ai_client = AIClient(
+            openrouter_api_key='sk-test', concurrency={'openrouter': 2},
+            openrouter_url=f'{base_url}'
+        )
+        db_manager = DatabaseManager(':memory:')
+        try:
+            classifier = ContentClassifier(ai_client)
+            for _ in range(3):
+                result = await classifier.classify_content("Python programming tutorial")
+                assert result['classification_method'] == 'openrouter_ai'
+            # Keep-alive: sequential calls reuse one connection
+            assert len(connections) == 1
+            
+            results = await asyncio.gather(*(classifier.classify_content(f"text {i}") for i in range(6)))
+            assert all(r['dewey_decimal'] == '004' for r in results)
+            assert in_flight['max'] == 2
+            
+            query_handler = QueryHandler(db_manager, ai_client)
+            summary = await query_handler.summarize_results(
+                [{'content_type': 'text', 'extracted_info': 'notes', 'created_at': 'now'}], 'notes'
+            )
+            assert summary == 'A summary'
+            
+            health = await HealthChecker(db_manager, ai_client)._probe_ai_service(ai_client)
+            assert health['status'] == 'healthy' and health['service'] == 'openrouter'
+            
+            # Components given a client leave closing it to its owner
+            await classifier.close()
+            await query_handler.close()
+            assert ai_client.get_stats()['connected']
+            assert ai_client.get_stats()['openrouter']['requests'] == 10
+        finally:
+            await ai_client.close()
+            await db_manager.close()
+    
+    @pytest.mark.asyncio
+    async def test_llm_response_cache(self, serve):
+        """Test that identical AI requests are answered from the response cache."""
+        calls = []
+        
+        async def chat(request):
+            body = await request.json()
+            calls.append(body['messages'][-1]['content'])
+            reply = 'not json' if 'garbled' in calls[-1] else '{"dewey_decimal": "004", "subjects": ["python"], "confidence": 0.9}'
+            return web.json_response({'choices': [{'message': {'content': reply}}]})
+        
+        app = web.Application()
+        app.router.add_post('/chat/completions', chat)
+        base_url = await serve(app)
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = LLMCache(str(Path(tmp_dir) / 'llm_cache.db'), max_entries=2)
+            ai_client = AIClient(openrouter_api_key='sk-test', openrouter_url=f'{base_url}', cache=cache)
+            db_manager = DatabaseManager(str(Path(tmp_dir) / 'test.db'))
+            try:
+                classifier = ContentClassifier(ai_client)
+                first = await classifier.classify_content("Python   programming tutorial")
+                # Same input up to whitespace: served from the cache, also concurrently
+                repeats = await asyncio.gather(*(classifier.classify_content("Python programming tutorial") for _ in range(3)))
+                assert len(calls) == 1
+                assert all(r['dewey_decimal'] == first['dewey_decimal'] == '004' for r in repeats)
+                assert cache.stats['hits'] == 3
+                
+                await classifier.classify_content("Python programming tutorial", bypass_cache=True)
+                assert len(calls) == 2 and cache.stats['bypassed'] == 1
+                
+                # Search summaries are cached and can be refreshed the same way
+                query_handler = QueryHandler(db_manager, ai_client)
+                items = [{'content_type': 'text', 'extracted_info': 'notes', 'created_at': 'now'}]
+                for _ in range(2):
+                    await query_handler.summarize_results(items, 'notes')
+                assert len(calls) == 3
+                await query_handler.summarize_results(items, 'notes', bypass_cache=True)
+                assert len(calls) == 4 and cache.stats['bypassed'] == 2
+                
+                # Unparseable replies fall back and are not cached
+                for _ in range(2):
+                    result = await classifier.classify_content("garbled")
+                    assert result['classification_method'] != 'openrouter_ai'
+                assert len(calls) == 6
+                
+                # Expired entries are refetched; the LRU limit holds
+                cache.ttl_seconds = 0
+                await classifier.classify_content("Gardening tips")
+                await classifier.classify_content("Gardening tips")
+                assert len(calls) == 8 and cache.stats['expired'] == 1
+                stats = await cache.get_stats()
+                assert stats['entries'] <= 2
+                assert ai_client.get_stats()['llm_cache']['stores'] == stats['stores']
+                # Trigger-kept totals match the table through replaces, expiry and eviction
+                scanned = await cache._run(
+                    lambda conn: conn.execute('SELECT COUNT(*), SUM(size_bytes) FROM llm_cache').fetchone()
+                )
+                assert (stats['entries'], stats['bytes']) == tuple(scanned)
+            finally:
+                await ai_client.close()
+                await db_manager.close()
+    
+    @pytest.mark.asyncio
+    async def test_batch_classification(self, serve):
+        """Test that several items are classified with one request, cached per item, with fallbacks."""
+        prompts = []
+        
+        async def chat(request):
+            body = await request.json()
+            prompts.append(body['messages'][-1]['content'])
+            if 'garbled' in prompts[-1]:
+                reply = 'Sorry, I cannot help with that'
+            elif 'Item 1:' not in prompts[-1]:
+                reply = json.dumps({'dewey_decimal': '005', 'subjects': ['python'], 'confidence': 0.8})
+            else:
+                # Out of order, one item unusable and one missing
+                reply = json.dumps([
+                    {'item': 2, 'dewey_decimal': '641', 'subjects': ['cooking'], 'confidence': 0.9},
+                    {'item': 1, 'subjects': []},
+                ])
+            return web.json_response({'choices': [{'message': {'content': reply}}]})
+        
+        app = web.Application()
+        app.router.add_post('/chat/completions', chat)
+        base_url = await serve(app)
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = LLMCache(str(Path(tmp_dir) / 'llm_cache.db'))
+            ai_client = AIClient(openrouter_api_key='sk-test', openrouter_url=f'{base_url}', cache=cache)
+            try:
+                classifier = ContentClassifier(ai_client)
+                assert (await classifier.classify_content("Python programming tutorial"))['dewey_decimal'] == '005'
+                assert len(prompts) == 1
+                
+                # The item classified above is served from its cache entry; only the misses are sent
+                results = await classifier.classify_batch(
+                    ["Python programming tutorial", "Stock market investing", "", "Bread recipe", "Garden notes"]
+                )
+                assert len(prompts) == 2
+                assert 'Python programming' not in prompts[1]
+                assert 'Item 3:' in prompts[1] and 'Item 4:' not in prompts[1]
+                assert results[0]['dewey_decimal'] == '005' and results[0]['classification_method'] == 'openrouter_ai'
+                assert results[1]['classification_method'] == 'enhanced_keyword_matching'
+                assert results[2]['classification_method'] == 'none'
+                assert results[3]['dewey_decimal'] == '641' and 'item' not in results[3]
+                assert results[4]['classification_method'] == 'enhanced_keyword_matching'
+                
+                # Each batch result is cached under the single-item key
+                single = await classifier.classify_content("Bread recipe")
+                assert len(prompts) == 2 and single['dewey_decimal'] == '641'
+                
+                # An unparseable reply falls through to the next provider
+                openai_prompts = []
+                chat_via = ai_client.chat
+                
+                async def chat_with_openai(provider, messages, **kwargs):
+                    if provider != 'openai':
+                        return await chat_via(provider, messages, **kwargs)
+                    openai_prompts.append(messages[-1]['content'])
+                    return json.dumps([{'item': 1, 'dewey_decimal': '800', 'subjects': ['text']}])
+                
+                ai_client.chat = chat_with_openai
+                ai_client.has = lambda provider: True
+                results = await classifier.classify_batch(["garbled one", "garbled two"])
+                assert len(prompts) == 3 and len(openai_prompts) == 1
+                assert [r['classification_method'] for r in results] == ['ai', 'enhanced_keyword_matching']
+            finally:
+                await ai_client.close()
+
 
+class TestBackgroundParser:
+    """Test the background parsing pipeline."""
+    
+    @pytest_asyncio.fixture
+    async def parser(self):
+        """Create a parser on a temporary database."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            parser = BackgroundParser(str(Path(tmp_dir) / 'parser.db'))
+            yield parser
+            await parser.db_manager.close()
+    
+    @pytest.mark.asyncio
+    async def test_slow_item_does_not_block_pipeline(self, parser):
+        """Test that fast items complete while a slow item holds one fetch worker."""
+        release = asyncio.Event()
+        process_text = parser._process_text
+        
+        async def slow_process_text(text):
+            if text == "slow item":
+                await release.wait()
+            return await process_text(text)
+        
+        parser._process_text = slow_process_text
+        db = parser.db_manager
+        slow_id = await db.store_content(1, "slow item", "text")
+        fast_ids = [await db.store_content(1, f"fast item {i}", "text") for i in range(5)]
+        
+        task = asyncio.create_task(parser.start())
+        try:
+            for _ in range(200):
+                stats = await db.get_parse_stats()
+                if stats['complete'] == len(fast_ids):
+                    break
+                await asyncio.sleep(0.02)
+            assert stats['complete'] == len(fast_ids) and stats['processing'] == 1
+            status = await parser.get_status()
+            assert status['pipeline']['persist']['done'] == len(fast_ids)
+        finally:
+            # Shutdown drains the in-flight slow item
+            release.set()
+            parser.running = False
+            parser.wakeup.wake()
+            await asyncio.wait_for(task, 5)
+        
+        with sqlite3.connect(parser.db_path) as conn:
+            rows = dict(conn.execute("SELECT id, parse_status FROM content_items").fetchall())
+        assert rows[slow_id] == 'complete' and set(rows.values()) == {'complete'}
+    
+    @pytest.mark.asyncio
+    async def test_classification_micro_batches(self, parser):
+        """Test that the classify stage classifies items in micro-batches."""
+        batches = []
+        classify_batch = parser.classifier.classify_batch
+        
+        async def recording_classify_batch(contents):
+            batches.append(len(contents))
+            return await classify_batch(contents)
+        
+        parser.classifier.classify_batch = recording_classify_batch
+        db = parser.db_manager
+        item_ids = [await db.store_content(1, f"Python programming note {i}", "text") for i in range(6)]
+        
+        task = asyncio.create_task(parser.start())
+        try:
+            for _ in range(200):
+                stats = await db.get_parse_stats()
+                if stats['complete'] == len(item_ids):
+                    break
+                await asyncio.sleep(0.02)
+            status = await parser.get_status()
+        finally:
+            parser.running = False
+            parser.wakeup.wake()
+            await asyncio.wait_for(task, 5)
+        
+        assert stats['complete'] == len(item_ids)
+        assert sum(batches) == len(item_ids) and max(batches) > 1
+        assert status['pipeline']['classify']['batches'] == len(batches)
+        
+        with sqlite3.connect(parser.db_path) as conn:
+            taxonomies = [json.loads(row[0]) for row in conn.execute("SELECT taxonomy FROM content_items")]
+            embedded = conn.execute("SELECT COUNT(*) FROM content_embeddings").fetchone()[0]
+        assert all(t['dewey_decimal'] for t in taxonomies)
+        # Persisted items are embedded in batches after shutdown drains the pipeline
+        assert embedded == len(item_ids) and parser.stage_stats['embed']['batches'] < len(item_ids)
+    
+    @pytest.mark.asyncio
+    async def test_lease_renewed_in_later_stages(self, parser):
+        """Test that an item held up after the fetch stage keeps its lease."""
+        release = asyncio.Event()
+        classify_batch = parser.classifier.classify_batch
+        
+        async def slow_classify_batch(contents):
+            await release.wait()
+            return await classify_batch(contents)
+        
+        parser.classifier.classify_batch = slow_classify_batch
+        parser.config.max_processing_time = 0.3
+        db = parser.db_manager
+        item_id = await db.store_content(1, "Python programming note", "text")
+        
+        task = asyncio.create_task(parser.start())
+        try:
+            # Outlive several lease periods while waiting in the classify stage
+            await asyncio.sleep(1.0)
+            assert await db.reclaim_expired_leases() == 0
+        finally:
+            release.set()
+            parser.running = False
+            parser.wakeup.wake()
+            await asyncio.wait_for(task, 5)
+        
+        with sqlite3.connect(parser.db_path) as conn:
+            status, attempts = conn.execute(
+                "SELECT parse_status, parse_attempts FROM content_items WHERE id = ?", (item_id,)
+            ).fetchone()
+        assert status == 'complete' and attempts == 0 and not parser._leased
+    
+    @pytest.mark.asyncio
+    async def test_document_extracted_from_blob(self, parser):
+        """Test that documents are extracted from the blob store in the background."""
+        sha256 = parser.blob_store.add_bytes(b"Quarterly budget notes for the garden project")
+        db = parser.db_manager
+        doc_id = await db.store_content(
+            1, "Document: notes.txt", "document",
+            metadata=json.dumps({'file_name': 'notes.txt', 'blob_sha256': sha256})
+        )
+        missing_id = await db.store_content(
+            1, "Document: lost.txt", "document", metadata=json.dumps({'file_name': 'lost.txt'})
+        )
+        
+        
+        def read_rows():
+            with sqlite3.connect(parser.db_path) as conn:
+                return {row[0]: row[1:] for row in conn.execute(
+                    "SELECT id, parse_status, extracted_info, metadata, parse_error FROM content_items"
+                )}
+        
+        task = asyncio.create_task(parser.start())
+        try:
+            for _ in range(500):
+                rows = read_rows()
+                if rows[doc_id][0] == 'complete' and rows[missing_id][3]:
+                    break
+                await asyncio.sleep(0.02)
+        finally:
+            parser.running = False
+            parser.wakeup.wake()
+            await asyncio.wait_for(task, 10)
+        
+        rows = read_rows()
+        status, extracted_info, metadata, _ = rows[doc_id]
+        assert status == 'complete'
+        assert "Quarterly budget notes" in extracted_info
+        assert json.loads(metadata)['blob_sha256'] == sha256
+        # Failed items go back to the queue for another attempt
+        assert rows[missing_id][0] in ('pending', 'error') and "no stored file" in rows[missing_id][3]
+    
+    @pytest.mark.asyncio
+    async def test_blob_dedup_cache_and_gc(self, parser):
+        """Test that shared blobs are extracted once, refcounted and collected."""
+        db = parser.db_manager
+        sha256 = parser.blob_store.add_bytes(b"Minutes of the allotment committee")
+        items = []
+        for name in ('minutes.txt', 'forwarded.txt'):
+            metadata = json.dumps({'file_name': name, 'blob_sha256': sha256})
+            item_id = await db.store_content(1, f"Document: {name}", "document", metadata=metadata)
+            items.append({'id': item_id, 'original_share': f"Document: {name}", 'metadata': metadata})
+        
+        first = await parser._process_document(items[0])
+        second = await parser._process_document(items[1])
+        assert first['extracted_info'] == second['extracted_info']
+        assert 'extraction_cached' not in first['metadata']
+        assert second['metadata']['extraction_cached'] is True
+        assert second['metadata']['file_name'] == 'forwarded.txt'
+        
+        usage = await db.get_blob_usage()
+        assert usage['blobs'] == 1 and usage['unreferenced'] == 0 and usage['cached_extractions'] == 1
+        
+        # Referenced blobs survive collection; unreferenced ones go after the grace period
+        assert (await parser.blob_store.collect_garbage(db, grace_seconds=0))['blobs'] == 0
+        for item in items:
+            await db.delete_content(1, item['id'])
+        assert (await db.get_blob_usage())['unreferenced'] == 1
+        assert (await parser.blob_store.collect_garbage(db))['blobs'] == 0
+        removed = await parser.blob_store.collect_garbage(db, grace_seconds=0)
+        assert removed['blobs'] == 1
+        assert not parser.blob_store.has(sha256)
+        assert (await db.get_blob_usage())['cached_extractions'] == 0
 
 if __name__ == "__main__":
     pytest.main([__file__])
\ No newline at end of file